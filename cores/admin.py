@@ -1,21 +1,37 @@
 from django.contrib import admin
 from cores.models import (
     CustomUser,
+    Author,
     Book,
+    Category,
     Discussion,
     Comment,
     UserFavoriteBook,
     UserLikedCategories,
     UserProfile,
-    UserLikedAuthors
+    UserLikedAuthors,
+    RecommendationSnapshot,
+    BookFacet,
+    FacetValue
 )
 
 
+class BookAdmin(admin.ModelAdmin):
+    # Связи с категориями и авторами строит Book.save() по строковым полям. Форма не должна их
+    # редактировать: save_m2m() после save() вернул бы в них старые значения
+    readonly_fields = ('normalized_categories', 'normalized_authors')
+
+
 admin.site.register(CustomUser)
-admin.site.register(Book)
+admin.site.register(Author)
+admin.site.register(Book, BookAdmin)
+admin.site.register(Category)
 admin.site.register(Discussion)
 admin.site.register(Comment)
 admin.site.register(UserFavoriteBook)
 admin.site.register(UserLikedCategories)
 admin.site.register(UserProfile)
 admin.site.register(UserLikedAuthors)
+admin.site.register(RecommendationSnapshot)
+admin.site.register(BookFacet)
+admin.site.register(FacetValue)
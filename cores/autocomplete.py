@@ -0,0 +1,424 @@
+import heapq
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from itertools import islice
+
+from .models import Book, split_authors, split_categories
+from .refreshing import BackgroundRefresh
+
+
+_WORD_START_RE = re.compile(r'(?:^|(?<=[\s\-\(\[\"\'.,;:/]))\w', re.UNICODE)
+_SPACES_RE = re.compile(r'\s+')
+
+
+def normalize(text):
+    """
+    Приводит строку к виду, по которому идет поиск: нижний регистр, одиночные пробелы
+    """
+    return _SPACES_RE.sub(' ', text).strip().casefold() if text else ''
+
+
+# Хвосты строки берутся только с первых MAX_WORD_KEYS слов и обрезаются до KEY_LENGTH символов:
+# иначе длинное название дает число символов в индексе, квадратичное по числу слов.
+# Запросы длиннее KEY_LENGTH ищутся по обрезанному префиксу и сверяются с исходными строками
+MAX_WORD_KEYS = 8
+KEY_LENGTH = 32
+_LAST_CHAR = chr(0x10FFFF)
+
+
+def _suffixes(text):
+    if not text:
+        return set()
+    return {text[match.start():] for match in islice(_WORD_START_RE.finditer(text), MAX_WORD_KEYS)} | {text}
+
+
+def index_keys(text):
+    """
+    Ключи индекса для строки: сама строка и ее хвосты с начала слов,
+    чтобы "rowl" находил "J. K. Rowling"
+    """
+    return {key[:KEY_LENGTH] for key in _suffixes(normalize(text))}
+
+
+# Префиксы до SHORT_PREFIX символов совпадают с большой частью индекса, поэтому для них
+# лучшие TOP_SIZE элементов хранятся заранее и поддерживаются при изменениях.
+# Из этого списка отвечают запросы с limit до TOP_SERVED, запас нужен, чтобы удаления
+# не опустошали список и не требовали полного пересчета
+SHORT_PREFIX = 2
+TOP_SIZE = 100
+TOP_SERVED = 50
+# Сколько результатов длинных префиксов хранится в кэше
+CACHE_SIZE = 1024
+
+
+def short_prefixes(keys):
+    return {key[:length] for key in keys for length in range(1, SHORT_PREFIX + 1) if len(key) >= length}
+
+
+class PrefixIndex:
+    """
+    Отсортированный массив ключей с поиском по префиксу через bisect.
+    Короткие префиксы отвечаются из предрасчитанного топа, длинные — просмотром совпадений.
+    Ключи элемента не хранятся, а вычисляются заново из его строк (_texts), когда нужны
+    """
+
+    def __init__(self):
+        # Защищает структуры индекса; длинные префиксы ранжируются уже без нее
+        self._lock = threading.RLock()
+        self._keys = []
+        self._texts = {}
+        self._payloads = {}
+        # Ключ сортировки (-ранг, подпись, элемент) хранится один на элемент: на него же ссылаются все топы
+        self._sort_keys = {}
+        self._cache = {}
+        # Короткий префикс -> отсортированный список (ключ сортировки, item) лучших элементов
+        self._top = {}
+        # Короткий префикс -> число элементов с таким префиксом
+        self._counts = {}
+        # Префиксы, чей топ после удалений стал короче нужного и будет пересчитан при запросе
+        self._dirty = set()
+        # Растет при каждом изменении: результат, посчитанный во время изменения, не кэшируется
+        self._generation = 0
+
+    def __len__(self):
+        return len(self._payloads)
+
+    def __contains__(self, item):
+        return item in self._payloads
+
+    def _sort_key(self, item):
+        return self._sort_keys[item]
+
+    def _rank(self, item):
+        return -self._sort_keys[item][0]
+
+    def _item_keys(self, item):
+        keys = set()
+        for text in self._texts[item]:
+            keys |= index_keys(text)
+        return keys
+
+    def _matches_texts(self, item, prefix):
+        return any(key.startswith(prefix) for text in self._texts[item] for key in _suffixes(normalize(text)))
+
+    def add(self, item, texts, payload, rank):
+        with self._lock:
+            self.remove(item)
+            self._texts[item] = tuple(texts)
+            self._payloads[item] = payload
+            self._sort_keys[item] = (-(rank or 0), normalize(texts[0]) if texts else '', str(item))
+            keys = self._item_keys(item)
+            for key in keys:
+                insort(self._keys, (key, item))
+            for prefix in short_prefixes(keys):
+                self._counts[prefix] = self._counts.get(prefix, 0) + 1
+                self._offer(prefix, item)
+            self._forget_cached(keys)
+
+    def remove(self, item):
+        with self._lock:
+            if item not in self._texts:
+                return
+            keys = self._item_keys(item)
+            for key in keys:
+                position = bisect_left(self._keys, (key, item))
+                if position < len(self._keys) and self._keys[position] == (key, item):
+                    del self._keys[position]
+            for prefix in short_prefixes(keys):
+                self._withdraw(prefix, item)
+                self._counts[prefix] -= 1
+                if not self._counts[prefix]:
+                    del self._counts[prefix]
+                    self._top.pop(prefix, None)
+                    self._dirty.discard(prefix)
+                else:
+                    self._check_top(prefix)
+            del self._texts[item]
+            del self._payloads[item]
+            del self._sort_keys[item]
+            self._forget_cached(keys)
+
+    def set_rank(self, item, rank):
+        with self._lock:
+            if item not in self._sort_keys:
+                return
+            keys = self._item_keys(item)
+            prefixes = short_prefixes(keys)
+            for prefix in prefixes:
+                self._withdraw(prefix, item)
+            self._sort_keys[item] = (-(rank or 0),) + self._sort_keys[item][1:]
+            for prefix in prefixes:
+                self._offer(prefix, item)
+                self._check_top(prefix)
+            self._forget_cached(keys)
+
+    def _offer(self, prefix, item):
+        # Список топа верен, если все элементы вне его не лучше последнего в нем.
+        # Новый элемент попадает в топ, если лучше последнего или если в топе уже все остальные
+        top = self._top.setdefault(prefix, [])
+        entry = (self._sort_key(item), item)
+        if len(top) == self._counts[prefix] - 1 or (top and entry < top[-1]):
+            insort(top, entry)
+            if len(top) > TOP_SIZE:
+                top.pop()
+
+    def _withdraw(self, prefix, item):
+        top = self._top.get(prefix)
+        if not top:
+            return
+        entry = (self._sort_key(item), item)
+        position = bisect_left(top, entry)
+        if position < len(top) and top[position] == entry:
+            del top[position]
+
+    def _check_top(self, prefix):
+        if len(self._top.get(prefix, ())) < min(self._counts[prefix], TOP_SERVED):
+            self._dirty.add(prefix)
+
+    def _forget_cached(self, keys):
+        # Из кэша уходят только результаты префиксов, которые совпадают с ключами изменившегося элемента
+        # (ключи обрезаны, поэтому сравнивается и обрезанный префикс)
+        self._generation += 1
+        stale = [cached for cached in self._cache if any(key.startswith(cached[0][:KEY_LENGTH]) for key in keys)]
+        for cached in stale:
+            del self._cache[cached]
+
+    def load(self, entries):
+        """
+        Массовая загрузка: entries — итерируемое из (item, texts, payload, rank)
+        """
+        with self._lock:
+            keys = []
+            groups = {}
+            for item, texts, payload, rank in entries:
+                self._texts[item] = tuple(texts)
+                self._payloads[item] = payload
+                self._sort_keys[item] = (-(rank or 0), normalize(texts[0]) if texts else '', str(item))
+                item_keys = self._item_keys(item)
+                keys.extend((key, item) for key in item_keys)
+                for prefix in short_prefixes(item_keys):
+                    groups.setdefault(prefix, []).append(item)
+            keys.sort()
+            self._keys = keys
+            self._counts = {prefix: len(items) for prefix, items in groups.items()}
+            self._top = {
+                prefix: heapq.nsmallest(TOP_SIZE, ((self._sort_key(item), item) for item in items))
+                for prefix, items in groups.items()
+            }
+            self._dirty = set()
+            self._cache.clear()
+            self._generation += 1
+
+    def _range(self, prefix):
+        # Все пары (ключ, элемент) с ключами, начинающимися с prefix
+        return self._keys[bisect_left(self._keys, (prefix,)):bisect_left(self._keys, (prefix + _LAST_CHAR,))]
+
+    def _matches(self, prefix):
+        return {item for _, item in self._range(prefix)}
+
+    def search(self, query, limit=10):
+        prefix = normalize(query)
+        if not prefix:
+            return []
+
+        with self._lock:
+            if len(prefix) <= SHORT_PREFIX and limit <= TOP_SERVED:
+                if prefix in self._dirty:
+                    self._dirty.discard(prefix)
+                    self._top[prefix] = heapq.nsmallest(
+                        TOP_SIZE, ((self._sort_key(item), item) for item in self._matches(prefix))
+                    )
+                return [self._payloads[item] for _, item in self._top.get(prefix, ())[:limit]]
+
+            cache_key = (prefix, limit)
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                return cached
+            generation = self._generation
+            candidates = self._range(prefix[:KEY_LENGTH])
+
+        # Ранжирование идет без блокировки, по копии среза ключей, поэтому изменения индекса
+        # и другие запросы его не ждут. Элементы, удаленные за это время, пропускаются
+        entries = []
+        for item in {item for _, item in candidates}:
+            try:
+                if len(prefix) > KEY_LENGTH and not self._matches_texts(item, prefix):
+                    continue
+                entries.append((self._sort_key(item), self._payloads[item]))
+            except KeyError:
+                continue
+        # Ключ сортировки уникален (в нем есть сам элемент), поэтому payload не сравнивается
+        result = [payload for _, payload in heapq.nsmallest(limit, entries)]
+
+        with self._lock:
+            if self._generation == generation:
+                if len(self._cache) >= CACHE_SIZE:
+                    self._cache.clear()
+                self._cache[cache_key] = result
+        return result
+
+
+class _NameIndex(PrefixIndex):
+    """
+    Индекс имен (авторы, категории), ранг имени — сумма ratings_count его книг
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._book_counts = {}
+
+    def add_book(self, names, rank):
+        with self._lock:
+            for name in names:
+                if name in self._book_counts:
+                    self._book_counts[name] += 1
+                    self.set_rank(name, self._rank(name) + (rank or 0))
+                else:
+                    self._book_counts[name] = 1
+                    self.add(name, [name], {"name": name}, rank)
+
+    def remove_book(self, names, rank):
+        with self._lock:
+            for name in names:
+                if name not in self._book_counts:
+                    continue
+                self._book_counts[name] -= 1
+                if self._book_counts[name] <= 0:
+                    del self._book_counts[name]
+                    self.remove(name)
+                else:
+                    self.set_rank(name, self._rank(name) - (rank or 0))
+
+    def load_books(self, books_names):
+        """
+        books_names — итерируемое из (names, rank) по каждой книге
+        """
+        ranks = {}
+        for names, rank in books_names:
+            for name in names:
+                ranks[name] = ranks.get(name, 0) + (rank or 0)
+                self._book_counts[name] = self._book_counts.get(name, 0) + 1
+        self.load((name, [name], {"name": name}, rank) for name, rank in ranks.items())
+
+
+class _Snapshot:
+    """
+    Индексы книг, авторов и категорий, построенные по одному чтению каталога
+    """
+
+    def __init__(self, rows):
+        self.book_state = {row[0]: AutoCompleteIndex._state(*row[1:]) for row in rows}
+        self.books = PrefixIndex()
+        self.books.load(
+            (book_id, [title, subtitle], {"id": book_id, "title": title, "subtitle": subtitle}, rank)
+            for book_id, title, subtitle, _, _, rank in rows
+        )
+        self.authors = _NameIndex()
+        self.authors.load_books((state[0], state[2]) for state in self.book_state.values())
+        self.categories = _NameIndex()
+        self.categories.load_books((state[1], state[2]) for state in self.book_state.values())
+
+    def apply(self, book_id, state):
+        """
+        Заменяет данные книги; state=None убирает книгу из индексов
+        """
+        previous = self.book_state.pop(book_id, None)
+        if previous is not None:
+            authors, categories, rank, _, _ = previous
+            self.books.remove(book_id)
+            self.authors.remove_book(authors, rank)
+            self.categories.remove_book(categories, rank)
+        if state is not None:
+            authors, categories, rank, title, subtitle = state
+            self.book_state[book_id] = state
+            self.books.add(book_id, [title, subtitle], {"id": book_id, "title": title, "subtitle": subtitle}, rank)
+            self.authors.add_book(authors, rank)
+            self.categories.add_book(categories, rank)
+
+
+class AutoCompleteIndex(BackgroundRefresh):
+    """
+    Процессный индекс автодополнения по книгам, авторам и категориям.
+    Первый запрос строит его синхронно, дальше индекс обновляется сигналами Book
+    и раз в AUTOCOMPLETE_INDEX_TTL секунд перестраивается в фоновом потоке
+    (чтобы подхватить изменения, сделанные другими процессами, например import_books)
+    """
+
+    FIELDS = ('id', 'title', 'subtitle', 'authors', 'categories', 'ratings_count')
+    ttl_setting = 'AUTOCOMPLETE_INDEX_TTL'
+    default_ttl = 300
+    thread_name = 'autocomplete-refresh'
+    description = 'индекс автодополнения'
+
+    def __init__(self):
+        super().__init__()
+        # _lock защищает текущий снимок и очередь изменений
+        self._lock = threading.RLock()
+        self._snapshot = None
+        # Изменения книг, пришедшие во время построения: применяются к новому снимку перед заменой
+        self._pending = None
+
+    def _is_built(self):
+        return self._snapshot is not None
+
+    def _load_rows(self):
+        return list(Book.objects.values_list(*self.FIELDS).iterator(chunk_size=2000))
+
+    def _build(self):
+        with self._lock:
+            self._pending = []
+        try:
+            snapshot = _Snapshot(self._load_rows())
+        except BaseException:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            for book_id, state in self._pending:
+                snapshot.apply(book_id, state)
+            self._pending = None
+            self._snapshot = snapshot
+            self._built_at = time.monotonic()
+
+    def clear(self):
+        with self._lock:
+            self._built_at = None
+            self._snapshot = None
+
+    @staticmethod
+    def _state(title, subtitle, authors, categories, ratings_count):
+        return split_authors(authors), split_categories(categories), ratings_count or 0, title, subtitle
+
+    def _apply(self, book_id, state):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((book_id, state))
+            if self._snapshot is not None:
+                self._snapshot.apply(book_id, state)
+
+    def update_book(self, book):
+        self._apply(book.pk, self._state(book.title, book.subtitle, book.authors, book.categories, book.ratings_count))
+
+    def remove_book(self, book_id):
+        self._apply(book_id, None)
+
+    def _search(self, attr, query, limit):
+        self._ensure_built()
+        with self._lock:
+            index = getattr(self._snapshot, attr)
+        # Индекс сам защищает свои структуры, а длинные префиксы ранжирует без блокировок
+        return index.search(query, limit)
+
+    def search_books(self, query, limit=10):
+        return self._search('books', query, limit)
+
+    def search_authors(self, query, limit=10):
+        return self._search('authors', query, limit)
+
+    def search_categories(self, query, limit=10):
+        return self._search('categories', query, limit)
+
+
+autocomplete_index = AutoCompleteIndex()
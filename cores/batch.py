@@ -0,0 +1,109 @@
+from django.db import connections, router, transaction
+from django.db.models import Exists, OuterRef
+
+from . import counters
+from .models import Author, Book, Category, UserFavoriteBook, UserLikedAuthors, UserLikedCategories
+from .recommendations import invalidate_recommendations
+
+
+# Пакетные изменения избранного и предпочтений. bulk_create и delete_rows не вызывают сигналы,
+# поэтому счетчики книг и кэш рекомендаций обновляются здесь, один раз на пакет
+
+# Вид предпочтения (он же имя поля модели): (модель, справочник названий)
+LIKES = {
+    'category': (UserLikedCategories, Category),
+    'author': (UserLikedAuthors, Author),
+}
+
+
+def delete_rows(model, ids):
+    """
+    Удаляет строки model с указанными id одним DELETE ... WHERE id IN (...), без сигналов
+    pre_delete/post_delete. QuerySet.delete() при подключенных сигналах читает объекты целиком
+    и отправляет сигналы по каждому, а отключать сигналы нельзя — это глобальное состояние,
+    общее для параллельных запросов. Каскад не выполняется, поэтому модели, на которые
+    ссылаются другие модели, не принимаются. Возвращает число удаленных строк
+    """
+    if model._meta.related_objects:
+        raise ValueError(f'{model.__name__} has dependent rows, use QuerySet.delete()')
+    ids = list(ids)
+    if not ids:
+        return 0
+    connection = connections[router.db_for_write(model)]
+    table = connection.ops.quote_name(model._meta.db_table)
+    column = connection.ops.quote_name(model._meta.pk.column)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE {column} IN ({", ".join(["%s"] * len(ids))})', ids)
+        return cursor.rowcount
+
+
+def _recount(book_ids):
+    # Точный пересчет по затронутым книгам: не расходится со строками, даже если
+    # параллельный запрос успел добавить или удалить ту же книгу
+    counters.recount_books(Book.objects.filter(id__in=book_ids))
+
+
+def add_favorites(user, book_ids):
+    """
+    Добавляет книги в избранное. Возвращает (добавленные id, id, которых нет в каталоге)
+    """
+    with transaction.atomic():
+        # Проверка по каталогу и по уже добавленным — один запрос
+        favorite = UserFavoriteBook.objects.filter(user=user, book=OuterRef('pk'))
+        books = Book.objects.filter(id__in=book_ids).annotate(favorite=Exists(favorite))
+        known = dict(books.values_list('id', 'favorite'))
+        added = [book_id for book_id in book_ids if book_id in known and not known[book_id]]
+        if added:
+            UserFavoriteBook.objects.bulk_create(
+                [UserFavoriteBook(user=user, book_id=book_id) for book_id in added], ignore_conflicts=True
+            )
+            _recount(added)
+            invalidate_recommendations(user.id)
+    return added, [book_id for book_id in book_ids if book_id not in known]
+
+
+def remove_favorites(user, book_ids):
+    """
+    Убирает книги из избранного одним DELETE. Возвращает id удаленных
+    """
+    with transaction.atomic():
+        favorites = dict(
+            UserFavoriteBook.objects.filter(user=user, book_id__in=book_ids).values_list('id', 'book_id')
+        )
+        found = set(favorites.values())
+        if found:
+            delete_rows(UserFavoriteBook, favorites)
+            _recount(found)
+            invalidate_recommendations(user.id)
+    return [book_id for book_id in book_ids if book_id in found]
+
+
+def add_likes(profile, kind, names):
+    """
+    Добавляет категории (kind='category') или авторов (kind='author') в предпочтения.
+    Возвращает (добавленные, названия, которых нет в справочнике)
+    """
+    model, catalog = LIKES[kind]
+    with transaction.atomic():
+        liked = model.objects.filter(user=profile, **{kind: OuterRef('name')})
+        entries = catalog.objects.filter(name__in=names).annotate(liked=Exists(liked))
+        known = dict(entries.values_list('name', 'liked'))
+        added = [name for name in names if name in known and not known[name]]
+        if added:
+            model.objects.bulk_create([model(user=profile, **{kind: name}) for name in added], ignore_conflicts=True)
+            invalidate_recommendations(profile.user_id)
+    return added, [name for name in names if name not in known]
+
+
+def remove_likes(profile, kind, names):
+    """
+    Убирает категории или авторов из предпочтений одним DELETE. Возвращает удаленные
+    """
+    model, _ = LIKES[kind]
+    with transaction.atomic():
+        liked = dict(model.objects.filter(user=profile, **{f'{kind}__in': names}).values_list('id', kind))
+        found = set(liked.values())
+        if found:
+            delete_rows(model, liked)
+            invalidate_recommendations(profile.user_id)
+    return [name for name in names if name in found]
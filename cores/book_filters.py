@@ -0,0 +1,103 @@
+from django.db.models import Subquery
+from django.db.models.functions import Lower
+
+from .models import BookFacet
+
+
+class InvalidQuery(ValueError):
+    pass
+
+
+# Сортировки списка книг (?ordering=), каждая обслуживается индексом Book.
+# Обратный порядок (?ordering=-title) читает тот же индекс с конца.
+# Последнее поле делает порядок однозначным, по нему же работают курсоры
+_ORDERINGS = {
+    'id': ('id',),
+    'title': ('title_lower', 'id'),
+    'published_year': ('published_year', '-average_rating', 'id'),
+    'average_rating': ('average_rating', 'ratings_count', 'id'),
+    'ratings_count': ('ratings_count', 'id'),
+    'favorites_count': ('favorites_count', 'id'),
+    'discussions_count': ('discussions_count', 'id'),
+    'comments_count': ('comments_count', 'id'),
+    'last_activity_at': ('last_activity_at', 'id'),
+}
+
+
+def _reverse(field):
+    return field[1:] if field.startswith('-') else f'-{field}'
+
+
+ORDERINGS = {
+    **_ORDERINGS,
+    **{f'-{name}': tuple(_reverse(field) for field in fields) for name, fields in _ORDERINGS.items()},
+}
+DEFAULT_ORDERING = 'id'
+
+
+def _int_param(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise InvalidQuery(f'Invalid {name}')
+
+
+def filter_books(queryset, params):
+    """
+    Фильтры списка книг из параметров запроса:
+    ?year_min=1990&year_max=1999 — год издания, ?min_rating=4 — рейтинг не ниже,
+    ?category=Fiction и ?author=... — точное название (через предрасчитанные фасеты)
+    """
+    year_min, year_max = _int_param(params, 'year_min'), _int_param(params, 'year_max')
+    if year_min is not None:
+        queryset = queryset.filter(published_year__gte=year_min)
+    if year_max is not None:
+        queryset = queryset.filter(published_year__lte=year_max)
+
+    min_rating = params.get('min_rating')
+    if min_rating not in (None, ''):
+        try:
+            min_rating = float(min_rating)
+        except ValueError:
+            raise InvalidQuery('Invalid min_rating')
+        if not 0 <= min_rating <= 5:
+            raise InvalidQuery('Invalid min_rating')
+        queryset = queryset.filter(average_rating__gte=min_rating)
+
+    for facet in ('category', 'author'):
+        value = params.get(facet)
+        if value:
+            books = BookFacet.objects.filter(facet=facet, value=value).values('book_id')
+            queryset = queryset.filter(id__in=Subquery(books))
+    return queryset
+
+
+def order_books(queryset, params):
+    """
+    Сортировка по ?ordering= (ключи ORDERINGS). Возвращает (queryset, поля сортировки)
+    """
+    name = params.get('ordering') or DEFAULT_ORDERING
+    if name not in ORDERINGS:
+        raise InvalidQuery(f"ordering must be one of: {', '.join(ORDERINGS)}")
+    ordering = ORDERINGS[name]
+    if any(field.lstrip('-') == 'title_lower' for field in ordering):
+        # Выражение совпадает с индексом cores_book_title_lower
+        queryset = queryset.annotate(title_lower=Lower('title'))
+    return queryset.order_by(*ordering), ordering
+
+
+def sparse_fields(params, allowed):
+    """
+    Поля из ?fields=title,authors. None, если параметр не передан
+    """
+    value = params.get('fields')
+    if not value:
+        return None
+    fields = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in allowed]
+    if unknown or not fields:
+        raise InvalidQuery(f"fields must be a subset of: {', '.join(allowed)}")
+    return list(dict.fromkeys(fields))
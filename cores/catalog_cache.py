@@ -0,0 +1,135 @@
+import hashlib
+import time
+
+from django.core.cache import caches
+from django.db.models import F
+from django.utils import timezone
+from django.views.decorators.http import condition
+
+from .models import CatalogState
+
+
+CATALOG_CACHE = 'catalog'
+STATE_ID = 1
+
+
+def _cache():
+    return caches[CATALOG_CACHE]
+
+
+# ---------------------------------------------------------------
+# Отметки изменений хранятся в базе (CatalogState), а не в кэше каталога: кэш может быть
+# своим у каждого процесса, и изменение из import_books не дошло бы до воркеров gunicorn.
+# Данные в кэше лежат под версией из базы, поэтому чужой кэш не может отдать устаревшие данные
+
+def catalog_state(request=None):
+    """
+    Версия каталога, время изменения каталога и время изменения счетчиков активности.
+    Читается одним запросом по первичному ключу; с request запоминается на время запроса.
+    Если строки нет (новая база), она создается. Начальная версия — время в наносекундах,
+    чтобы не совпасть с версиями записей, оставшихся в общем кэше от прежней базы
+    """
+    state = getattr(request, '_catalog_state', None)
+    if state is None:
+        state = CatalogState.objects.filter(pk=STATE_ID).values_list('version', 'modified_at', 'activity_at').first()
+        if state is None:
+            now = timezone.now()
+            row, _ = CatalogState.objects.get_or_create(
+                pk=STATE_ID, defaults={'version': time.time_ns(), 'modified_at': now, 'activity_at': now}
+            )
+            state = (row.version, row.modified_at, row.activity_at)
+        if request is not None:
+            request._catalog_state = state
+    return state
+
+
+def catalog_version(request=None):
+    """
+    Текущая версия каталога. Все записи кэша каталога хранятся под этой версией,
+    поэтому смена версии разом делает их недоступными
+    """
+    return catalog_state(request)[0]
+
+
+def _update_state(**fields):
+    if not CatalogState.objects.filter(pk=STATE_ID).update(**fields):
+        catalog_state()
+        CatalogState.objects.filter(pk=STATE_ID).update(**fields)
+
+
+def touch_catalog_activity():
+    """
+    Отмечает изменение счетчиков активности. Кэш каталога при этом не сбрасывается
+    (счетчики подставляются в ответы отдельно), меняются только валидаторы ответов с книгами
+    """
+    _update_state(activity_at=timezone.now())
+
+
+def bump_catalog_version():
+    _update_state(version=F('version') + 1, modified_at=timezone.now())
+
+
+# ---------------------------------------------------------------
+# Условные запросы (If-None-Match / If-Modified-Since). Валидаторы берутся из одной строки
+# CatalogState, поэтому ответ 304 обходится без сериализации и запросов к данным каталога
+
+def catalog_etag(request, *args, **kwargs):
+    return f'W/"catalog-{catalog_version(request)}"'
+
+
+def catalog_last_modified(request, *args, **kwargs):
+    return catalog_state(request)[1]
+
+
+catalog_condition = condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)
+
+
+# Для ответов с книгами: в них есть счетчики активности, которые меняются без смены версии каталога
+
+def book_etag(request, *args, **kwargs):
+    version, _, activity = catalog_state(request)
+    return f'W/"catalog-{version}-{activity.timestamp():.6f}"'
+
+
+def book_last_modified(request, *args, **kwargs):
+    _, modified, activity = catalog_state(request)
+    return max(modified, activity)
+
+
+book_condition = condition(etag_func=book_etag, last_modified_func=book_last_modified)
+
+
+def book_detail_key(book_id):
+    return f'catalog:book:{book_id}'
+
+
+def book_list_key(url):
+    return 'catalog:books:' + hashlib.sha1(url.encode()).hexdigest()
+
+
+def book_bulk_key(url):
+    return 'catalog:bulk:' + hashlib.sha1(url.encode()).hexdigest()
+
+
+def browse_key(url):
+    return 'catalog:browse:' + hashlib.sha1(url.encode()).hexdigest()
+
+
+def categories_key():
+    return 'catalog:categories'
+
+
+def get_or_build(key, build, refresh=None, request=None):
+    """
+    Данные из кэша каталога или build(), если их нет для текущей версии.
+    refresh(payload) обновляет данные, взятые из кэша, тем, что меняется без смены версии.
+    С request версия берется та же, что уже прочитана для валидаторов ответа
+    """
+    cache, version = _cache(), catalog_version(request)
+    payload = cache.get(key, version=version)
+    if payload is None:
+        payload = build()
+        cache.set(key, payload, version=version)
+    elif refresh is not None:
+        refresh(payload)
+    return payload
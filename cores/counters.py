@@ -0,0 +1,108 @@
+from django.db.models import Count, F, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest
+
+from .catalog_cache import touch_catalog_activity
+from .models import Book, Comment, Discussion, UserFavoriteBook
+
+
+# ---------------------------------------------------------------
+# Инкрементальное обновление (из сигналов). Только UPDATE ... SET x = x ± 1,
+# поэтому параллельные запросы не теряют изменения друг друга.
+# Каждое изменение счетчиков книги отмечается для валидаторов ответов (ETag, Last-Modified)
+
+def favorite_added(favorite):
+    Book.objects.filter(pk=favorite.book_id).update(
+        favorites_count=F('favorites_count') + 1, last_activity_at=favorite.added_at
+    )
+    touch_catalog_activity()
+
+
+def favorite_removed(favorite):
+    Book.objects.filter(pk=favorite.book_id).update(favorites_count=F('favorites_count') - 1)
+    touch_catalog_activity()
+
+
+def discussion_added(discussion):
+    Book.objects.filter(pk=discussion.book_id).update(
+        discussions_count=F('discussions_count') + 1, last_activity_at=discussion.created_at
+    )
+    touch_catalog_activity()
+
+
+def discussion_removed(discussion):
+    # Комментарии обсуждения удаляются раньше него и уже вычтены из comments_count книги
+    Book.objects.filter(pk=discussion.book_id).update(discussions_count=F('discussions_count') - 1)
+    touch_catalog_activity()
+
+
+def comment_added(comment):
+    Discussion.objects.filter(pk=comment.discussion_id).update(
+        comments_count=F('comments_count') + 1, last_activity_at=comment.created_at
+    )
+    Book.objects.filter(discussions=comment.discussion_id).update(
+        comments_count=F('comments_count') + 1, last_activity_at=comment.created_at
+    )
+    touch_catalog_activity()
+
+
+def comment_removed(comment):
+    Discussion.objects.filter(pk=comment.discussion_id).update(comments_count=F('comments_count') - 1)
+    Book.objects.filter(discussions=comment.discussion_id).update(comments_count=F('comments_count') - 1)
+    touch_catalog_activity()
+
+
+# Перенос обсуждения в другую книгу или комментария в другое обсуждение (PUT).
+# Переносятся и комментарии, и время активности, поэтому затронутые строки пересчитываются целиком
+
+def discussion_moved(discussion, previous_book_id):
+    recount_books(Book.objects.filter(pk__in=[previous_book_id, discussion.book_id]))
+
+
+def comment_moved(comment, previous_discussion_id):
+    discussion_ids = [previous_discussion_id, comment.discussion_id]
+    recount_discussions(Discussion.objects.filter(pk__in=discussion_ids))
+    recount_books(Book.objects.filter(discussions__in=discussion_ids))
+
+
+# ---------------------------------------------------------------
+# Полный пересчет (команда repair_counters). Каждое поле — один UPDATE с подзапросом
+
+def _aggregate(model, field, aggregate):
+    return Subquery(
+        model.objects.filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(value=aggregate)
+        .values('value')
+    )
+
+
+def recount_discussions(queryset=None):
+    queryset = Discussion.objects.all() if queryset is None else queryset
+    return queryset.update(
+        comments_count=Coalesce(_aggregate(Comment, 'discussion', Count('pk')), 0),
+        last_activity_at=Coalesce(_aggregate(Comment, 'discussion', Max('created_at')), F('created_at')),
+    )
+
+
+def recount_books(queryset=None):
+    """
+    Пересчитывает счетчики книг. Опирается на last_activity_at обсуждений,
+    поэтому сначала нужно вызвать recount_discussions
+    """
+    queryset = Book.objects.all() if queryset is None else queryset
+    last_favorite = _aggregate(UserFavoriteBook, 'book', Max('added_at'))
+    last_discussion = _aggregate(Discussion, 'book', Max('last_activity_at'))
+    updated = queryset.update(
+        favorites_count=Coalesce(_aggregate(UserFavoriteBook, 'book', Count('pk')), 0),
+        discussions_count=Coalesce(_aggregate(Discussion, 'book', Count('pk')), 0),
+        comments_count=Coalesce(_aggregate(Discussion, 'book', Sum('comments_count')), 0),
+        # GREATEST в SQLite возвращает NULL, если NULL хотя бы один аргумент, поэтому
+        # каждый аргумент подменяется другим: результат — максимум из непустых значений
+        last_activity_at=Greatest(
+            Coalesce(last_favorite, last_discussion),
+            Coalesce(last_discussion, last_favorite),
+        ),
+    )
+    touch_catalog_activity()
+    return updated
@@ -0,0 +1,132 @@
+import csv
+import datetime
+import json
+import tempfile
+
+import openpyxl
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Book, Category, Discussion, UserFavoriteBook
+
+
+FORMATS = ('csv', 'jsonl', 'xlsx')
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+CHUNK_SIZE = 2000
+# Сколько строк CSV/JSONL склеивается в один кусок потока
+LINES_PER_CHUNK = 500
+FILE_CHUNK_SIZE = 64 * 1024
+
+# Набор данных: (queryset, колонки для values_list)
+DATASETS = {
+    'books': (
+        lambda: Book.objects.order_by('id'),
+        (
+            'id', 'isbn13', 'isbn10', 'title', 'subtitle', 'authors', 'categories', 'thumbnail',
+            'published_year', 'average_rating', 'num_pages', 'ratings_count',
+            'favorites_count', 'discussions_count', 'comments_count',
+        ),
+    ),
+    'categories': (
+        lambda: Category.objects.order_by('id'),
+        ('id', 'name'),
+    ),
+    'favorites': (
+        lambda: UserFavoriteBook.objects.order_by('id'),
+        ('id', 'user_id', 'user__email', 'book_id', 'book__isbn13', 'added_at'),
+    ),
+    'discussions': (
+        lambda: Discussion.objects.order_by('id'),
+        ('id', 'book_id', 'title', 'author__email', 'created_at', 'comments_count', 'last_activity_at'),
+    ),
+}
+
+
+def detect_format(path):
+    extension = path.rsplit('.', 1)[-1].lower() if '.' in path else ''
+    if extension not in FORMATS:
+        raise ValueError(f'Не удалось определить формат по имени {path}, укажите --format')
+    return extension
+
+
+def export_rows(dataset, chunk_size=CHUNK_SIZE):
+    """
+    Заголовок и итератор строк набора данных. Строки читаются с сервера пачками по chunk_size,
+    в памяти одновременно находится только одна пачка
+    """
+    queryset, fields = DATASETS[dataset]
+    return fields, queryset().values_list(*fields).iterator(chunk_size=chunk_size)
+
+
+class _Echo:
+    # csv.writer пишет в "файл", который просто возвращает строку
+    def write(self, value):
+        return value
+
+
+def _batched(lines):
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) == LINES_PER_CHUNK:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def iter_csv(header, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(header)
+    yield from _batched(writer.writerow(row) for row in rows)
+
+
+def iter_jsonl(header, rows):
+    yield from _batched(
+        json.dumps(dict(zip(header, row)), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n' for row in rows
+    )
+
+
+def _xlsx_cell(value):
+    # Excel не хранит часовой пояс: время записывается в UTC
+    if isinstance(value, datetime.datetime) and value.tzinfo is not None:
+        return value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def write_xlsx(header, rows, target, title):
+    """
+    Пишет лист в режиме write_only. target — путь или файловый объект.
+    Память не растет с числом строк, только если установлен lxml (openpyxl.LXML):
+    запасной писатель et_xmlfile собирает XML листа целиком в памяти
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    sheet.append(header)
+    for row in rows:
+        sheet.append([_xlsx_cell(value) for value in row])
+    workbook.save(target)
+
+
+def iter_xlsx(header, rows, title):
+    # XLSX — zip-архив, его нельзя отдавать по мере записи строк: сначала он собирается во временном файле
+    with tempfile.TemporaryFile() as buffer:
+        write_xlsx(header, rows, buffer, title)
+        buffer.seek(0)
+        while chunk := buffer.read(FILE_CHUNK_SIZE):
+            yield chunk
+
+
+def stream_export(dataset, file_format, chunk_size=CHUNK_SIZE):
+    """
+    Выгрузка набора данных кусками (str для CSV/JSONL, bytes для XLSX)
+    """
+    header, rows = export_rows(dataset, chunk_size)
+    if file_format == 'csv':
+        return iter_csv(header, rows)
+    if file_format == 'jsonl':
+        return iter_jsonl(header, rows)
+    return iter_xlsx(header, rows, dataset)
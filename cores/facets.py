@@ -0,0 +1,122 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Book, BookFacet, FacetValue, split_authors, split_categories
+
+
+FACETS = ('category', 'author', 'year', 'rating')
+FACET_FIELDS = ('id', 'categories', 'authors', 'published_year', 'average_rating')
+
+
+def year_bucket(year):
+    # Десятилетие: 1994 -> '1990'
+    return str(year - year % 10) if year else None
+
+
+def rating_bucket(rating):
+    # Целая часть рейтинга: 4.37 -> '4' (книги с рейтингом от 4 до 5)
+    return str(int(rating)) if rating is not None else None
+
+
+def book_facets(book):
+    """
+    Значения фасетов книги: множество пар (фасет, значение)
+    """
+    pairs = {('category', name) for name in split_categories(book.categories)}
+    pairs |= {('author', name) for name in split_authors(book.authors)}
+    for facet, value in (('year', year_bucket(book.published_year)), ('rating', rating_bucket(book.average_rating))):
+        if value is not None:
+            pairs.add((facet, value))
+    return pairs
+
+
+def _recount(pairs, chunk_size=500):
+    """
+    Пересчитывает FacetValue.count только для затронутых пар; значения без книг удаляются
+    """
+    by_facet = defaultdict(set)
+    for facet, value in pairs:
+        by_facet[facet].add(value)
+
+    for facet, values in by_facet.items():
+        values = sorted(values)
+        for start in range(0, len(values), chunk_size):
+            chunk = values[start:start + chunk_size]
+            counts = dict(
+                BookFacet.objects.filter(facet=facet, value__in=chunk)
+                .values('value')
+                .annotate(total=Count('id'))
+                .values_list('value', 'total')
+            )
+            FacetValue.objects.filter(facet=facet, value__in=set(chunk) - counts.keys()).delete()
+            FacetValue.objects.bulk_create(
+                [FacetValue(facet=facet, value=value, count=count) for value, count in counts.items()],
+                update_conflicts=True,
+                unique_fields=['facet', 'value'],
+                update_fields=['count'],
+            )
+
+
+def refresh_facets(books):
+    """
+    Приводит строки BookFacet переданных книг в соответствие с их полями
+    и пересчитывает счетчики изменившихся значений.
+    books — экземпляры Book, у которых загружены поля FACET_FIELDS
+    """
+    books = list(books)
+    if not books:
+        return
+    wanted = {(book.id, facet, value) for book in books for facet, value in book_facets(book)}
+    existing = {
+        (book_id, facet, value): facet_id
+        for facet_id, book_id, facet, value in BookFacet.objects.filter(
+            book_id__in=[book.id for book in books]
+        ).values_list('id', 'book_id', 'facet', 'value')
+    }
+    added = wanted - existing.keys()
+    removed = existing.keys() - wanted
+    if not added and not removed:
+        return
+
+    with transaction.atomic():
+        BookFacet.objects.filter(id__in=[existing[key] for key in removed]).delete()
+        BookFacet.objects.bulk_create(
+            [BookFacet(book_id=book_id, facet=facet, value=value) for book_id, facet, value in added],
+            batch_size=2000,
+        )
+        _recount({(facet, value) for _, facet, value in added | removed})
+
+
+def forget_facets(book):
+    """
+    Вызывается после удаления книги: ее строки BookFacet уже удалены каскадом
+    """
+    _recount(book_facets(book))
+
+
+def rebuild_facets(chunk_size=2000):
+    """
+    Полная перестройка фасетов по всему каталогу
+    """
+    with transaction.atomic():
+        BookFacet.objects.all().delete()
+        FacetValue.objects.all().delete()
+        pairs = set()
+        books = Book.objects.only(*FACET_FIELDS).order_by('id')
+        chunk = []
+        for book in books.iterator(chunk_size=chunk_size):
+            chunk.append(book)
+            if len(chunk) == chunk_size:
+                pairs |= _insert_facets(chunk)
+                chunk = []
+        pairs |= _insert_facets(chunk)
+        _recount(pairs)
+    return len(pairs)
+
+
+def _insert_facets(books):
+    rows = [BookFacet(book_id=book.id, facet=facet, value=value) for book in books for facet, value in book_facets(book)]
+    BookFacet.objects.bulk_create(rows, batch_size=2000)
+    return {(row.facet, row.value) for row in rows}
@@ -0,0 +1,376 @@
+import csv
+import io
+import json
+import logging
+import os
+import re
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+import openpyxl
+from django.db import IntegrityError, transaction
+
+from .facets import FACET_FIELDS, refresh_facets
+from .models import Author, Book, Category, prune_unused_names, split_authors, split_categories
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_AUTHOR = 'Неизвестный автор'
+
+# Поля Book, которые обновляются при повторном импорте книги с тем же isbn13
+UPDATE_FIELDS = [
+    'isbn10',
+    'title',
+    'subtitle',
+    'authors',
+    'categories',
+    'thumbnail',
+    'description',
+    'published_year',
+    'average_rating',
+    'num_pages',
+    'ratings_count',
+]
+
+FORMATS = ('xlsx', 'csv', 'jsonl')
+
+# ISBN без дефисов и пробелов; у ISBN 10 контрольный символ может быть X
+ISBN_PATTERNS = {
+    'isbn13': re.compile(r'\d{13}'),
+    'isbn10': re.compile(r'\d{9}[\dX]'),
+}
+
+
+class RowError(ValueError):
+    pass
+
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    if extension in ('xlsx', 'xlsm'):
+        return 'xlsx'
+    if extension in ('jsonl', 'ndjson'):
+        return 'jsonl'
+    if extension == 'csv':
+        return 'csv'
+    raise ValueError(f'Unknown file format: {path}')
+
+
+def read_rows(path, file_format=None, start=0):
+    """
+    Потоково читает строки файла как словари {колонка: значение}, не загружая файл целиком.
+    start — сколько первых записей (без строки заголовков) пропустить
+    """
+    file_format = file_format or detect_format(path)
+
+    if file_format == 'xlsx':
+        workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            sheet = workbook.active
+            headers = next(sheet.iter_rows(max_row=1, values_only=True), None)
+            if headers is None:
+                return
+            for row in sheet.iter_rows(min_row=start + 2, values_only=True):
+                yield dict(zip(headers, row))
+        finally:
+            workbook.close()
+
+    elif file_format == 'csv':
+        with open(path, newline='', encoding='utf-8') as file:
+            yield from islice(csv.DictReader(file), start, None)
+
+    elif file_format == 'jsonl':
+        with open(path, encoding='utf-8') as file:
+            lines = (line for line in file if line.strip())
+            for line in islice(lines, start, None):
+                yield json.loads(line)
+
+    else:
+        raise ValueError(f'Unknown file format: {file_format}')
+
+
+def batch_ranges(path, file_format, start=0, batch_size=1000):
+    """
+    Делит CSV или JSONL на пачки по batch_size записей: (начало, конец в байтах, число записей).
+    Файл только просматривается по строкам, без разбора значений: запись JSONL — непустая строка,
+    запись CSV заканчивается переводом строки вне кавычек (в описаниях бывают переводы строк).
+    Первые start записей пропускаются
+    """
+    if file_format not in ('csv', 'jsonl'):
+        raise ValueError(f'Byte ranges are not supported for {file_format}')
+
+    with open(path, 'rb') as file:
+        position = begin = records = quotes = 0
+        header = file_format == 'csv'
+        for line in file:
+            position += len(line)
+            if file_format == 'csv':
+                quotes += line.count(b'"')
+                if quotes % 2:
+                    continue
+                quotes, blank = 0, not line.strip(b'\r\n')
+            else:
+                blank = not line.strip()
+
+            if header:
+                header, begin = False, position
+            elif blank:
+                continue
+            elif start:
+                start, begin = start - 1, position
+            else:
+                records += 1
+                if records == batch_size:
+                    yield begin, position, records
+                    begin, records = position, 0
+        if records:
+            yield begin, position, records
+
+
+def read_range(path, file_format, begin, end):
+    """
+    Записи CSV или JSONL из диапазона байтов, найденного batch_ranges
+    """
+    with open(path, 'rb') as file:
+        file.seek(begin)
+        text = file.read(end - begin).decode('utf-8')
+
+    if file_format == 'csv':
+        with open(path, newline='', encoding='utf-8') as file:
+            headers = next(csv.reader(file), [])
+        return list(csv.DictReader(io.StringIO(text, newline=''), fieldnames=headers))
+    return [json.loads(line) for line in text.split('\n') if line.strip()]
+
+
+def _value(value, field_name, required=False):
+    if value is None or (isinstance(value, str) and not value.strip()):
+        if required:
+            raise RowError(f'{field_name} is required')
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _text(value, field_name, required=False):
+    """
+    Свободный текст (название, авторы, категории): слишком длинный обрезается до длины поля
+    """
+    value = _value(value, field_name, required)
+    max_length = Book._meta.get_field(field_name).max_length
+    if value is not None and max_length and len(value) > max_length:
+        logger.warning('%s обрезано до %d символов: %.60s...', field_name, max_length, value)
+        value = value[:max_length]
+    return value
+
+
+def _isbn(value, field_name):
+    """
+    Идентификатор не обрезается: ISBN неверного вида — ошибка строки
+    """
+    value = _value(value, field_name, required=True).replace('-', '').replace(' ', '').upper()
+    # Excel теряет ведущие нули у ISBN 10, если колонка числовая
+    if field_name == 'isbn10' and value.isdigit():
+        value = value.zfill(10)
+    if not ISBN_PATTERNS[field_name].fullmatch(value):
+        raise RowError(f'{field_name} is malformed: {value[:20]}')
+    return value
+
+
+def _url(value, field_name):
+    # Обрезанная ссылка бесполезна, поэтому слишком длинная отбрасывается
+    value = _value(value, field_name)
+    max_length = Book._meta.get_field(field_name).max_length
+    if value is not None and len(value) > max_length:
+        logger.warning('%s длиннее %d символов и пропущено: %.60s...', field_name, max_length, value)
+        return None
+    return value
+
+
+def _integer(value, field_name):
+    if value is None or value == '':
+        return None
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        raise RowError(f'{field_name} must be a number')
+
+
+def _rating(value):
+    if value is None or value == '':
+        return None
+    try:
+        return Decimal(str(value)).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise RowError('average_rating must be a number')
+
+
+def clean_row(data):
+    """
+    Проверяет и приводит строку файла к полям Book. При ошибке бросает RowError
+    """
+    return {
+        'isbn13': _isbn(data.get('isbn13'), 'isbn13'),
+        'isbn10': _isbn(data.get('isbn10'), 'isbn10'),
+        'title': _text(data.get('title'), 'title', required=True),
+        'subtitle': _text(data.get('subtitle'), 'subtitle'),
+        'authors': _text(data.get('authors'), 'authors') or DEFAULT_AUTHOR,
+        'categories': _text(data.get('categories'), 'categories'),
+        'thumbnail': _url(data.get('thumbnail'), 'thumbnail'),
+        'description': _text(data.get('description'), 'description'),
+        'published_year': _integer(data.get('published_year'), 'published_year'),
+        'average_rating': _rating(data.get('average_rating')),
+        'num_pages': _integer(data.get('num_pages'), 'num_pages'),
+        'ratings_count': _integer(data.get('ratings_count'), 'ratings_count'),
+    }
+
+
+def clean_rows(rows, first_number=1):
+    """
+    Очищает пачку строк. Возвращает число прочитанных строк, очищенные строки
+    и ошибки [(номер записи, текст)]
+    """
+    count, cleaned, errors = 0, [], []
+    for number, data in enumerate(rows, start=first_number):
+        count += 1
+        try:
+            cleaned.append(clean_row(data))
+        except RowError as error:
+            errors.append((number, str(error)))
+    return count, cleaned, errors
+
+
+def clean_range(path, file_format, begin, end, first_number=1):
+    """
+    Читает, разбирает и очищает одну пачку в процессе пула (import_books --workers)
+    """
+    return clean_rows(read_range(path, file_format, begin, end), first_number)
+
+
+def init_worker():
+    # При запуске процессов через spawn Django в дочернем процессе еще не настроен
+    import django
+    django.setup()
+
+
+class Checkpoint:
+    """
+    Файл состояния импорта: сколько записей файла уже записано в базу.
+    Пачки фиксируются строго по порядку, поэтому достаточно одного числа
+    """
+
+    def __init__(self, state_path, source_path):
+        self.state_path = state_path
+        stat = os.stat(source_path)
+        self.signature = {
+            'source': os.path.abspath(source_path),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+        }
+        self.committed = 0
+
+    def load(self):
+        if not os.path.exists(self.state_path):
+            return self.committed
+        with open(self.state_path, encoding='utf-8') as file:
+            state = json.load(file)
+        if state.get('signature') != self.signature:
+            raise ValueError(
+                f'Checkpoint {self.state_path} belongs to another file; remove it to start over'
+            )
+        self.committed = state['committed']
+        return self.committed
+
+    def save(self, committed):
+        self.committed = committed
+        temporary_path = f'{self.state_path}.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as file:
+            json.dump({'signature': self.signature, 'committed': committed}, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_path, self.state_path)
+
+    def clear(self):
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+
+
+def _sync_relation(book_ids, values, relation, model, splitter):
+    through = getattr(Book, relation).through
+    target = f'{model._meta.model_name}_id'
+
+    names_by_book = {book_id: splitter(values[book_id]) for book_id in book_ids}
+    all_names = {name for names in names_by_book.values() for name in names}
+    model.objects.bulk_create([model(name=name) for name in all_names], ignore_conflicts=True)
+    ids = dict(model.objects.filter(name__in=all_names).values_list('name', 'id'))
+
+    links = through.objects.filter(book_id__in=book_ids)
+    previous = set(links.values_list(target, flat=True))
+    links.delete()
+    through.objects.bulk_create(
+        [
+            through(book_id=book_id, **{target: ids[name]})
+            for book_id, names in names_by_book.items()
+            for name in names
+        ],
+        ignore_conflicts=True,
+    )
+    prune_unused_names(model, previous - set(ids.values()))
+
+
+def sync_book_relations(books):
+    """
+    Массовый аналог Book.sync_categories/sync_authors для книг, записанных через bulk_create
+    """
+    book_ids = [book.pk for book in books]
+    _sync_relation(book_ids, {book.pk: book.categories for book in books},
+                   'normalized_categories', Category, split_categories)
+    _sync_relation(book_ids, {book.pk: book.authors for book in books},
+                   'normalized_authors', Author, split_authors)
+
+
+def upsert_books(rows):
+    """
+    Записывает пачку очищенных строк одной транзакцией через bulk_create(update_conflicts=True).
+    Если пачка нарушает другое ограничение (например, уникальность isbn10), строки
+    записываются по одной, и возвращается список ошибок по ним
+    """
+    # В пределах пачки последняя строка с тем же isbn13 побеждает
+    rows = list({row['isbn13']: row for row in rows}.values())
+    errors = []
+
+    try:
+        with transaction.atomic():
+            Book.objects.bulk_create(
+                [Book(**row) for row in rows],
+                update_conflicts=True,
+                unique_fields=['isbn13'],
+                update_fields=UPDATE_FIELDS,
+            )
+            books = _fetch_books(rows)
+            sync_book_relations(books)
+            refresh_facets(books)
+        return len(books), errors
+    except IntegrityError:
+        pass
+
+    written = []
+    with transaction.atomic():
+        for row in rows:
+            try:
+                with transaction.atomic():
+                    Book.objects.update_or_create(
+                        isbn13=row['isbn13'],
+                        defaults={field: row[field] for field in UPDATE_FIELDS},
+                    )
+                written.append(row)
+            except IntegrityError as error:
+                errors.append((row['isbn13'], str(error)))
+    return len(written), errors
+
+
+def _fetch_books(rows):
+    return list(
+        Book.objects.filter(isbn13__in=[row['isbn13'] for row in rows]).only(*FACET_FIELDS)
+    )
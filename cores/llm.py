@@ -0,0 +1,159 @@
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+
+# Ответы, после которых запрос имеет смысл повторить
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CompletionError(Exception):
+    pass
+
+
+class _Retry(Exception):
+    def __init__(self, reason, retry_after=None):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class CompletionClient:
+    """
+    Клиент chat completions с пулом соединений, ограничением числа одновременных запросов,
+    таймаутами и повторами с экспоненциальной задержкой.
+
+    timeout — таймаут одной попытки, deadline — общее время на запрос со всеми повторами.
+    max_concurrency — общий предел для процесса: запросы из всех потоков занимают
+    слоты одного семафора
+    """
+
+    def __init__(self, url, api_key, model, timeout=20.0, connect_timeout=3.05, deadline=30.0,
+                 max_retries=2, backoff=0.5, max_concurrency=8):
+        self.url = url
+        self.api_key = api_key
+        self.model = model
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_concurrency = max_concurrency
+
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+    @property
+    def session(self):
+        with self._session_lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers.update({
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json"
+                })
+                self._session = session
+            return self._session
+
+    def close(self):
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def _payload(self, messages, params):
+        return {"model": self.model, "messages": messages, "n": 1, **params}
+
+    def _attempt(self, payload, remaining):
+        """
+        Одна попытка запроса. Возвращает текст ответа модели, бросает _Retry,
+        если попытку стоит повторить, и CompletionError, если нет
+        """
+        try:
+            response = self.session.post(
+                self.url, json=payload, timeout=(self.connect_timeout, max(min(self.timeout, remaining), 0.001))
+            )
+        except (requests.Timeout, requests.ConnectionError) as error:
+            raise _Retry(str(error))
+        except requests.RequestException as error:
+            raise CompletionError(str(error))
+
+        if response.status_code in RETRY_STATUSES:
+            retry_after = response.headers.get('Retry-After')
+            try:
+                retry_after = float(retry_after) if retry_after else None
+            except ValueError:
+                retry_after = None
+            raise _Retry(f'HTTP {response.status_code}', retry_after)
+        if response.status_code != 200:
+            raise CompletionError(f'HTTP {response.status_code}: {response.text[:200]}')
+
+        try:
+            return response.json()['choices'][0]['message']['content']
+        except (ValueError, KeyError, IndexError, TypeError):
+            raise CompletionError('Unexpected completion response')
+
+    def _delay(self, attempt, retry_after):
+        delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def complete(self, messages, **params):
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.deadline):
+            raise CompletionError('Too many concurrent completion requests')
+        try:
+            payload = self._payload(messages, params)
+            for attempt in range(self.max_retries + 1):
+                remaining = self.deadline - (time.monotonic() - started)
+                if remaining <= 0:
+                    break
+                try:
+                    return self._attempt(payload, remaining)
+                except _Retry as retry:
+                    delay = self._delay(attempt, retry.retry_after)
+                    if attempt == self.max_retries or time.monotonic() - started + delay >= self.deadline:
+                        raise CompletionError(f'Completion failed: {retry}')
+                    time.sleep(delay)
+            raise CompletionError('Completion deadline exceeded')
+        finally:
+            self._slots.release()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def completion_client():
+    """
+    Общий для процесса клиент, настроенный из settings.OPENAI_*
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = CompletionClient(
+                url=settings.OPENAI_URL,
+                api_key=settings.OPENAI_API_KEY,
+                model=settings.OPENAI_MODEL,
+                timeout=settings.OPENAI_TIMEOUT,
+                deadline=settings.OPENAI_DEADLINE,
+                max_retries=settings.OPENAI_MAX_RETRIES,
+                max_concurrency=settings.OPENAI_MAX_CONCURRENCY,
+            )
+        return _client
+
+
+def reset_completion_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
@@ -0,0 +1,166 @@
+import copy
+import os
+import random
+import string
+import tempfile
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models.functions import Lower
+
+from cores import search
+from cores.models import Book
+
+
+ALIAS = 'index_benchmark'
+# Последняя миграция без индексов по горячим колонкам и миграция, которая их добавляет
+BEFORE = '0019_facets'
+AFTER = '0020_book_hot_column_indexes'
+
+INSERT = (
+    'INSERT INTO cores_book (isbn13, isbn10, title, authors, categories, published_year, average_rating, '
+    'num_pages, ratings_count, favorites_count, discussions_count, comments_count) '
+    'VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, 0, 0, 0)'
+)
+
+
+def book_queries(alias):
+    """
+    Запросы, которые выполняют представления каталога: (описание, queryset)
+    """
+    books = Book.objects.using(alias)
+    return (
+        ('BookSearchView: title__icontains', books.filter(title__icontains='lorem').values_list('id', flat=True)),
+        ('начало названия (Lower(title))',
+         books.annotate(title_lower=Lower('title')).filter(title_lower__gte='lor', title_lower__lt='los')
+         .order_by('title_lower', 'id').values_list('id', flat=True)[:20]),
+        ('сортировка по названию', books.order_by(Lower('title'), 'id').values_list('id', flat=True)[:20]),
+        ('сортировка по числу оценок', books.order_by('-ratings_count', '-id').values_list('id', flat=True)[:20]),
+        ('сортировка по рейтингу',
+         books.order_by('-average_rating', '-ratings_count', '-id').values_list('id', flat=True)[:20]),
+        ('год 1995-1999 по рейтингу',
+         books.filter(published_year__range=(1995, 1999)).order_by('-average_rating')
+         .values_list('id', flat=True)[:20]),
+        ('по числу оценок, OFFSET 200000',
+         books.order_by('-ratings_count', '-id').values_list('id', flat=True)[200000:200020]),
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Планы и время запросов каталога на синтетической базе до и после миграции '
+        f'{AFTER}. База создается отдельно от рабочей и удаляется после замера'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000, help='Количество книг в синтетическом каталоге')
+        parser.add_argument('--repeat', type=int, default=5, help='Повторов каждого запроса (берется лучшее время)')
+
+    def handle(self, *args, **options):
+        if options['rows'] < 1 or options['repeat'] < 1:
+            raise CommandError('Неверные параметры замера')
+
+        default = connections['default']
+        if default.vendor not in ('sqlite', 'postgresql'):
+            raise CommandError(f'Замер поддерживает SQLite и PostgreSQL, а не {default.vendor}')
+
+        settings_dict = copy.deepcopy(default.settings_dict)
+        directory = None
+        if default.vendor == 'sqlite':
+            # Файл, а не база в памяти: чтения должны идти через страничный кэш, как в рабочей базе
+            directory = tempfile.TemporaryDirectory()
+            settings_dict['TEST']['NAME'] = os.path.join(directory.name, 'benchmark.sqlite3')
+        else:
+            settings_dict['TEST']['NAME'] = f"{settings_dict['NAME']}_index_benchmark"
+        connections.settings[ALIAS] = settings_dict
+        connection = connections[ALIAS]
+        original_name = settings_dict['NAME']
+
+        self.stdout.write('Создание базы...')
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            call_command('migrate', 'cores', BEFORE, database=ALIAS, verbosity=0)
+
+            started = time.perf_counter()
+            self.fill(connection, options['rows'])
+            self.stdout.write(f"{options['rows']} книг записано за {time.perf_counter() - started:.1f} с\n")
+
+            self.stdout.write(f'До миграции ({BEFORE}):')
+            before = self.measure(connection, options['repeat'])
+
+            started = time.perf_counter()
+            call_command('migrate', 'cores', AFTER, database=ALIAS, verbosity=0)
+            self.analyze(connection)
+            self.stdout.write(f'\nМиграция {AFTER}: {time.perf_counter() - started:.1f} с\n')
+
+            self.stdout.write(f'После миграции ({AFTER}):')
+            after = self.measure(connection, options['repeat'])
+
+            self.stdout.write('\nИтог:')
+            for (name, old), (_, new) in zip(before, after):
+                self.stdout.write(f'{name:<42} {old:9.2f} мс -> {new:9.2f} мс  (x{old / max(new, 0.001):.0f})')
+            # Подсказки /api/autocomplete/ строятся по индексу в памяти (AutoComplete), SQL там нет
+        finally:
+            connection.creation.destroy_test_db(original_name, verbosity=0)
+            connection.close()
+            del connections[ALIAS]
+            del connections.settings[ALIAS]
+            if directory is not None:
+                directory.cleanup()
+
+    def fill(self, connection, rows):
+        rng = random.Random(0)
+        words = [
+            ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9))) for _ in range(5000)
+        ] + ['lorem', 'ipsum']
+        authors = [f'{rng.choice(words).title()} {rng.choice(words).title()}' for _ in range(50000)]
+        categories = [rng.choice(words).title() for _ in range(300)]
+
+        with connection.cursor() as cursor:
+            # Полнотекстовый индекс не участвует в замере и только замедляет вставку
+            if connection.vendor == 'sqlite':
+                for statement in search.SQLITE_DROP:
+                    cursor.execute(statement)
+            else:
+                cursor.execute(search.POSTGRES_DROP_INDEX)
+
+        batch_size = 10000
+        for start in range(0, rows, batch_size):
+            batch = [
+                (
+                    f'{number:013d}', f'{number:010d}',
+                    ' '.join(rng.choice(words) for _ in range(rng.randint(1, 5))).capitalize(),
+                    '; '.join(rng.sample(authors, rng.randint(1, 2))),
+                    rng.choice(categories),
+                    rng.randint(1900, 2024),
+                    round(rng.uniform(1, 5), 2),
+                    rng.randint(40, 1200),
+                    int(rng.paretovariate(1.2) * 10),
+                )
+                for number in range(start, min(start + batch_size, rows))
+            ]
+            with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+                cursor.executemany(INSERT, batch)
+        self.analyze(connection)
+
+    def analyze(self, connection):
+        # Статистика для планировщика, как после обычной работы базы
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def measure(self, connection, repeat):
+        results = []
+        for name, queryset in book_queries(connection.alias):
+            plan = ' | '.join(line.strip() for line in queryset.explain().splitlines()[:3])
+            timings = []
+            for _ in range(repeat + 1):
+                started = time.perf_counter()
+                list(queryset.all())
+                timings.append(time.perf_counter() - started)
+            # Первый прогон прогревает кэш и не учитывается
+            best = min(timings[1:]) * 1000
+            results.append((name, best))
+            self.stdout.write(f'{name:<42} {best:9.2f} мс  {plan[:110]}')
+        return results
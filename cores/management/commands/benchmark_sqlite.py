@@ -0,0 +1,121 @@
+import multiprocessing
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+
+from cores.models import Book, CustomUser, UserFavoriteBook
+
+
+# Сообщения SQLITE_BUSY и SQLITE_LOCKED: только их бенчмарк считает ошибками блокировки
+LOCK_ERRORS = ('database is locked', 'database table is locked', 'busy')
+
+
+def is_lock_error(error):
+    message = str(error).lower()
+    return any(text in message for text in LOCK_ERRORS)
+
+
+def run_worker(path, tuned, duration, write_ratio, number):
+    """
+    Нагрузка одного процесса, как у воркера gunicorn: чтение страницы каталога и книги
+    или запись (добавление/удаление избранного, с сигналами счетчиков и рекомендаций)
+    """
+    connection = connections['default']
+    connection.close()
+    connection.settings_dict['NAME'] = path
+    connection.settings_dict['OPTIONS'] = {'transaction_mode': 'IMMEDIATE'} if tuned else {}
+    settings.SQLITE_TUNING = tuned
+
+    rng = random.Random(number)
+    user = CustomUser.objects.create_user(
+        f'bench-{number}-{time.time_ns()}@example.com', f'bench{number}{time.time_ns()}'[:15], 'Bench'
+    )
+    book_ids = list(Book.objects.order_by('id').values_list('id', flat=True)[:2000])
+
+    reads, writes, errors = [], [], 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            if rng.random() < write_ratio:
+                favorite, created = UserFavoriteBook.objects.get_or_create(user=user, book_id=rng.choice(book_ids))
+                if not created:
+                    favorite.delete()
+                writes.append(time.perf_counter() - started)
+            else:
+                list(Book.objects.order_by('-favorites_count', '-id').values('id', 'title')[:20])
+                Book.objects.get(pk=rng.choice(book_ids))
+                reads.append(time.perf_counter() - started)
+        except OperationalError as error:
+            # Остальные ошибки (нет таблицы, диск заполнен и т. п.) — не нагрузка, а поломка
+            if not is_lock_error(error):
+                raise
+            errors += 1
+
+    connection.close()
+    return reads, writes, errors
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнение конкурентных чтений и записей в SQLite без настроек и с SQLITE_TUNING_PRAGMAS. '
+        'Работает на копии текущей базы, несколько процессов имитируют воркеры gunicorn'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Количество процессов')
+        parser.add_argument('--duration', type=float, default=5.0, help='Длительность каждого режима, в секундах')
+        parser.add_argument('--write-ratio', type=float, default=0.2, help='Доля операций записи')
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError('Команда сравнивает режимы SQLite, а текущая база — не SQLite')
+        if options['workers'] < 1 or options['duration'] <= 0 or not 0 <= options['write_ratio'] <= 1:
+            raise CommandError('Неверные параметры нагрузки')
+
+        source = str(settings.DATABASES['default']['NAME'])
+        for mode, tuned in (('default', False), ('tuned', True)):
+            # Копия лежит рядом с исходной базой: стоимость fsync зависит от диска
+            with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(source))) as directory:
+                path = os.path.join(directory, 'benchmark.sqlite3')
+                self.copy_database(source, path)
+
+                # Дочерние процессы не должны наследовать открытые соединения
+                connections.close_all()
+                context = multiprocessing.get_context('fork')
+                with context.Pool(options['workers']) as pool:
+                    results = pool.starmap(
+                        run_worker,
+                        [(path, tuned, options['duration'], options['write_ratio'], number)
+                         for number in range(options['workers'])],
+                    )
+            self.report(mode, results, options['duration'])
+
+    def copy_database(self, source, target):
+        # backup дает согласованную копию, даже если база сейчас используется
+        with sqlite3.connect(source) as original, sqlite3.connect(target) as copy:
+            original.backup(copy)
+        original.close()
+        copy.close()
+
+    def report(self, mode, results, duration):
+        reads = [latency for worker_reads, _, _ in results for latency in worker_reads]
+        writes = [latency for _, worker_writes, _ in results for latency in worker_writes]
+        errors = sum(worker_errors for _, _, worker_errors in results)
+        self.stdout.write(
+            f'{mode:>8}: чтений {len(reads) / duration:7.0f}/с (p95 {self.p95(reads):6.1f} мс), '
+            f'записей {len(writes) / duration:6.0f}/с (p95 {self.p95(writes):6.1f} мс), '
+            f'ошибок блокировки {errors}'
+        )
+
+    def p95(self, latencies):
+        if len(latencies) < 2:
+            return 0.0
+        return statistics.quantiles(latencies, n=20)[-1] * 1000
@@ -0,0 +1,47 @@
+import time
+
+import openpyxl
+from django.core.management.base import BaseCommand, CommandError
+
+from cores.exporting import CHUNK_SIZE, DATASETS, FORMATS, detect_format, export_rows, stream_export, write_xlsx
+
+
+class Command(BaseCommand):
+    help = 'Потоковая выгрузка книг, категорий, избранного или обсуждений в CSV, JSONL или XLSX'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(DATASETS), help='Что выгружать')
+        parser.add_argument('--output', help='Файл для записи (по умолчанию — стандартный вывод, кроме XLSX)')
+        parser.add_argument('--format', choices=FORMATS, help='Формат (по умолчанию — по расширению --output или CSV)')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Сколько строк читать из базы за раз')
+
+    def handle(self, *args, **options):
+        dataset, output, chunk_size = options['dataset'], options['output'], options['chunk_size']
+        if chunk_size < 1:
+            raise CommandError('--chunk-size должен быть положительным')
+        try:
+            file_format = options['format'] or (detect_format(output) if output else 'csv')
+        except ValueError as error:
+            raise CommandError(error)
+
+        started = time.monotonic()
+        if file_format == 'xlsx':
+            if not output:
+                raise CommandError('Для XLSX нужно указать --output')
+            if not openpyxl.LXML:
+                self.stderr.write(self.style.WARNING(
+                    'lxml не установлен: XLSX будет собран в памяти целиком, для больших выгрузок используйте CSV или JSONL'
+                ))
+            header, rows = export_rows(dataset, chunk_size)
+            write_xlsx(header, rows, output, dataset)
+        elif output:
+            with open(output, 'w', encoding='utf-8', newline='') as file:
+                file.writelines(stream_export(dataset, file_format, chunk_size))
+        else:
+            for chunk in stream_export(dataset, file_format, chunk_size):
+                self.stdout.write(chunk, ending='')
+
+        if output:
+            self.stdout.write(self.style.SUCCESS(
+                f'Выгрузка {dataset} записана в {output} за {time.monotonic() - started:.1f} с'
+            ))
@@ -1,38 +1,17 @@
-import openpyxl
 from django.core.management.base import BaseCommand
-from cores.models import Book
+from cores.exporting import write_xlsx
+from cores.models import Category
 
 
 class Command(BaseCommand):
     help = 'Получение всех уникальных категорий и запись в Excel файл'
 
     def handle(self, *args, **kwargs):
-        # Шаг 1: Получить все уникальные категории
-        unique_categories = set()
+        # Категории читаются из справочника пачками и пишутся в режиме write_only,
+        # так что файл строится без загрузки всего списка в память
+        unique_categories = Category.objects.values_list('name').iterator(chunk_size=2000)
 
-        # Проходим по всем книгам и собираем категории
-        books = Book.objects.exclude(categories__isnull=True).exclude(categories__exact='')
-
-        for book in books:
-            # Предполагаем, что категории разделены запятыми
-            categories_list = book.categories.split(',')
-            for category in categories_list:
-                unique_categories.add(category.strip())  # Добавляем уникальные категории, убирая лишние пробелы
-
-        # Шаг 2: Создание и запись в Excel файл
-        workbook = openpyxl.Workbook()
-        sheet = workbook.active
-        sheet.title = "Уникальные категории"
-
-        # Добавляем заголовок
-        sheet.append(['Категория'])
-
-        # Записываем уникальные категории в файл
-        for category in sorted(unique_categories):
-            sheet.append([category])
-
-        # Шаг 3: Сохранить Excel файл
         output_file = 'unique_categories.xlsx'
-        workbook.save(output_file)
+        write_xlsx(['Категория'], unique_categories, output_file, "Уникальные категории")
 
         self.stdout.write(self.style.SUCCESS(f'Уникальные категории успешно записаны в файл {output_file}'))
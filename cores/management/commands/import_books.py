@@ -1,53 +1,150 @@
-import openpyxl
-from django.core.management.base import BaseCommand
-from cores.models import Book
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from cores.catalog_cache import bump_catalog_version
+from cores.importing import (
+    FORMATS,
+    Checkpoint,
+    batch_ranges,
+    clean_range,
+    clean_rows,
+    detect_format,
+    init_worker,
+    read_rows,
+    upsert_books,
+)
 
 
 class Command(BaseCommand):
-    help = 'Импорт данных о книгах из файла Excel'
-
-    def handle(self, *args, **kwargs):
-        workbook = openpyxl.load_workbook('./cores/books.xlsx')
-        sheet = workbook.active
-
-        # Получаем названия колонок из первой строки
-        headers = [cell.value for cell in sheet[1]]
-        print(headers)
-        print()
-
-        for row in sheet.iter_rows(min_row=2, values_only=True):  # Пропускаем заголовки
-            data = dict(zip(headers, row))
-
-            isbn13 = data['isbn13']
-            isbn10 = data['isbn10']
-            title = data['title']
-            subtitle = data.get('subtitle', '')
-            authors = data['authors'] or 'Неизвестный автор'
-            categories = data.get('categories', '')
-            thumbnail = data.get('thumbnail', '')
-            description = data.get('description', '')
-            published_year = int(data['published_year']) if data['published_year'] else None
-            average_rating = float(data['average_rating']) if data['average_rating'] else None
-            num_pages = int(data['num_pages']) if data['num_pages'] else None
-            ratings_count = int(data['ratings_count']) if data['ratings_count'] else None
-
-            book, created = Book.objects.update_or_create(
-                isbn13=isbn13,
-                defaults={
-                    'isbn10': isbn10,
-                    'title': title,
-                    'subtitle': subtitle,
-                    'authors': authors,
-                    'categories': categories,
-                    'thumbnail': thumbnail,
-                    'description': description,
-                    'published_year': published_year,
-                    'average_rating': average_rating,
-                    'num_pages': num_pages,
-                    'ratings_count': ratings_count,
-                }
-            )
-            if created:
-                self.stdout.write(self.style.SUCCESS(f'Книга "{title}" добавлена в базу данных'))
+    help = 'Импорт данных о книгах из файла Excel, CSV или JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='./cores/books.xlsx', help='Путь к файлу с книгами')
+        parser.add_argument('--format', choices=FORMATS, help='Формат файла (по умолчанию — по расширению)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Количество строк в одной транзакции')
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Количество процессов для разбора и проверки строк CSV и JSONL (запись всегда идет в одном процессе). '
+                 'Excel читается последовательно: разобрать часть книги xlsx, не читая ее с начала, нельзя',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='Файл состояния: после каждой пачки в нем сохраняется прогресс, '
+                 'повторный запуск с тем же файлом продолжает импорт с места остановки',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть положительным')
+        if options['workers'] < 1:
+            raise CommandError('--workers должен быть положительным')
+
+        path, batch_size = options['path'], options['batch_size']
+        try:
+            file_format = options['format'] or detect_format(path)
+            checkpoint = Checkpoint(options['checkpoint'], path) if options['checkpoint'] else None
+            start = checkpoint.load() if checkpoint else 0
+            if start:
+                self.stdout.write(f'Продолжаем импорт с записи {start + 1}')
+
+            parallel = options['workers'] > 1
+            if parallel and file_format == 'xlsx':
+                self.stderr.write(self.style.WARNING('Excel читается в одном процессе, --workers не используется'))
+                parallel = False
+            if parallel:
+                batches = self.parallel_batches(path, file_format, start, batch_size, options['workers'])
             else:
-                self.stdout.write(self.style.WARNING(f'Книга "{title}" уже существует, обновлена'))
+                batches = self.sequential_batches(path, file_format, start, batch_size)
+            try:
+                stats = self.import_batches(batches, start, checkpoint)
+            finally:
+                # bulk_create не вызывает сигналы Book, поэтому кэш каталога сбрасывается здесь,
+                # в том числе если импорт прервался после части записанных пачек
+                bump_catalog_version()
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+
+        if checkpoint:
+            checkpoint.clear()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Импорт завершен: записано {stats["written"]}, пропущено {stats["skipped"]} '
+            f'из {stats["processed"]} строк за {stats["elapsed"]:.1f} с ({stats["rate"]:.0f} строк/с)'
+        ))
+
+    def sequential_batches(self, path, file_format, start, batch_size):
+        rows = read_rows(path, file_format, start)
+        first_number = start + 1
+        while True:
+            chunk = list(islice(rows, batch_size))
+            if not chunk:
+                break
+            yield clean_rows(chunk, first_number)
+            first_number += len(chunk)
+
+    def parallel_batches(self, path, file_format, start, batch_size, workers):
+        """
+        Разбирает и проверяет пачки в пуле процессов. Результаты отдаются строго
+        по порядку пачек, а впереди записи готовится не больше двух пачек на процесс,
+        чтобы не копить их в памяти
+        """
+        # Дочерние процессы не должны наследовать открытые соединения с базой
+        connections.close_all()
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker)
+        try:
+            tasks = self.parallel_tasks(executor, path, file_format, start, batch_size)
+            pending = deque(islice(tasks, workers * 2))
+            while pending:
+                result = pending.popleft().result()
+                pending.extend(islice(tasks, 1))
+                yield result
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    def parallel_tasks(self, executor, path, file_format, start, batch_size):
+        # Здесь файл только просматривается по строкам в поисках границ пачек, а разбор
+        # каждой пачки (самая долгая часть) идет в пуле: процесс получает диапазон байтов,
+        # сам читает его из файла и возвращает очищенные строки
+        first_number = start + 1
+        for begin, end, count in batch_ranges(path, file_format, start, batch_size):
+            yield executor.submit(clean_range, path, file_format, begin, end, first_number)
+            first_number += count
+
+    def import_batches(self, batches, start, checkpoint):
+        processed = written = skipped = 0
+        started = time.monotonic()
+
+        for count, cleaned, row_errors in batches:
+            for number, error in row_errors:
+                self.stderr.write(self.style.WARNING(f'Запись {number} пропущена: {error}'))
+            skipped += len(row_errors)
+
+            if cleaned:
+                saved, errors = upsert_books(cleaned)
+                written += saved
+                skipped += len(errors)
+                for isbn13, error in errors:
+                    self.stderr.write(self.style.WARNING(f'Книга {isbn13} пропущена: {error}'))
+
+            processed += count
+            if checkpoint:
+                checkpoint.save(start + processed)
+
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'Обработано {start + processed} строк ({processed / elapsed if elapsed else 0:.0f} строк/с)'
+            )
+
+        elapsed = time.monotonic() - started
+        return {
+            'processed': processed,
+            'written': written,
+            'skipped': skipped,
+            'elapsed': elapsed,
+            'rate': processed / elapsed if elapsed else 0,
+        }
@@ -0,0 +1,77 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from cores.models import RecommendationSnapshot, UserFavoriteBook, UserLikedAuthors, UserLikedCategories, UserProfile
+from cores.recommendations import RecommendationModel, describe_match
+
+
+class Command(BaseCommand):
+    help = 'Предрасчет рекомендаций для всех пользователей и сохранение их в RecommendationSnapshot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=50, help='Сколько рекомендаций сохранять для пользователя')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Сколько пользователей читать за раз')
+
+    def handle(self, *args, **options):
+        limit, chunk_size = options['limit'], options['chunk_size']
+        if limit < 1 or chunk_size < 1:
+            raise CommandError('--limit и --chunk-size должны быть положительными')
+
+        started = time.monotonic()
+        # Отдельная модель, а не общая для процесса: снимки должны строиться по актуальным данным
+        model = RecommendationModel.build()
+        self.stdout.write(f'Модель построена за {time.monotonic() - started:.1f} с')
+
+        processed, last_id = 0, 0
+        while True:
+            profiles = list(
+                UserProfile.objects.filter(id__gt=last_id).order_by('id').values_list('id', 'user_id')[:chunk_size]
+            )
+            if not profiles:
+                break
+            last_id = profiles[-1][0]
+
+            self.save_snapshots(model, profiles, limit)
+            processed += len(profiles)
+            elapsed = time.monotonic() - started
+            self.stdout.write(f'Обработано {processed} пользователей ({processed / elapsed:.0f} в секунду)')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Рекомендации сохранены для {processed} пользователей за {time.monotonic() - started:.1f} с'
+        ))
+
+    def save_snapshots(self, model, profiles, limit):
+        profile_ids = [profile_id for profile_id, _ in profiles]
+        user_ids = [user_id for _, user_id in profiles]
+
+        favorites = {user_id: [] for user_id in user_ids}
+        for user_id, book_id in UserFavoriteBook.objects.filter(user_id__in=user_ids).values_list('user_id', 'book_id'):
+            favorites[user_id].append(book_id)
+        categories = {profile_id: [] for profile_id in profile_ids}
+        for profile_id, name in UserLikedCategories.objects.filter(user_id__in=profile_ids).values_list('user_id', 'category'):
+            categories[profile_id].append(name)
+        authors = {profile_id: [] for profile_id in profile_ids}
+        for profile_id, name in UserLikedAuthors.objects.filter(user_id__in=profile_ids).values_list('user_id', 'author'):
+            authors[profile_id].append(name)
+
+        tastes = [(favorites[user_id], categories[profile_id], authors[profile_id]) for profile_id, user_id in profiles]
+        ranked = model.recommend_many(tastes, limit)
+
+        snapshots = [
+            RecommendationSnapshot(
+                user_id=user_id,
+                recommended_books=[
+                    {"id": book_id, "comment": describe_match(matched)} for book_id, _, matched in recommendations
+                ],
+            )
+            for (_, user_id), recommendations in zip(profiles, ranked)
+        ]
+        with transaction.atomic():
+            RecommendationSnapshot.objects.bulk_create(
+                snapshots,
+                update_conflicts=True,
+                unique_fields=['user'],
+                update_fields=['recommended_books', 'updated_at'],
+            )
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from cores.counters import recount_books, recount_discussions
+
+
+class Command(BaseCommand):
+    help = 'Пересчет денормализованных счетчиков книг и обсуждений (избранное, обсуждения, комментарии, активность)'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        with transaction.atomic():
+            discussions = recount_discussions()
+            books = recount_books()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Счетчики пересчитаны: {books} книг, {discussions} обсуждений за {time.monotonic() - started:.1f} с'
+        ))
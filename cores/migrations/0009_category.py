@@ -0,0 +1,49 @@
+# Generated by Django 5.1.1 on 2026-10-18 13:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cores', '0008_comment_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Category',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Name')),
+            ],
+            options={
+                'verbose_name': 'Category',
+                'verbose_name_plural': 'Categories',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='customuser',
+            name='full_name',
+            field=models.CharField(max_length=255, verbose_name='full_name'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='normalized_categories',
+            field=models.ManyToManyField(blank=True, related_name='books', to='cores.category'),
+        ),
+        migrations.CreateModel(
+            name='UserLikedAuthors',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('author', models.CharField(max_length=255)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='liked_authors', to='cores.userprofile')),
+            ],
+            options={
+                'verbose_name': 'User Liked Author',
+                'verbose_name_plural': 'User Liked Authors',
+                'unique_together': {('user', 'author')},
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Заполнение таблицы Category из строкового поля Book.categories
+
+from django.db import migrations
+
+
+def populate_categories(apps, schema_editor):
+    Book = apps.get_model('cores', 'Book')
+    Category = apps.get_model('cores', 'Category')
+    BookCategory = Book.normalized_categories.through
+    db_alias = schema_editor.connection.alias
+
+    book_names = {}
+    books = Book.objects.using(db_alias).exclude(categories__isnull=True).exclude(categories__exact='')
+    for book_id, categories in books.values_list('id', 'categories').iterator(chunk_size=2000):
+        names = {name.strip() for name in categories.split(',') if name.strip()}
+        if names:
+            book_names[book_id] = names
+
+    all_names = set().union(*book_names.values()) if book_names else set()
+    Category.objects.using(db_alias).bulk_create([Category(name=name) for name in sorted(all_names)], ignore_conflicts=True)
+    category_ids = dict(Category.objects.using(db_alias).values_list('name', 'id'))
+
+    BookCategory.objects.using(db_alias).bulk_create(
+        [
+            BookCategory(book_id=book_id, category_id=category_ids[name])
+            for book_id, names in book_names.items()
+            for name in names
+        ],
+        batch_size=2000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cores', '0009_category'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_categories, migrations.RunPython.noop),
+    ]
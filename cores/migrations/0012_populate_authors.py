@@ -0,0 +1,42 @@
+# Заполнение таблицы Author из строкового поля Book.authors (авторы разделены ';')
+
+from django.db import migrations
+
+
+def populate_authors(apps, schema_editor):
+    Book = apps.get_model('cores', 'Book')
+    Author = apps.get_model('cores', 'Author')
+    BookAuthor = Book.normalized_authors.through
+    db_alias = schema_editor.connection.alias
+
+    book_names = {}
+    books = Book.objects.using(db_alias).exclude(authors__isnull=True).exclude(authors__exact='')
+    for book_id, authors in books.values_list('id', 'authors').iterator(chunk_size=2000):
+        names = {name.strip() for name in authors.split(';') if name.strip()}
+        if names:
+            book_names[book_id] = names
+
+    all_names = set().union(*book_names.values()) if book_names else set()
+    Author.objects.using(db_alias).bulk_create([Author(name=name) for name in sorted(all_names)], ignore_conflicts=True)
+    author_ids = dict(Author.objects.using(db_alias).values_list('name', 'id'))
+
+    BookAuthor.objects.using(db_alias).bulk_create(
+        [
+            BookAuthor(book_id=book_id, author_id=author_ids[name])
+            for book_id, names in book_names.items()
+            for name in names
+        ],
+        batch_size=2000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cores', '0011_author'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_authors, migrations.RunPython.noop),
+    ]
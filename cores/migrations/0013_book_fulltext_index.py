@@ -0,0 +1,40 @@
+# Полнотекстовый индекс по книгам: FTS5 для SQLite, GIN по tsvector для PostgreSQL
+
+from django.db import migrations
+
+from cores import search
+
+
+def create_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    with schema_editor.connection.cursor() as cursor:
+        if vendor == 'sqlite':
+            if not search.sqlite_has_fts5(cursor):
+                return
+            cursor.execute(search.SQLITE_CREATE_TABLE)
+            for statement in search.SQLITE_CREATE_TRIGGERS:
+                cursor.execute(statement)
+            cursor.execute(search.SQLITE_REBUILD)
+        elif vendor == 'postgresql':
+            cursor.execute(search.POSTGRES_CREATE_INDEX)
+
+
+def drop_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    with schema_editor.connection.cursor() as cursor:
+        if vendor == 'sqlite':
+            for statement in search.SQLITE_DROP:
+                cursor.execute(statement)
+        elif vendor == 'postgresql':
+            cursor.execute(search.POSTGRES_DROP_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cores', '0012_populate_authors'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
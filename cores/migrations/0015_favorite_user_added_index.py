@@ -0,0 +1,17 @@
+# Generated by Django 5.1.1 on 2026-10-18 13:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cores', '0014_recommendationsnapshot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userfavoritebook',
+            index=models.Index(fields=['user', 'added_at'], name='cores_favorite_user_added'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.1 on 2026-10-18 13:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cores', '0015_favorite_user_added_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['discussion', 'created_at'], name='cores_comment_disc_created'),
+        ),
+        migrations.AddIndex(
+            model_name='discussion',
+            index=models.Index(fields=['book', 'created_at'], name='cores_discussion_book_created'),
+        ),
+        migrations.AddIndex(
+            model_name='discussion',
+            index=models.Index(fields=['created_at'], name='cores_discussion_created'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.1.1 on 2026-10-18 13:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cores', '0016_discussion_comment_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Comments Count'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='discussions_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Discussions Count'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Favorites Count'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='last_activity_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Last Activity'),
+        ),
+        migrations.AddField(
+            model_name='discussion',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='discussion',
+            name='last_activity_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['-favorites_count', '-id'], name='cores_book_favorites_count'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['-discussions_count', '-id'], name='cores_book_discussions_count'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['-comments_count', '-id'], name='cores_book_comments_count'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['-last_activity_at', '-id'], name='cores_book_last_activity'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Начальные значения счетчиков Book и Discussion (дальше их ведут сигналы и repair_counters)
+
+from django.db import migrations
+from django.db.models import Count, F, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest
+
+
+def aggregate(model, field, value):
+    return Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(value=value).values('value')
+    )
+
+
+def populate_counters(apps, schema_editor):
+    Book = apps.get_model('cores', 'Book')
+    Discussion = apps.get_model('cores', 'Discussion')
+    Comment = apps.get_model('cores', 'Comment')
+    UserFavoriteBook = apps.get_model('cores', 'UserFavoriteBook')
+    db_alias = schema_editor.connection.alias
+
+    Discussion.objects.using(db_alias).update(
+        comments_count=Coalesce(aggregate(Comment, 'discussion', Count('pk')), 0),
+        last_activity_at=Coalesce(aggregate(Comment, 'discussion', Max('created_at')), F('created_at')),
+    )
+
+    last_favorite = aggregate(UserFavoriteBook, 'book', Max('added_at'))
+    last_discussion = aggregate(Discussion, 'book', Max('last_activity_at'))
+    Book.objects.using(db_alias).update(
+        favorites_count=Coalesce(aggregate(UserFavoriteBook, 'book', Count('pk')), 0),
+        discussions_count=Coalesce(aggregate(Discussion, 'book', Count('pk')), 0),
+        comments_count=Coalesce(aggregate(Discussion, 'book', Sum('comments_count')), 0),
+        last_activity_at=Greatest(Coalesce(last_favorite, last_discussion), Coalesce(last_discussion, last_favorite)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cores', '0017_book_discussion_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.1 on 2026-10-18 13:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cores', '0018_populate_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetValue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(choices=[('category', 'Category'), ('author', 'Author'), ('year', 'Decade'), ('rating', 'Rating')], max_length=16, verbose_name='Facet')),
+                ('value', models.CharField(max_length=255, verbose_name='Value')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Books')),
+            ],
+            options={
+                'verbose_name': 'Facet Value',
+                'verbose_name_plural': 'Facet Values',
+                'indexes': [models.Index(fields=['facet', '-count', 'value'], name='cores_facetvalue_count')],
+                'constraints': [models.UniqueConstraint(fields=('facet', 'value'), name='cores_facetvalue_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='BookFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(choices=[('category', 'Category'), ('author', 'Author'), ('year', 'Decade'), ('rating', 'Rating')], max_length=16, verbose_name='Facet')),
+                ('value', models.CharField(max_length=255, verbose_name='Value')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='cores.book')),
+            ],
+            options={
+                'verbose_name': 'Book Facet',
+                'verbose_name_plural': 'Book Facets',
+                'constraints': [models.UniqueConstraint(fields=('facet', 'value', 'book'), name='cores_bookfacet_unique')],
+            },
+        ),
+    ]
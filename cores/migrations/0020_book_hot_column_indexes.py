@@ -0,0 +1,51 @@
+# Generated by Django 5.1.1 on 2026-10-18 13:41
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+from cores import search
+
+
+def create_trigram_index(apps, schema_editor):
+    # Только PostgreSQL: в SQLite LIKE '%...%' не использует индексы, там есть FTS5 (mode=fulltext)
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        if not search.postgres_has_trigram(cursor):
+            return
+        for statement in search.POSTGRES_CREATE_TRIGRAM:
+            cursor.execute(statement)
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(search.POSTGRES_DROP_TRIGRAM)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cores', '0019_facets'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(django.db.models.functions.text.Lower('title'), models.F('id'), name='cores_book_title_lower'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['-ratings_count', '-id'], name='cores_book_ratings_count'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['-average_rating', '-ratings_count', '-id'], name='cores_book_rating'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['published_year', '-average_rating'], name='cores_book_year_rating'),
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
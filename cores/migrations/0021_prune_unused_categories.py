@@ -0,0 +1,19 @@
+# Удаление категорий, у которых не осталось книг (раньше они не удалялись при смене категорий книги)
+
+from django.db import migrations
+
+
+def prune_categories(apps, schema_editor):
+    Category = apps.get_model('cores', 'Category')
+    Category.objects.using(schema_editor.connection.alias).filter(books__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cores', '0020_book_hot_column_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(prune_categories, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Удаление авторов, у которых не осталось книг (раньше они не удалялись при смене авторов книги)
+
+from django.db import migrations
+
+
+def prune_authors(apps, schema_editor):
+    Author = apps.get_model('cores', 'Author')
+    Author.objects.using(schema_editor.connection.alias).filter(books__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cores', '0021_prune_unused_categories'),
+    ]
+
+    operations = [
+        migrations.RunPython(prune_authors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.1 on 2026-10-18 14:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cores', '0022_prune_unused_authors'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(verbose_name='Version')),
+                ('modified_at', models.DateTimeField(verbose_name='Catalog modified at')),
+                ('activity_at', models.DateTimeField(verbose_name='Activity modified at')),
+            ],
+            options={
+                'verbose_name': 'Catalog State',
+                'verbose_name_plural': 'Catalog State',
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Триггер FTS5 на UPDATE срабатывает только при изменении индексируемых полей книги,
+# а не при каждом обновлении счетчиков активности
+
+from django.db import migrations
+
+from cores import search
+
+
+def recreate_update_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        if not search.sqlite_fts_exists(cursor):
+            return
+        # Старый триггер с тем же именем не заменится через CREATE TRIGGER IF NOT EXISTS
+        cursor.execute(f"DROP TRIGGER IF EXISTS {search.SQLITE_FTS_TABLE}_au")
+        search.ensure_sqlite_triggers(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cores', '0023_catalog_state'),
+    ]
+
+    operations = [
+        migrations.RunPython(recreate_update_trigger, migrations.RunPython.noop),
+    ]
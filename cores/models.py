@@ -1,5 +1,7 @@
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 
@@ -95,6 +97,57 @@ class UserProfile(models.Model):
     def get_liked_authors(self):
         return self.user.liked_authors.all()
 
+
+# Разделители в строковых полях Book.categories и Book.authors
+CATEGORY_SEPARATOR = ','
+AUTHOR_SEPARATOR = ';'
+
+
+def _split_names(value, separator):
+    if not value:
+        return []
+    names = (name.strip() for name in value.split(separator))
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def split_categories(value):
+    """
+    Разбивает строку категорий книги на список уникальных названий (порядок сохраняется)
+    """
+    return _split_names(value, CATEGORY_SEPARATOR)
+
+
+def split_authors(value):
+    """
+    Разбивает строку авторов книги на список уникальных имен (порядок сохраняется)
+    """
+    return _split_names(value, AUTHOR_SEPARATOR)
+
+
+class Category(models.Model):
+    name = models.CharField(_('Name'), max_length=255, unique=True)
+
+    class Meta:
+        ordering = ['name']
+        verbose_name = _('Category')
+        verbose_name_plural = _('Categories')
+
+    def __str__(self):
+        return self.name
+
+
+class Author(models.Model):
+    name = models.CharField(_('Name'), max_length=255, unique=True)
+
+    class Meta:
+        ordering = ['name']
+        verbose_name = _('Author')
+        verbose_name_plural = _('Authors')
+
+    def __str__(self):
+        return self.name
+
+
 class Book(models.Model):
     isbn13 = models.CharField(_('ISBN 13'), max_length=13, unique=True)
     isbn10 = models.CharField(_('ISBN 10'), max_length=10, unique=True)
@@ -109,9 +162,75 @@ class Book(models.Model):
     num_pages = models.PositiveIntegerField(_('Number of Pages'), blank=True, null=True)
     ratings_count = models.PositiveIntegerField(_('Ratings Count'), blank=True, null=True)
 
+    # Нормализованные категории, синхронизируются со строковым полем categories
+    normalized_categories = models.ManyToManyField(Category, related_name='books', blank=True)
+    # Нормализованные авторы, синхронизируются со строковым полем authors
+    normalized_authors = models.ManyToManyField(Author, related_name='books', blank=True)
+
+    # Денормализованные счетчики, обновляются сигналами (cores/counters.py),
+    # пересчитываются командой repair_counters
+    favorites_count = models.PositiveIntegerField(_('Favorites Count'), default=0)
+    discussions_count = models.PositiveIntegerField(_('Discussions Count'), default=0)
+    comments_count = models.PositiveIntegerField(_('Comments Count'), default=0)
+    last_activity_at = models.DateTimeField(_('Last Activity'), blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # Название без учета регистра: сортировка по алфавиту и поиск по началу названия
+            models.Index(Lower('title'), 'id', name='cores_book_title_lower'),
+            # Сортировка по числу оценок и по рейтингу (при равном рейтинге — по числу оценок)
+            models.Index(fields=['-ratings_count', '-id'], name='cores_book_ratings_count'),
+            models.Index(fields=['-average_rating', '-ratings_count', '-id'], name='cores_book_rating'),
+            # Фильтр по году (или диапазону лет) с сортировкой по рейтингу
+            models.Index(fields=['published_year', '-average_rating'], name='cores_book_year_rating'),
+            # Сортировка по популярности и активности
+            models.Index(fields=['-favorites_count', '-id'], name='cores_book_favorites_count'),
+            models.Index(fields=['-discussions_count', '-id'], name='cores_book_discussions_count'),
+            models.Index(fields=['-comments_count', '-id'], name='cores_book_comments_count'),
+            models.Index(fields=['-last_activity_at', '-id'], name='cores_book_last_activity'),
+        ]
+
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.sync_categories()
+        self.sync_authors()
+
+    def sync_categories(self):
+        """
+        Приводит связи с Category в соответствие со строкой categories
+        """
+        _sync_names(self.normalized_categories, Category, split_categories(self.categories))
+
+    def sync_authors(self):
+        """
+        Приводит связи с Author в соответствие со строкой authors
+        """
+        _sync_names(self.normalized_authors, Author, split_authors(self.authors))
+
+
+def _sync_names(related, model, names):
+    model.objects.bulk_create([model(name=name) for name in names], ignore_conflicts=True)
+    previous = set(related.values_list('id', flat=True))
+    current = list(model.objects.filter(name__in=names))
+    related.set(current)
+    prune_unused_names(model, previous - {item.id for item in current})
+
+
+def prune_unused_names(model, ids=None):
+    """
+    Удаляет категории или авторов (model) без единой книги, только среди ids (None — среди всех).
+    Иначе справочник продолжает предлагать названия, по которым нечего показать
+    """
+    unused = model.objects.filter(books__isnull=True)
+    if ids is not None:
+        if not ids:
+            return 0
+        unused = unused.filter(id__in=ids)
+    return unused.delete()[0]
+
     
 # ----------------
 class Discussion(models.Model):
@@ -120,10 +239,26 @@ class Discussion(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     author = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    comments_count = models.PositiveIntegerField(default=0)
+    last_activity_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # Обсуждения книги и общая лента, новые сначала (DiscussionListCreateAPIView)
+            models.Index(fields=['book', 'created_at'], name='cores_discussion_book_created'),
+            models.Index(fields=['created_at'], name='cores_discussion_created'),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.last_activity_at is None:
+            self.last_activity_at = timezone.now()
+        # Счетчики книги обновляются в post_save, в той же транзакции
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
 # ----------------
 class Comment(models.Model):
     discussion = models.ForeignKey(Discussion, related_name='comments', on_delete=models.CASCADE)
@@ -132,9 +267,20 @@ class Comment(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     author = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            # Комментарии обсуждения по порядку (CommentListCreateAPIView)
+            models.Index(fields=['discussion', 'created_at'], name='cores_comment_disc_created'),
+        ]
+
     def __str__(self):
         return f"Comment by {self.author.email} on {self.discussion.title}"
 
+    def save(self, *args, **kwargs):
+        # Счетчики обсуждения и книги обновляются в post_save, в той же транзакции
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
 # ----------------
 
 class UserLikedCategories(models.Model):
@@ -161,7 +307,7 @@ class UserLikedAuthors(models.Model):
         verbose_name_plural = _('User Liked Authors')
 
     def __str__(self):
-        return f"{self.user.email} likes {self.author}"
+        return f"{self.user.user.email} likes {self.author}"
 
 # ----------------
 # избранные
@@ -172,8 +318,94 @@ class UserFavoriteBook(models.Model):
 
     class Meta:
         unique_together = ('user', 'book')
+        indexes = [
+            # Избранное пользователя в порядке добавления (FavoriteBookView)
+            models.Index(fields=['user', 'added_at'], name='cores_favorite_user_added'),
+        ]
         verbose_name = _('Favorite Book')
         verbose_name_plural = _('Favorite Books')
 
     def __str__(self):
         return f"{self.user.email} added {self.book.title} to favorites"
+
+    def save(self, *args, **kwargs):
+        # Счетчик книги обновляется в post_save, в той же транзакции
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+# ----------------
+# Предрасчитанные рекомендации (команда precompute_recommendations)
+class RecommendationSnapshot(models.Model):
+    user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, related_name='recommendation_snapshot')
+    recommended_books = models.JSONField(_('Recommended books'), default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _('Recommendation Snapshot')
+        verbose_name_plural = _('Recommendation Snapshots')
+
+    def __str__(self):
+        return f"Recommendations for {self.user_id}"
+
+
+# ----------------
+# Отметки изменений каталога (cores/catalog_cache.py). Одна строка с id=1 в общей базе:
+# ее видят все процессы (воркеры gunicorn, import_books), в отличие от кэша в памяти процесса
+class CatalogState(models.Model):
+    version = models.BigIntegerField(_('Version'))
+    modified_at = models.DateTimeField(_('Catalog modified at'))
+    activity_at = models.DateTimeField(_('Activity modified at'))
+
+    class Meta:
+        verbose_name = _('Catalog State')
+        verbose_name_plural = _('Catalog State')
+
+    def __str__(self):
+        return f"Catalog version {self.version}"
+
+
+# ----------------
+# Фасеты каталога (cores/facets.py): категория, автор, десятилетие, рейтинг
+FACET_CHOICES = [
+    ('category', _('Category')),
+    ('author', _('Author')),
+    ('year', _('Decade')),
+    ('rating', _('Rating')),
+]
+
+
+class BookFacet(models.Model):
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='facets')
+    facet = models.CharField(_('Facet'), max_length=16, choices=FACET_CHOICES)
+    value = models.CharField(_('Value'), max_length=255)
+
+    class Meta:
+        constraints = [
+            # Этот же индекс отдает страницу книг значения по порядку id
+            models.UniqueConstraint(fields=['facet', 'value', 'book'], name='cores_bookfacet_unique'),
+        ]
+        verbose_name = _('Book Facet')
+        verbose_name_plural = _('Book Facets')
+
+    def __str__(self):
+        return f"{self.book_id}: {self.facet}={self.value}"
+
+
+class FacetValue(models.Model):
+    facet = models.CharField(_('Facet'), max_length=16, choices=FACET_CHOICES)
+    value = models.CharField(_('Value'), max_length=255)
+    count = models.PositiveIntegerField(_('Books'), default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['facet', 'value'], name='cores_facetvalue_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['facet', '-count', 'value'], name='cores_facetvalue_count'),
+        ]
+        verbose_name = _('Facet Value')
+        verbose_name_plural = _('Facet Values')
+
+    def __str__(self):
+        return f"{self.facet}={self.value} ({self.count})"
@@ -0,0 +1,183 @@
+import base64
+import datetime
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import ParseError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class _CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder обрезает время до миллисекунд, а курсору нужно точное значение
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values):
+    payload = json.dumps(list(values), cls=_CursorEncoder).encode()
+    return base64.urlsafe_b64encode(payload).decode()
+
+
+def decode_cursor(cursor, size):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (TypeError, ValueError):
+        raise InvalidCursor('Invalid cursor')
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor('Invalid cursor')
+    return values
+
+
+def _nullable_fields(queryset, ordering):
+    names = set()
+    for field in ordering:
+        name = field.lstrip('-')
+        try:
+            if queryset.model._meta.get_field(name).null:
+                names.add(name)
+        except FieldDoesNotExist:
+            pass
+    return names
+
+
+def _after(name, value, descending, nullable, nulls_largest):
+    """
+    Условие "строго после value" для одного поля. NULL стоят там, где их ставит база:
+    в PostgreSQL они больше любых значений, в SQLite — меньше
+    """
+    nulls_at_end = nullable and nulls_largest != descending
+    if value is None:
+        return Q(pk__in=[]) if nulls_at_end else Q(**{f'{name}__isnull': False})
+    condition = Q(**{f"{name}__{'lt' if descending else 'gt'}": value})
+    if nulls_at_end:
+        condition |= Q(**{f'{name}__isnull': True})
+    return condition
+
+
+def keyset_filter(ordering, values, nullable=(), nulls_largest=False):
+    """
+    Условие "строго после values" для сортировки ordering, например ('-added_at', '-id'):
+    added_at < a OR (added_at = a AND id < b). Поля из nullable могут быть NULL
+    """
+    condition = Q()
+    equal = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        condition |= equal & _after(name, value, field.startswith('-'), name in nullable, nulls_largest)
+        equal &= Q(**{f'{name}__isnull': True}) if value is None else Q(**{name: value})
+    return condition
+
+
+def _row_value(row, name):
+    return row[name] if isinstance(row, dict) else getattr(row, name)
+
+
+def keyset_page(queryset, ordering, page_size, cursor=None):
+    """
+    Страница queryset после курсора без OFFSET: запрос идет по индексу с места,
+    где закончилась предыдущая страница. Последнее поле ordering должно быть уникальным (обычно id).
+    Работает и с моделями, и с values(), если поля сортировки есть в выборке.
+    Возвращает (строки, курсор следующей страницы или None)
+    """
+    if cursor:
+        values = decode_cursor(cursor, len(ordering))
+        nulls_largest = connections[queryset.db].vendor in ('postgresql', 'oracle')
+        queryset = queryset.filter(
+            keyset_filter(ordering, values, _nullable_fields(queryset, ordering), nulls_largest)
+        )
+
+    rows = list(queryset.order_by(*ordering)[:page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+
+    rows = rows[:page_size]
+    last = rows[-1]
+    return rows, encode_cursor(_row_value(last, field.lstrip('-')) for field in ordering)
+
+
+def page_size_param(request, default, maximum):
+    """
+    ?page_size= из запроса, ограниченный сверху maximum. ValueError, если это не число
+    """
+    return max(1, min(int(request.query_params.get('page_size', default)), maximum))
+
+
+def next_page_url(request, cursor):
+    if not cursor:
+        return None
+    return replace_query_param(request.build_absolute_uri(), 'cursor', cursor)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Пагинация DRF по курсору вместо номера страницы: ?page_size=&cursor=.
+    Каждая страница — запрос по индексу с места, где закончилась предыдущая, без OFFSET,
+    поэтому глубокие страницы стоят столько же, сколько первая.
+    Порядок берется из queryset (order_by), в конце всегда id. Общее число записей —
+    отдельный COUNT(*), его можно отключить: ?count=false или include_count = False
+    """
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    include_count = True
+
+    def get_ordering(self, queryset):
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+        if not all(isinstance(field, str) for field in ordering):
+            raise ImproperlyConfigured('KeysetPagination: сортировка должна состоять из имен полей или аннотаций')
+        ordering = [{'pk': 'id', '-pk': '-id'}.get(field, field) for field in ordering]
+        if not ordering or ordering[-1].lstrip('-') != 'id':
+            ordering.append('-id' if ordering and ordering[-1].startswith('-') else 'id')
+        return tuple(ordering)
+
+    def wants_count(self, request):
+        value = request.query_params.get(self.count_query_param)
+        if value is None:
+            return self.include_count
+        return value.lower() not in ('0', 'false', 'no')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        try:
+            page_size = page_size_param(request, self.page_size, self.max_page_size)
+        except ValueError:
+            raise ParseError('Invalid page_size')
+
+        self.count = queryset.count() if self.wants_count(request) else None
+        try:
+            rows, self.next_cursor = keyset_page(
+                queryset, self.get_ordering(queryset), page_size, request.query_params.get(self.cursor_query_param)
+            )
+        except InvalidCursor:
+            raise ParseError('Invalid cursor')
+        return rows
+
+    def get_paginated_response(self, data):
+        payload = {'next': next_page_url(self.request, self.next_cursor), 'results': data}
+        if self.count is not None:
+            payload = {'count': self.count, **payload}
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'count': {'type': 'integer'},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,457 @@
+import hashlib
+import json
+import math
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+
+from .llm import CompletionError, completion_client
+from .models import (
+    Book,
+    RecommendationSnapshot,
+    UserFavoriteBook,
+    UserLikedAuthors,
+    UserLikedCategories,
+    split_authors,
+    split_categories,
+)
+from .refreshing import BackgroundRefresh
+
+# Веса сигналов вкуса пользователя
+LIKED_WEIGHT = 1.0
+FAVORITE_WEIGHT = 1.0
+# Насколько сильно учитываются признаки, которые часто встречаются вместе с признаками пользователя
+COOCCURRENCE_WEIGHT = 0.5
+# Вклад популярности книги (log ratings_count * average_rating), чтобы различать равные по вкусу книги
+POPULARITY_WEIGHT = 0.05
+
+
+def _csr(rows):
+    """
+    Список списков индексов -> (indptr, indices) в формате CSR
+    """
+    lengths = np.fromiter((len(row) for row in rows), dtype=np.int64, count=len(rows))
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+    indices = np.fromiter((index for row in rows for index in row), dtype=np.int32, count=int(indptr[-1]))
+    return indptr, indices
+
+
+class RecommendationModel:
+    """
+    Предрасчитанные массивы для ранжирования книг.
+    Признаки — категории и авторы в одном пространстве индексов.
+    Для каждой книги хранится список ее признаков (CSR), для каждого признака — нормированный
+    вектор совместной встречаемости с другими признаками во вкусах пользователей и в самих книгах
+    """
+
+    def __init__(self):
+        self.book_ids = np.empty(0, dtype=np.int64)
+        self.book_position = {}
+        self.feature_index = {}
+        self.feature_names = []
+        self.book_indptr = np.zeros(1, dtype=np.int64)
+        self.book_features = np.empty(0, dtype=np.int32)
+        self.popularity = np.empty(0, dtype=np.float32)
+        self.cooccurrence_indptr = np.zeros(1, dtype=np.int64)
+        self.cooccurrence_indices = np.empty(0, dtype=np.int32)
+        self.cooccurrence_weights = np.empty(0, dtype=np.float32)
+
+    @staticmethod
+    def category_key(name):
+        return ('category', name)
+
+    @staticmethod
+    def author_key(name):
+        return ('author', name)
+
+    def _feature(self, key):
+        index = self.feature_index.get(key)
+        if index is None:
+            index = self.feature_index[key] = len(self.feature_names)
+            self.feature_names.append(key)
+        return index
+
+    def book_feature_keys(self, authors, categories):
+        return [self.category_key(name) for name in split_categories(categories)] + \
+               [self.author_key(name) for name in split_authors(authors)]
+
+    @classmethod
+    def build(cls):
+        model = cls()
+        rows = Book.objects.values_list('id', 'authors', 'categories', 'ratings_count', 'average_rating')
+
+        book_ids, book_rows, popularity = [], [], []
+        for book_id, authors, categories, ratings_count, average_rating in rows.iterator(chunk_size=5000):
+            book_ids.append(book_id)
+            book_rows.append(sorted({model._feature(key) for key in model.book_feature_keys(authors, categories)}))
+            popularity.append(math.log1p(ratings_count or 0) * float(average_rating or 0))
+
+        model.book_ids = np.asarray(book_ids, dtype=np.int64)
+        model.book_position = {book_id: position for position, book_id in enumerate(book_ids)}
+        model.book_indptr, model.book_features = _csr(book_rows)
+        popularity = np.asarray(popularity, dtype=np.float32)
+        if popularity.size and popularity.max() > 0:
+            popularity /= popularity.max()
+        model.popularity = popularity
+
+        model._build_cooccurrence(book_rows)
+        return model
+
+    def _taste_sets(self, book_rows):
+        """
+        Наборы признаков по каждому пользователю: категории и авторы его избранных книг и лайков
+        """
+        tastes = {}
+        for user_id, book_id in UserFavoriteBook.objects.values_list('user_id', 'book_id').iterator(chunk_size=5000):
+            position = self.book_position.get(book_id)
+            if position is not None:
+                tastes.setdefault(user_id, set()).update(book_rows[position])
+        liked_categories = UserLikedCategories.objects.values_list('user__user_id', 'category')
+        for user_id, name in liked_categories.iterator(chunk_size=5000):
+            index = self.feature_index.get(self.category_key(name))
+            if index is not None:
+                tastes.setdefault(user_id, set()).add(index)
+        liked_authors = UserLikedAuthors.objects.values_list('user__user_id', 'author')
+        for user_id, name in liked_authors.iterator(chunk_size=5000):
+            index = self.feature_index.get(self.author_key(name))
+            if index is not None:
+                tastes.setdefault(user_id, set()).add(index)
+        return tastes.values()
+
+    def _build_cooccurrence(self, book_rows):
+        size = len(self.feature_names)
+        pairs_left, pairs_right = [], []
+        # Пары признаков внутри одной книги и внутри вкуса одного пользователя
+        for features in list(book_rows) + [sorted(taste) for taste in self._taste_sets(book_rows)]:
+            if len(features) < 2:
+                continue
+            features = np.asarray(features, dtype=np.int32)
+            left, right = np.meshgrid(features, features, indexing='ij')
+            mask = left != right
+            pairs_left.append(left[mask])
+            pairs_right.append(right[mask])
+
+        if not pairs_left:
+            self.cooccurrence_indptr = np.zeros(size + 1, dtype=np.int64)
+            return
+
+        left = np.concatenate(pairs_left).astype(np.int64)
+        right = np.concatenate(pairs_right).astype(np.int64)
+        # Складываем повторяющиеся пары: уникальные ключи left * size + right, отсортированные по left
+        keys, counts = np.unique(left * size + right, return_counts=True)
+        rows, columns = keys // size, keys % size
+        weights = counts.astype(np.float32)
+
+        # Нормируем каждую строку, чтобы частые признаки не перевешивали
+        weights /= np.bincount(rows, weights=weights, minlength=size).astype(np.float32)[rows]
+
+        self.cooccurrence_indptr = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=size), out=self.cooccurrence_indptr[1:])
+        self.cooccurrence_indices = columns.astype(np.int32)
+        self.cooccurrence_weights = weights
+
+    def taste_matrix(self, tastes):
+        """
+        Матрица вкусов (пользователи x признаки) по списку (избранные id, категории, авторы)
+        """
+        matrix = np.zeros((len(tastes), len(self.feature_names)), dtype=np.float32)
+        for row, (favorite_book_ids, liked_categories, liked_authors) in enumerate(tastes):
+            for book_id in favorite_book_ids:
+                position = self.book_position.get(book_id)
+                if position is not None:
+                    start, end = self.book_indptr[position], self.book_indptr[position + 1]
+                    matrix[row, self.book_features[start:end]] += FAVORITE_WEIGHT
+            for key in [self.category_key(name) for name in liked_categories] + \
+                       [self.author_key(name) for name in liked_authors]:
+                index = self.feature_index.get(key)
+                if index is not None:
+                    matrix[row, index] += LIKED_WEIGHT
+        return matrix
+
+    def expand(self, tastes):
+        """
+        Расширяет вкусы признаками, которые встречаются вместе с уже выбранными.
+        Умножение на разреженную матрицу встречаемости сводится к плотному произведению
+        по признакам, которые есть хотя бы у одного пользователя в пачке
+        """
+        expanded = tastes.copy()
+        active = np.flatnonzero(tastes.any(axis=0))
+        if not active.size:
+            return expanded
+
+        starts, ends = self.cooccurrence_indptr[active], self.cooccurrence_indptr[active + 1]
+        lengths = ends - starts
+        if not lengths.sum():
+            return expanded
+        nnz = np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)])
+        rows = np.repeat(np.arange(active.size), lengths)
+        columns, column_positions = np.unique(self.cooccurrence_indices[nnz], return_inverse=True)
+
+        block = np.zeros((active.size, columns.size), dtype=np.float32)
+        block[rows, column_positions] = self.cooccurrence_weights[nnz]
+        expanded[:, columns] += COOCCURRENCE_WEIGHT * (tastes[:, active] @ block)
+        return expanded
+
+    def score(self, tastes):
+        """
+        Оценки всех книг для каждой строки матрицы вкусов (пользователи x книги)
+        """
+        scores = np.zeros((tastes.shape[0], len(self.book_ids)), dtype=np.float32)
+        non_empty = np.diff(self.book_indptr) > 0
+        if self.book_features.size:
+            scores[:, non_empty] = np.add.reduceat(
+                tastes[:, self.book_features], self.book_indptr[:-1][non_empty], axis=1
+            )
+        return scores + POPULARITY_WEIGHT * self.popularity
+
+    def users_per_batch(self, budget=16_000_000):
+        # Сколько пользователей считать за раз, чтобы промежуточные матрицы не превышали budget элементов
+        width = max(self.book_features.size, len(self.book_ids), len(self.feature_names), 1)
+        return max(1, budget // width)
+
+    def recommend_many(self, tastes, limit=10):
+        """
+        Рекомендации сразу для нескольких пользователей, tastes — список
+        (избранные id, категории, авторы). Для каждого возвращает
+        [(book_id, score, [признаки, совпавшие со вкусом])] по убыванию score
+        """
+        if not len(self.book_ids):
+            return [[] for _ in tastes]
+
+        results = []
+        batch_size = self.users_per_batch()
+        for offset in range(0, len(tastes), batch_size):
+            batch = tastes[offset:offset + batch_size]
+            direct = self.taste_matrix(batch)
+            scores = self.score(self.expand(direct))
+
+            for row, (favorite_book_ids, _, _) in enumerate(batch):
+                excluded = [self.book_position[book_id] for book_id in favorite_book_ids
+                            if book_id in self.book_position]
+                scores[row, excluded] = -np.inf
+                results.append(self._top(scores[row], direct[row], min(limit, len(self.book_ids) - len(excluded))))
+        return results
+
+    def _top(self, scores, taste, limit):
+        if limit <= 0:
+            return []
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        # Стабильный порядок: по score, при равенстве — по id книги
+        top = top[np.lexsort((self.book_ids[top], -scores[top]))]
+
+        result = []
+        for position in top:
+            start, end = self.book_indptr[position], self.book_indptr[position + 1]
+            features = self.book_features[start:end]
+            matched = [self.feature_names[index] for index in features[taste[features] > 0]]
+            result.append((int(self.book_ids[position]), float(scores[position]), matched))
+        return result
+
+    def recommend(self, favorite_book_ids, liked_categories, liked_authors, limit=10):
+        return self.recommend_many([(favorite_book_ids, liked_categories, liked_authors)], limit)[0]
+
+
+class RecommendationEngine(BackgroundRefresh):
+    """
+    Процессная модель рекомендаций. Первый запрос строит ее синхронно, дальше
+    раз в RECOMMENDATION_MODEL_TTL секунд она перестраивается в фоновом потоке
+    """
+
+    ttl_setting = 'RECOMMENDATION_MODEL_TTL'
+    default_ttl = 600
+    thread_name = 'recommendations-refresh'
+    description = 'модель рекомендаций'
+
+    def __init__(self):
+        super().__init__()
+        self._model = None
+
+    def _is_built(self):
+        return self._model is not None
+
+    def model(self):
+        self._ensure_built()
+        return self._model
+
+    def _build(self):
+        model = RecommendationModel.build()
+        self._model, self._built_at = model, time.monotonic()
+
+    def clear(self):
+        with self._build_lock:
+            self._model = None
+            self._built_at = None
+
+    def recommend(self, favorite_book_ids, liked_categories, liked_authors, limit=10):
+        return self.model().recommend(favorite_book_ids, liked_categories, liked_authors, limit)
+
+    def recommend_many(self, tastes, limit=10):
+        return self.model().recommend_many(tastes, limit)
+
+
+recommendation_engine = RecommendationEngine()
+
+
+# ---------------------------------------------------------------
+# Кэш готовых рекомендаций по пользователям. Запись хранит отпечаток вкуса, для которого
+# она посчитана: если вкус изменился (в том числе в другом процессе), запись не используется.
+# Сигналы дополнительно удаляют запись сразу при изменении избранного или лайков
+
+RECOMMENDATION_CACHE = 'recommendations'
+
+
+def _cache_key(user_id):
+    return f'recommendations:{user_id}'
+
+
+def taste_fingerprint(favorite_book_ids, liked_categories, liked_authors, limit):
+    payload = json.dumps(
+        [sorted(favorite_book_ids), sorted(liked_categories), sorted(liked_authors), limit],
+        ensure_ascii=False,
+    )
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def get_cached_recommendations(user_id, fingerprint):
+    entry = caches[RECOMMENDATION_CACHE].get(_cache_key(user_id))
+    if entry and entry['fingerprint'] == fingerprint:
+        return entry['recommended_books']
+    return None
+
+
+def cache_recommendations(user_id, fingerprint, recommended_books):
+    caches[RECOMMENDATION_CACHE].set(
+        _cache_key(user_id), {'fingerprint': fingerprint, 'recommended_books': recommended_books}
+    )
+
+
+def invalidate_recommendations(user_id):
+    caches[RECOMMENDATION_CACHE].delete(_cache_key(user_id))
+    RecommendationSnapshot.objects.filter(user_id=user_id).delete()
+
+
+def snapshot_query(user_id):
+    return RecommendationSnapshot.objects.filter(user_id=user_id).values_list('recommended_books', flat=True)
+
+
+def snapshot_recommendations(recommended_books, limit):
+    """
+    Первые limit рекомендаций из снимка или None, если в снимке их меньше
+    """
+    if recommended_books is None or len(recommended_books) < limit:
+        return None
+    return recommended_books[:limit]
+
+
+def describe_match(matched):
+    """
+    Короткое объяснение рекомендации по совпавшим категориям и авторам
+    """
+    categories = [name for kind, name in matched if kind == 'category']
+    authors = [name for kind, name in matched if kind == 'author']
+    reasons = []
+    if authors:
+        reasons.append('автор: ' + ', '.join(authors))
+    if categories:
+        reasons.append('категория: ' + ', '.join(categories))
+    if not reasons:
+        return 'Популярная книга, похожая на ваши интересы'
+    return 'Совпадает с вашими интересами (' + '; '.join(reasons) + ')'
+
+
+def book_payload(book):
+    return {
+        "id": book["id"],
+        "title": book["title"],
+        "subtitle": book["subtitle"],
+        "authors": book["authors"],
+        "categories": book["categories"],
+        "description": book["description"],
+        "published_year": book["published_year"],
+        "average_rating": str(book["average_rating"]) if book["average_rating"] is not None else None,
+    }
+
+
+def recommend_for_user(user, user_profile, limit):
+    """
+    Локальные рекомендации пользователя (из кэша, если вкус не менялся).
+    Возвращает словарь с рекомендациями, отпечатком вкуса и признаком попадания в кэш
+    """
+    # Сначала недавние: в запрос к LLM уходят первые из них
+    favorite_book_ids = list(
+        UserFavoriteBook.objects.filter(user=user).order_by('-added_at').values_list('book_id', flat=True)
+    )
+    liked_categories = list(UserLikedCategories.objects.filter(user=user_profile).values_list('category', flat=True))
+    liked_authors = list(UserLikedAuthors.objects.filter(user=user_profile).values_list('author', flat=True))
+
+    fingerprint = taste_fingerprint(favorite_book_ids, liked_categories, liked_authors, limit)
+    cached = get_cached_recommendations(user.id, fingerprint)
+    if cached is not None:
+        return {"recommended_books": cached, "fingerprint": fingerprint, "cached": True,
+                "favorite_book_ids": favorite_book_ids}
+
+    ranked = recommendation_engine.recommend(favorite_book_ids, liked_categories, liked_authors, limit=limit)
+    recommended_books = [
+        {"id": book_id, "comment": describe_match(matched)} for book_id, _, matched in ranked
+    ]
+    return {"recommended_books": recommended_books, "fingerprint": fingerprint, "cached": False,
+            "favorite_book_ids": favorite_book_ids}
+
+
+# ---------------------------------------------------------------
+# Необязательные объяснения от LLM поверх локального ранжирования
+
+EXPLANATION_FIELDS = ('id', 'title', 'subtitle', 'authors', 'categories', 'description', 'published_year', 'average_rating')
+
+
+def llm_enabled():
+    return bool(getattr(settings, 'OPENAI_API_KEY', ''))
+
+
+def explanation_context(favorite_book_ids, recommended_books):
+    """
+    Данные о любимых и рекомендованных книгах, которые уходят в запрос к LLM
+    """
+    favorite_books = Book.objects.filter(id__in=favorite_book_ids[:60]).values(*EXPLANATION_FIELDS)
+    books = Book.objects.filter(id__in=[book["id"] for book in recommended_books]).values(*EXPLANATION_FIELDS)
+    return [book_payload(book) for book in favorite_books], [book_payload(book) for book in books]
+
+
+def _explanation_messages(favorite_books, recommended_books):
+    return [
+        {"role": "system", "content": "Вы полезный ассистент, который объясняет пользователю, почему ему рекомендованы книги."},
+        {"role": "user", "content": f"Вот список любимых книг пользователя: {favorite_books}. Ему рекомендованы книги: {recommended_books}. Объясните, почему каждая книга подходит пользователю, и верните результат в формате JSON с идентификатором книги и причиной для рекомендации. Поля JSON должны быть  id, comment. Ты должен вернуть только JSON без лишнего, только JSON без форматирования. Комментарии должны быть только на русском"}
+    ]
+
+
+def _parse_explanations(content):
+    try:
+        return {int(item['id']): str(item['comment']) for item in json.loads(content)}
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def explain_with_llm(favorite_books, recommended_books):
+    """
+    Просит LLM объяснить уже выбранные рекомендации. Возвращает {book_id: комментарий}
+    или None, если сервис недоступен или ответил не в ожидаемом формате
+    """
+    if not llm_enabled() or not recommended_books:
+        return None
+    try:
+        content = completion_client().complete(
+            _explanation_messages(favorite_books, recommended_books), max_tokens=2000, temperature=0.7
+        )
+    except CompletionError:
+        return None
+    return _parse_explanations(content)
+
+
+def apply_explanations(recommended_books, comments):
+    if comments:
+        for book in recommended_books:
+            book["comment"] = comments.get(book["id"], book["comment"])
+    return recommended_books
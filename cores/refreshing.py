@@ -0,0 +1,79 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundRefresh:
+    """
+    Основа процессных структур, построенных из базы (индекс автодополнения, модель рекомендаций).
+    Первый запрос строит структуру синхронно, дальше раз в ttl секунд (настройка ttl_setting)
+    она перестраивается в фоновом потоке, а запросы тем временем обслуживает прежняя версия.
+
+    Подкласс реализует _build() (строит и публикует новую версию, отмечая _built_at) и _is_built()
+    """
+
+    ttl_setting = None
+    default_ttl = None
+    thread_name = 'background-refresh'
+    description = 'структуру'
+
+    def __init__(self):
+        # _refresh_lock защищает флаг перестройки, _build_lock не дает строить две версии сразу
+        self._refresh_lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._built_at = None
+        self._refreshing = False
+
+    @property
+    def ttl(self):
+        return getattr(settings, self.ttl_setting, self.default_ttl)
+
+    def _is_fresh(self):
+        if self._built_at is None:
+            return False
+        return self.ttl is None or time.monotonic() - self._built_at < self.ttl
+
+    def _is_built(self):
+        raise NotImplementedError
+
+    def _build(self):
+        raise NotImplementedError
+
+    def _ensure_built(self):
+        if not self._is_built():
+            with self._build_lock:
+                if not self._is_built():
+                    self._build()
+        elif not self._is_fresh():
+            with self._refresh_lock:
+                start = not self._refreshing
+                self._refreshing = True
+            if start:
+                self._start_refresh()
+
+    def _start_refresh(self):
+        threading.Thread(target=self._refresh, name=self.thread_name, daemon=True).start()
+
+    def _refresh(self):
+        try:
+            with self._build_lock:
+                self._build()
+        except Exception:
+            logger.exception('Не удалось перестроить %s', self.description)
+        finally:
+            self._refreshing = False
+            # Соединение открыто этим потоком, и закрыть его больше некому
+            connection.close()
+
+    def rebuild(self):
+        """
+        Синхронная перестройка
+        """
+        with self._build_lock:
+            self._build()
@@ -0,0 +1,220 @@
+import base64
+import json
+import re
+
+from django.db import connection
+
+from .pagination import InvalidCursor
+
+
+# Поля книги, по которым идет полнотекстовый поиск, и их веса (title важнее description)
+SEARCH_FIELDS = ('title', 'subtitle', 'authors', 'categories', 'description')
+SEARCH_WEIGHTS = (10.0, 5.0, 3.0, 2.0, 1.0)
+
+SQLITE_FTS_TABLE = 'cores_book_fts'
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def encode_cursor(rank, book_id):
+    payload = json.dumps([rank, book_id]).encode()
+    return base64.urlsafe_b64encode(payload).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        rank, book_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(rank), int(book_id)
+    except (TypeError, ValueError):
+        raise InvalidCursor('Invalid cursor')
+
+
+# ---------------------------------------------------------------
+# SQLite: FTS5-таблица с внешним содержимым (content=cores_book), синхронизируется триггерами
+
+_SQLITE_COLUMNS = ', '.join(SEARCH_FIELDS)
+_SQLITE_NEW = ', '.join(f'new.{field}' for field in SEARCH_FIELDS)
+_SQLITE_OLD = ', '.join(f'old.{field}' for field in SEARCH_FIELDS)
+
+SQLITE_CREATE_TABLE = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_FTS_TABLE} USING fts5("
+    f"{_SQLITE_COLUMNS}, content='cores_book', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+)
+SQLITE_CREATE_TRIGGERS = (
+    f"CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_ai AFTER INSERT ON cores_book BEGIN "
+    f"INSERT INTO {SQLITE_FTS_TABLE}(rowid, {_SQLITE_COLUMNS}) VALUES (new.id, {_SQLITE_NEW}); END",
+
+    f"CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_ad AFTER DELETE ON cores_book BEGIN "
+    f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, {_SQLITE_COLUMNS}) "
+    f"VALUES ('delete', old.id, {_SQLITE_OLD}); END",
+
+    # Только при изменении индексируемых полей: счетчики активности книги меняются гораздо чаще
+    f"CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_au AFTER UPDATE OF {_SQLITE_COLUMNS} ON cores_book BEGIN "
+    f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, {_SQLITE_COLUMNS}) "
+    f"VALUES ('delete', old.id, {_SQLITE_OLD}); "
+    f"INSERT INTO {SQLITE_FTS_TABLE}(rowid, {_SQLITE_COLUMNS}) VALUES (new.id, {_SQLITE_NEW}); END",
+)
+SQLITE_REBUILD = f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}) VALUES ('rebuild')"
+SQLITE_DROP = (
+    f"DROP TRIGGER IF EXISTS {SQLITE_FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {SQLITE_FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {SQLITE_FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {SQLITE_FTS_TABLE}",
+)
+
+
+def sqlite_has_fts5(cursor):
+    cursor.execute('PRAGMA compile_options')
+    return any(option == 'ENABLE_FTS5' for option, in cursor.fetchall())
+
+
+def sqlite_fts_exists(cursor):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [SQLITE_FTS_TABLE])
+    return cursor.fetchone() is not None
+
+
+def ensure_sqlite_triggers(cursor):
+    """
+    SQLite пересоздает таблицу cores_book при части ALTER TABLE, и триггеры пропадают.
+    Вызывается после каждой миграции и восстанавливает их (индекс при этом не расходится:
+    пересоздание таблицы сохраняет id и содержимое строк)
+    """
+    if not sqlite_fts_exists(cursor):
+        return
+    for statement in SQLITE_CREATE_TRIGGERS:
+        cursor.execute(statement)
+
+
+def sqlite_match_expression(query):
+    # Каждое слово берем в кавычки (экранируя спецсимволы FTS5), последнее — как префикс
+    words = _WORD_RE.findall(query)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def _sqlite_search(query, limit, after):
+    match = sqlite_match_expression(query)
+    if match is None:
+        return []
+    weights = ', '.join(str(weight) for weight in SEARCH_WEIGHTS)
+    # bm25() возвращает отрицательные значения: чем меньше, тем релевантнее
+    sql = (
+        f"SELECT id, rank FROM ("
+        f"SELECT rowid AS id, bm25({SQLITE_FTS_TABLE}, {weights}) AS rank "
+        f"FROM {SQLITE_FTS_TABLE} WHERE {SQLITE_FTS_TABLE} MATCH %s"
+        f") "
+    )
+    params = [match]
+    if after is not None:
+        sql += "WHERE rank > %s OR (rank = %s AND id > %s) "
+        params += [after[0], after[0], after[1]]
+    sql += "ORDER BY rank, id LIMIT %s"
+    params.append(limit)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [(book_id, rank) for book_id, rank in cursor.fetchall()]
+
+
+# ---------------------------------------------------------------
+# PostgreSQL: функциональный GIN-индекс по взвешенному tsvector
+
+POSTGRES_CONFIG = 'simple'
+POSTGRES_INDEX = 'cores_book_search_vector_gin'
+POSTGRES_VECTOR = ' || '.join(
+    f"setweight(to_tsvector('{POSTGRES_CONFIG}', coalesce({field}, '')), '{weight}')"
+    for field, weight in zip(SEARCH_FIELDS, ('A', 'B', 'C', 'C', 'D'))
+)
+POSTGRES_CREATE_INDEX = f"CREATE INDEX IF NOT EXISTS {POSTGRES_INDEX} ON cores_book USING GIN (({POSTGRES_VECTOR}))"
+POSTGRES_DROP_INDEX = f"DROP INDEX IF EXISTS {POSTGRES_INDEX}"
+
+# Поиск подстроки в названии (title__icontains): Django строит UPPER("title"::text) LIKE UPPER(%s),
+# такой LIKE с % в начале ускоряет только индекс триграмм по тому же выражению
+POSTGRES_TRIGRAM_INDEX = 'cores_book_title_trgm'
+POSTGRES_CREATE_TRIGRAM = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS {POSTGRES_TRIGRAM_INDEX} ON cores_book USING GIN ((UPPER(title::text)) gin_trgm_ops)",
+)
+POSTGRES_DROP_TRIGRAM = f"DROP INDEX IF EXISTS {POSTGRES_TRIGRAM_INDEX}"
+
+
+def postgres_has_trigram(cursor):
+    # pg_trgm входит в contrib, который есть не во всех сборках PostgreSQL
+    cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    return cursor.fetchone() is not None
+
+
+def postgres_tsquery(query):
+    # Как и в SQLite: все слова обязательны, последнее — как префикс (to_tsquery, а не
+    # websearch_to_tsquery, который префиксы не поддерживает). \w+ не содержит кавычек и операторов
+    words = _WORD_RE.findall(query)
+    if not words:
+        return None
+    terms = [f"'{word}'" for word in words]
+    terms[-1] += ':*'
+    return ' & '.join(terms)
+
+
+def _postgres_search(query, limit, after):
+    tsquery = postgres_tsquery(query)
+    if tsquery is None:
+        return []
+
+    # ts_rank_cd учитывает частоту и близость слов; чем больше, тем релевантнее.
+    # Ранг сравнивается как float4, чтобы курсор совпадал с тем, что вернула база
+    sql = (
+        f"SELECT id, rank FROM ("
+        f"SELECT id, ts_rank_cd({POSTGRES_VECTOR}, q)::float4 AS rank "
+        f"FROM cores_book, to_tsquery('{POSTGRES_CONFIG}', %s) q "
+        f"WHERE ({POSTGRES_VECTOR}) @@ q"
+        f") s "
+    )
+    params = [tsquery]
+    if after is not None:
+        sql += "WHERE rank < %s::float4 OR (rank = %s::float4 AND id > %s) "
+        params += [after[0], after[0], after[1]]
+    sql += "ORDER BY rank DESC, id LIMIT %s"
+    params.append(limit)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [(book_id, rank) for book_id, rank in cursor.fetchall()]
+
+
+# ---------------------------------------------------------------
+
+_sqlite_fts_available = None
+
+
+def fulltext_available():
+    global _sqlite_fts_available
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        if _sqlite_fts_available is None:
+            with connection.cursor() as cursor:
+                _sqlite_fts_available = sqlite_fts_exists(cursor)
+        return _sqlite_fts_available
+    return False
+
+
+def search_books(query, limit, cursor=None):
+    """
+    Полнотекстовый поиск книг. Возвращает список (book_id, rank) в порядке релевантности
+    и курсор следующей страницы (None, если страница последняя)
+    """
+    after = decode_cursor(cursor) if cursor else None
+    if connection.vendor == 'postgresql':
+        rows = _postgres_search(query, limit + 1, after)
+    else:
+        rows = _sqlite_search(query, limit + 1, after)
+
+    rows, has_next = rows[:limit], len(rows) > limit
+    next_cursor = None
+    if has_next:
+        last_id, last_rank = rows[-1]
+        next_cursor = encode_cursor(last_rank, last_id)
+    return rows, next_cursor
@@ -1,16 +1,47 @@
 from rest_framework import serializers
+from rest_framework.utils.urls import replace_query_param
 from django.contrib.auth import get_user_model
 from .models import (
     Book,
     Discussion,
     Comment,
     UserProfile,
-    UserLikedAuthors
+    UserLikedAuthors,
+    UserFavoriteBook
 )
 
 
 User = get_user_model()
 
+# Первичные ключи — BigAutoField, то есть знаковое 64-битное целое
+MAX_ID = 2 ** 63 - 1
+
+
+def id_field():
+    # id из запроса: больше id не бывает, а слишком большое число база не примет (OverflowError)
+    return serializers.IntegerField(min_value=1, max_value=MAX_ID)
+
+
+# Тела пакетных запросов (BatchView): список от 1 до BATCH_MAX_ITEMS ключей
+BATCH_MAX_ITEMS = 100
+
+
+class BookIdsSerializer(serializers.Serializer):
+    book_ids = serializers.ListField(child=id_field(), min_length=1, max_length=BATCH_MAX_ITEMS)
+
+
+class CategoryNamesSerializer(serializers.Serializer):
+    categories = serializers.ListField(
+        child=serializers.CharField(max_length=255), min_length=1, max_length=BATCH_MAX_ITEMS
+    )
+
+
+class AuthorNamesSerializer(serializers.Serializer):
+    authors = serializers.ListField(
+        child=serializers.CharField(max_length=255), min_length=1, max_length=BATCH_MAX_ITEMS
+    )
+
+
 class RegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True)
 
@@ -33,6 +64,7 @@ class BookSerializer(serializers.ModelSerializer):
     class Meta:
         model = Book
         fields = [
+            'id',
             'title',
             'authors',
             'description',
@@ -40,13 +72,48 @@ class BookSerializer(serializers.ModelSerializer):
             'published_year',
             'average_rating',
             'num_pages',
-            'ratings_count'
+            'ratings_count',
+            'favorites_count',
+            'discussions_count',
+            'comments_count',
+            'last_activity_at',
         ]
+        read_only_fields = ['favorites_count', 'discussions_count', 'comments_count', 'last_activity_at']
+
+    def __init__(self, *args, fields=None, **kwargs):
+        # fields — подмножество Meta.fields для ответа (?fields=title,authors), id остается всегда
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields) - {'id'}:
+                self.fields.pop(name)
+
+
+# Счетчики активности меняются UPDATE-ом из сигналов (cores/counters.py) без смены версии
+# кэша каталога, поэтому в книги из кэша они подставляются отдельным запросом
+BOOK_COUNTER_FIELDS = ('favorites_count', 'discussions_count', 'comments_count', 'last_activity_at')
+
+
+def refresh_book_counters(books):
+    """
+    Заменяет счетчики в сериализованных книгах (словари BookSerializer) текущими значениями
+    из базы: один запрос по первичному ключу. Книги без полей счетчиков (?fields=) не трогает
+    """
+    fields = [field for field in BOOK_COUNTER_FIELDS if books and field in books[0]]
+    if not fields:
+        return books
+    current = Book.objects.filter(id__in=[book['id'] for book in books]).only(*fields)
+    counters = {row['id']: row for row in BookSerializer(current, many=True, fields=fields).data}
+    for book in books:
+        if book['id'] in counters:
+            book.update((field, counters[book['id']][field]) for field in fields)
+    return books
+
 
 class DiscussionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Discussion
-        fields = ['id', 'book', 'title', 'created_at', 'updated_at']
+        fields = ['id', 'book', 'title', 'created_at', 'updated_at', 'comments_count', 'last_activity_at']
+        read_only_fields = ['comments_count', 'last_activity_at']
 
 class CommentSerializer(serializers.ModelSerializer):
     author = serializers.ReadOnlyField(source='author.email')
@@ -56,16 +123,57 @@ class CommentSerializer(serializers.ModelSerializer):
         fields = ['id', 'discussion', 'content', 'created_at', 'updated_at', 'author']
 
 
+class ProfileFavoriteBookSerializer(serializers.ModelSerializer):
+    title = serializers.ReadOnlyField(source='book.title')
+    authors = serializers.ReadOnlyField(source='book.authors')
+
+    class Meta:
+        model = UserFavoriteBook
+        fields = ['book_id', 'title', 'authors', 'added_at']
+
+
+class ProfileCommentSerializer(serializers.ModelSerializer):
+    discussion_title = serializers.ReadOnlyField(source='discussion.title')
+
+    class Meta:
+        model = Comment
+        fields = ['id', 'discussion', 'discussion_title', 'content', 'created_at']
+
+
 class UserProfileSerializer(serializers.ModelSerializer):
-    liked_categories = serializers.StringRelatedField(many=True, source='get_liked_categories')
-    liked_authors = serializers.StringRelatedField(many=True, source='get_liked_authors')
-    favorite_books = serializers.StringRelatedField(many=True, source='get_favorite_books')
-    comments = serializers.StringRelatedField(many=True, source='get_comments')
+    """
+    Профиль с вложенными списками. Ожидает профиль, загруженный через
+    UserProfileView.get_queryset: избранное и комментарии приходят уже
+    срезанными до limit + 1 записей, лишняя запись означает, что есть следующая страница
+    """
+    liked_categories = serializers.SlugRelatedField(many=True, read_only=True, slug_field='category')
+    liked_authors = serializers.SlugRelatedField(many=True, read_only=True, slug_field='author')
+    favorite_books = serializers.SerializerMethodField()
+    comments = serializers.SerializerMethodField()
 
     class Meta:
         model = UserProfile
         fields = ['user', 'bio', 'profile_image', 'website', 'liked_categories', 'liked_authors', 'favorite_books', 'comments']
 
+    def _page(self, items, serializer_class, offset_param):
+        limit = self.context['limit']
+        offset = self.context['offsets'][offset_param]
+        request = self.context.get('request')
+
+        next_url = None
+        if len(items) > limit and request is not None:
+            next_url = replace_query_param(request.build_absolute_uri(), offset_param, offset + limit)
+        return {
+            "next": next_url,
+            "results": serializer_class(items[:limit], many=True).data,
+        }
+
+    def get_favorite_books(self, obj):
+        return self._page(obj.user.profile_favorite_books, ProfileFavoriteBookSerializer, 'favorite_books_offset')
+
+    def get_comments(self, obj):
+        return self._page(obj.user.profile_comments, ProfileCommentSerializer, 'comments_offset')
+
 
 class UserLikedAuthorsSerializer(serializers.ModelSerializer):
     class Meta:
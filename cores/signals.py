@@ -0,0 +1,166 @@
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import counters, facets, search
+from .autocomplete import autocomplete_index
+from .catalog_cache import bump_catalog_version
+from .llm import reset_completion_client
+from .models import (
+    Author,
+    Book,
+    Category,
+    Comment,
+    Discussion,
+    UserFavoriteBook,
+    UserLikedAuthors,
+    UserLikedCategories,
+    UserProfile,
+    prune_unused_names,
+)
+from .recommendations import invalidate_recommendations
+
+
+@receiver(post_save, sender=Book)
+def update_autocomplete_index(sender, instance, **kwargs):
+    autocomplete_index.update_book(instance)
+
+
+@receiver(post_delete, sender=Book)
+def remove_from_autocomplete_index(sender, instance, **kwargs):
+    autocomplete_index.remove_book(instance.pk)
+
+
+@receiver(pre_delete, sender=Book)
+def remember_book_names(sender, instance, **kwargs):
+    # Связи с категориями и авторами удаляются вместе с книгой, поэтому запоминаем их заранее
+    instance._name_ids = (
+        list(instance.normalized_categories.values_list('id', flat=True)),
+        list(instance.normalized_authors.values_list('id', flat=True)),
+    )
+
+
+@receiver(post_delete, sender=Book)
+def prune_book_names(sender, instance, **kwargs):
+    category_ids, author_ids = getattr(instance, '_name_ids', ([], []))
+    prune_unused_names(Category, category_ids)
+    prune_unused_names(Author, author_ids)
+
+
+@receiver(post_save, sender=Book)
+def refresh_book_facets(sender, instance, **kwargs):
+    facets.refresh_facets([instance])
+
+
+@receiver(post_delete, sender=Book)
+def forget_book_facets(sender, instance, **kwargs):
+    facets.forget_facets(instance)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_catalog_cache(sender, instance, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=UserFavoriteBook)
+@receiver(post_delete, sender=UserFavoriteBook)
+def invalidate_recommendations_on_favorite(sender, instance, **kwargs):
+    invalidate_recommendations(instance.user_id)
+
+
+@receiver(post_save, sender=UserLikedCategories)
+@receiver(post_delete, sender=UserLikedCategories)
+@receiver(post_save, sender=UserLikedAuthors)
+@receiver(post_delete, sender=UserLikedAuthors)
+def invalidate_recommendations_on_like(sender, instance, **kwargs):
+    # Лайк ссылается на профиль, а кэш рекомендаций — на пользователя. Если профиль не загружен,
+    # достаточно его user_id (профиля может уже не быть, если он удаляется вместе с лайками)
+    if sender.user.is_cached(instance):
+        user_id = instance.user.user_id
+    else:
+        user_id = UserProfile.objects.filter(pk=instance.user_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        invalidate_recommendations(user_id)
+
+
+@receiver(post_save, sender=UserFavoriteBook)
+def count_favorite(sender, instance, created, **kwargs):
+    if created:
+        counters.favorite_added(instance)
+
+
+@receiver(post_delete, sender=UserFavoriteBook)
+def uncount_favorite(sender, instance, **kwargs):
+    counters.favorite_removed(instance)
+
+
+@receiver(pre_save, sender=Discussion)
+def remember_discussion_book(sender, instance, **kwargs):
+    # Обсуждение можно перенести в другую книгу (PUT), тогда счетчики переносятся вместе с ним
+    if not instance._state.adding:
+        instance._previous_book_id = (
+            Discussion.objects.filter(pk=instance.pk).values_list('book_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Discussion)
+def count_discussion(sender, instance, created, **kwargs):
+    if created:
+        counters.discussion_added(instance)
+    elif getattr(instance, '_previous_book_id', instance.book_id) != instance.book_id:
+        counters.discussion_moved(instance, instance._previous_book_id)
+
+
+@receiver(post_delete, sender=Discussion)
+def uncount_discussion(sender, instance, **kwargs):
+    counters.discussion_removed(instance)
+
+
+@receiver(pre_save, sender=Comment)
+def remember_comment_discussion(sender, instance, **kwargs):
+    if not instance._state.adding:
+        instance._previous_discussion_id = (
+            Comment.objects.filter(pk=instance.pk).values_list('discussion_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, **kwargs):
+    if created:
+        counters.comment_added(instance)
+    elif getattr(instance, '_previous_discussion_id', instance.discussion_id) != instance.discussion_id:
+        counters.comment_moved(instance, instance._previous_discussion_id)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, **kwargs):
+    counters.comment_removed(instance)
+
+
+@receiver(post_migrate)
+def restore_fulltext_triggers(sender, using, **kwargs):
+    if sender.name != 'cores':
+        return
+    connection = connections[using]
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            search.ensure_sqlite_triggers(cursor)
+
+
+@receiver(connection_created)
+def tune_sqlite_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite' or not settings.SQLITE_TUNING:
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in settings.SQLITE_TUNING_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
+
+
+@receiver(setting_changed)
+def reset_completion_client_on_settings_change(sender, setting, **kwargs):
+    if setting.startswith('OPENAI_'):
+        reset_completion_client()
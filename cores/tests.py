@@ -1,3 +1,1324 @@
-from django.test import TestCase
+import importlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+import numpy as np
+import openpyxl
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import batch, search
+from .autocomplete import KEY_LENGTH, TOP_SIZE, AutoCompleteIndex, PrefixIndex
+from .catalog_cache import CATALOG_CACHE, bump_catalog_version
+from .importing import (
+    DEFAULT_AUTHOR,
+    Checkpoint,
+    RowError,
+    batch_ranges,
+    clean_row,
+    clean_rows,
+    read_range,
+    read_rows,
+    upsert_books,
+)
+from .llm import CompletionClient, CompletionError
+from .management.commands.benchmark_sqlite import is_lock_error
+from .models import (
+    Author,
+    Book,
+    Category,
+    Comment,
+    CustomUser,
+    Discussion,
+    RecommendationSnapshot,
+    UserFavoriteBook,
+    UserLikedAuthors,
+    UserLikedCategories,
+    UserProfile,
+)
+from .recommendations import (
+    COOCCURRENCE_WEIGHT,
+    POPULARITY_WEIGHT,
+    RECOMMENDATION_CACHE,
+    RecommendationEngine,
+    RecommendationModel,
+    _csr,
+    invalidate_recommendations,
+    recommendation_engine,
+)
+from .signals import tune_sqlite_connection
+
+
+class StubCompletionServer:
+    """
+    Локальный HTTP-сервер, отвечающий как chat completions API.
+    responses — очередь (задержка в секундах, HTTP-статус, текст ответа модели)
+    """
+
+    def __init__(self):
+        self.responses = []
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                server.requests.append(json.loads(self.rfile.read(length)))
+                delay, status, content = server.responses.pop(0) if server.responses else (0, 200, '[]')
+                time.sleep(delay)
+                body = json.dumps({"choices": [{"message": {"content": content}}]}).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.httpd.server_port}/v1/chat/completions'
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class AuthenticatedTestCase(TestCase):
+    """
+    Тесты API от имени пользователя self.user: self.client уже авторизован
+    """
+
+    # Дополнительные поля пользователя, например is_staff
+    user_fields = {}
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            'reader@example.com', '87770000000', 'Reader', password='x', **self.user_fields
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class CompletionClientTests(TestCase):
+    def client_for(self, server, **kwargs):
+        options = dict(timeout=0.5, connect_timeout=0.5, deadline=2.0, max_retries=2, backoff=0.01)
+        options.update(kwargs)
+        return CompletionClient(server.url, 'key', 'model', **options)
+
+    def test_retries_server_errors(self):
+        with StubCompletionServer() as server:
+            server.responses = [(0, 503, ''), (0, 502, ''), (0, 200, 'ok')]
+            self.assertEqual(self.client_for(server).complete([]), 'ok')
+            self.assertEqual(len(server.requests), 3)
+
+    def test_slow_upstream_is_bounded_by_deadline(self):
+        with StubCompletionServer() as server:
+            server.responses = [(1.0, 200, 'late')] * 3
+            client = self.client_for(server, timeout=0.2, deadline=0.6)
+            started = time.monotonic()
+            with self.assertRaises(CompletionError):
+                client.complete([])
+            self.assertLess(time.monotonic() - started, 1.0)
+
+    def test_client_errors_are_not_retried(self):
+        with StubCompletionServer() as server:
+            server.responses = [(0, 400, '')]
+            with self.assertRaises(CompletionError):
+                self.client_for(server).complete([])
+            self.assertEqual(len(server.requests), 1)
+
+    def test_concurrency_is_bounded_per_process(self):
+        with StubCompletionServer() as server:
+            server.responses = [(0.3, 200, 'ok')] * 4
+            client = self.client_for(server, max_concurrency=2)
+            results = []
+
+            # Как в потоках воркера gunicorn: все запросы процесса делят один семафор
+            def run():
+                results.append(client.complete([]))
+
+            workers = [threading.Thread(target=run) for _ in range(4)]
+            started = time.monotonic()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            self.assertEqual(results, ['ok'] * 4)
+            # Одновременно выполняются только два запроса, значит нужно две "волны"
+            self.assertGreaterEqual(time.monotonic() - started, 0.6)
+
+
+class RecommendationModelTests(TestCase):
+    def make_model(self):
+        # Признаки: 0 — категория Fiction, 1 — автор Ann, 2 — категория Poetry.
+        # Книги 10: [0], 20: [1], 30: [0, 1], 40: [2]; встречаемость только 0 <-> 1 (в книге 30)
+        model = RecommendationModel()
+        model.feature_names = [('category', 'Fiction'), ('author', 'Ann'), ('category', 'Poetry')]
+        model.feature_index = {key: index for index, key in enumerate(model.feature_names)}
+        model.book_ids = np.array([10, 20, 30, 40], dtype=np.int64)
+        model.book_position = {10: 0, 20: 1, 30: 2, 40: 3}
+        model.book_indptr, model.book_features = _csr([[0], [1], [0, 1], [2]])
+        model.popularity = np.array([0, 0, 0, 1], dtype=np.float32)
+        model.cooccurrence_indptr = np.array([0, 1, 2, 2], dtype=np.int64)
+        model.cooccurrence_indices = np.array([1, 0], dtype=np.int32)
+        model.cooccurrence_weights = np.array([1, 1], dtype=np.float32)
+        return model
+
+    def test_score_sums_book_features(self):
+        model = self.make_model()
+        scores = model.score(np.array([[1, 0, 0], [0, 2, 1]], dtype=np.float32))
+        np.testing.assert_allclose(scores, [[1, 0, 1, POPULARITY_WEIGHT], [0, 2, 2, 1 + POPULARITY_WEIGHT]])
+
+    def test_expand_adds_cooccurring_features(self):
+        model = self.make_model()
+        tastes = np.array([[1, 0, 0], [0, 0, 1], [0, 0, 0]], dtype=np.float32)
+        np.testing.assert_allclose(model.expand(tastes), [[1, COOCCURRENCE_WEIGHT, 0], [0, 0, 1], [0, 0, 0]])
+
+    def test_top_orders_by_score_then_id(self):
+        model = self.make_model()
+        taste = np.array([1, 0, 0], dtype=np.float32)
+        scores = np.array([1, 0.5, 1, 0.2], dtype=np.float32)
+        self.assertEqual(model._top(scores, taste, 3), [
+            (10, 1.0, [('category', 'Fiction')]),
+            (30, 1.0, [('category', 'Fiction')]),
+            (20, 0.5, []),
+        ])
+        self.assertEqual(model._top(scores, taste, 0), [])
+
+    def test_recommend_excludes_favorites(self):
+        model = self.make_model()
+        ranked = model.recommend([10], [], ['Ann'], limit=10)
+        self.assertEqual([book_id for book_id, _, _ in ranked], [30, 20, 40])
+
+    def test_stale_model_is_refreshed_in_background(self):
+        Book.objects.create(isbn13='r1', isbn10='r1', title='Dune', authors='Frank Herbert', categories='Fiction')
+
+        class Engine(RecommendationEngine):
+            refreshes = 0
+
+            def _start_refresh(self):
+                self.refreshes += 1
+
+            def _build(self):
+                # Перестройка в другом потоке не видит данных незавершенной транзакции теста
+                if self._model is None:
+                    return super()._build()
+                self._model, self._built_at = RecommendationModel(), time.monotonic()
+
+        engine = Engine()
+        with override_settings(RECOMMENDATION_MODEL_TTL=0):
+            first = engine.model()
+            # Устаревшая модель продолжает отвечать, перестройка запускается один раз
+            self.assertIs(engine.model(), first)
+            self.assertIs(engine.model(), first)
+            self.assertEqual(engine.refreshes, 1)
+
+            # Фоновая перестройка идет в своем потоке со своим соединением
+            refresh = threading.Thread(target=engine._refresh)
+            refresh.start()
+            refresh.join()
+            self.assertIsNot(engine.model(), first)
+            self.assertEqual(engine.refreshes, 2)
+
+
+class RecommendationViewLLMTests(TestCase):
+    def setUp(self):
+        recommendation_engine.clear()
+        caches[RECOMMENDATION_CACHE].clear()
+        self.user = CustomUser.objects.create_user('reader@example.com', '87770000000', 'Reader', password='x')
+        UserProfile.objects.create(user=self.user)
+        favorite = Book.objects.create(isbn13='1', isbn10='1', title='Dune', authors='Frank Herbert', categories='Fiction')
+        self.candidate = Book.objects.create(
+            isbn13='2', isbn10='2', title='Dune Messiah', authors='Frank Herbert', categories='Fiction'
+        )
+        UserFavoriteBook.objects.create(user=self.user, book=favorite)
+        self.headers = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.user).access_token}'}
+
+    def tearDown(self):
+        recommendation_engine.clear()
+
+    def test_requires_jwt(self):
+        response = self.client.post('/api/recommendations/', {}, content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_local_ranking_without_llm(self):
+        with override_settings(OPENAI_API_KEY=''):
+            response = self.client.post(
+                '/api/recommendations/', {'limit': 5}, content_type='application/json', **self.headers
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([book['id'] for book in response.json()['recommended_books']], [self.candidate.id])
+
+    def test_llm_comments_from_stub(self):
+        with StubCompletionServer() as server:
+            server.responses = [(0, 200, json.dumps([{'id': self.candidate.id, 'comment': 'Продолжение'}]))]
+            with override_settings(OPENAI_API_KEY='key', OPENAI_URL=server.url):
+                response = self.client.post(
+                    '/api/recommendations/', {'limit': 5}, content_type='application/json', **self.headers
+                )
+        self.assertEqual(response.json()['recommended_books'], [{'id': self.candidate.id, 'comment': 'Продолжение'}])
+
+    def test_failing_llm_falls_back_to_local_comments(self):
+        with StubCompletionServer() as server:
+            server.responses = [(0, 500, '')] * 3
+            with override_settings(OPENAI_API_KEY='key', OPENAI_URL=server.url, OPENAI_DEADLINE=2):
+                response = self.client.post(
+                    '/api/recommendations/', {'limit': 5}, content_type='application/json', **self.headers
+                )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['recommended_books'][0]['id'], self.candidate.id)
+
+
+class RecommendationCacheTests(AuthenticatedTestCase):
+    def setUp(self):
+        super().setUp()
+        recommendation_engine.clear()
+        caches[RECOMMENDATION_CACHE].clear()
+        self.profile = UserProfile.objects.create(user=self.user)
+        self.favorite = Book.objects.create(isbn13='c1', isbn10='c1', title='Dune', authors='Frank Herbert',
+                                            categories='Fiction')
+        self.other = Book.objects.create(isbn13='c2', isbn10='c2', title='Emma', authors='Jane Austen',
+                                         categories='Classics')
+        UserFavoriteBook.objects.create(user=self.user, book=self.favorite)
+
+    def tearDown(self):
+        recommendation_engine.clear()
+
+    def recommend(self):
+        with override_settings(OPENAI_API_KEY=''):
+            response = self.client.post('/api/recommendations/', {'limit': 5}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data['recommended_books']
+
+    def cached(self):
+        return caches[RECOMMENDATION_CACHE].get(f'recommendations:{self.user.id}')
+
+    def test_unchanged_tastes_are_served_from_cache(self):
+        first = self.recommend()
+        self.assertEqual(self.cached()['recommended_books'], first)
+
+        # Попадание в кэш не обращается к модели рекомендаций
+        recommendation_engine.clear()
+        self.assertEqual(self.recommend(), first)
+        self.assertIsNone(recommendation_engine._model)
+
+    def test_taste_changes_invalidate_cache(self):
+        changes = (
+            lambda: UserFavoriteBook.objects.create(user=self.user, book=self.other),
+            lambda: UserFavoriteBook.objects.filter(user=self.user, book=self.other).delete(),
+            lambda: UserLikedCategories.objects.create(user=self.profile, category='Classics'),
+            lambda: UserLikedCategories.objects.filter(user=self.profile).delete(),
+            lambda: UserLikedAuthors.objects.create(user=self.profile, author='Jane Austen'),
+            lambda: UserLikedAuthors.objects.filter(user=self.profile).delete(),
+        )
+        for number, change in enumerate(changes):
+            with self.subTest(change=number):
+                self.recommend()
+                self.assertIsNotNone(self.cached())
+                change()
+                self.assertIsNone(self.cached())
+
+    def test_like_signal_reads_only_the_user_id(self):
+        like = UserLikedAuthors.objects.create(user=self.profile, author='Jane Austen')
+        like = UserLikedAuthors.objects.get(pk=like.pk)
+        # Удаление лайка и снимка, плюс один запрос user_id профиля вместо загрузки всей строки
+        with CaptureQueriesContext(connection) as queries:
+            like.delete()
+        profile_queries = [query['sql'] for query in queries if 'cores_userprofile' in query['sql']]
+        self.assertEqual(len(profile_queries), 1)
+        self.assertNotIn('"cores_userprofile"."id"', profile_queries[0].split('FROM')[0])
+
+
+class RecommendationSnapshotTests(AuthenticatedTestCase):
+    def setUp(self):
+        super().setUp()
+        recommendation_engine.clear()
+        caches[RECOMMENDATION_CACHE].clear()
+        self.profile = UserProfile.objects.create(user=self.user)
+        self.favorite = Book.objects.create(isbn13='p1', isbn10='p1', title='Dune', authors='Frank Herbert',
+                                            categories='Fiction')
+        self.sequel = Book.objects.create(isbn13='p2', isbn10='p2', title='Dune Messiah', authors='Frank Herbert',
+                                          categories='Fiction')
+        self.other = Book.objects.create(isbn13='p3', isbn10='p3', title='Emma', authors='Jane Austen',
+                                         categories='Classics')
+        UserFavoriteBook.objects.create(user=self.user, book=self.favorite)
+
+    def tearDown(self):
+        recommendation_engine.clear()
+
+    def recommend(self, limit):
+        with override_settings(OPENAI_API_KEY=''):
+            response = self.client.post('/api/recommendations/', {'limit': limit}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data['recommended_books']
+
+    def test_command_saves_snapshots_for_all_profiles(self):
+        other = CustomUser.objects.create_user('empty@example.com', '87770000019', 'Empty', password='x')
+        other_profile = UserProfile.objects.create(user=other)
+        UserLikedAuthors.objects.create(user=other_profile, author='Jane Austen')
+
+        call_command('precompute_recommendations', limit=2, chunk_size=1, stdout=io.StringIO())
+        snapshots = dict(RecommendationSnapshot.objects.values_list('user_id', 'recommended_books'))
+        self.assertEqual([book['id'] for book in snapshots[self.user.id]], [self.sequel.id, self.other.id])
+        self.assertEqual(snapshots[other.id][0]['id'], self.other.id)
+        self.assertIn('Jane Austen', snapshots[other.id][0]['comment'])
+
+        # Повторный запуск обновляет снимки, а не создает новые
+        call_command('precompute_recommendations', limit=1, stdout=io.StringIO())
+        self.assertEqual(RecommendationSnapshot.objects.count(), 2)
+        self.assertEqual(len(RecommendationSnapshot.objects.get(user=self.user).recommended_books), 1)
+
+    def test_view_serves_snapshot_then_falls_back(self):
+        call_command('precompute_recommendations', limit=2, stdout=io.StringIO())
+        RecommendationSnapshot.objects.filter(user=self.user).update(
+            recommended_books=[{'id': self.other.id, 'comment': 'Из снимка'}, {'id': self.sequel.id, 'comment': ''}]
+        )
+        # Снимок отдается одним запросом, без профиля и модели
+        with self.assertNumQueries(1):
+            self.assertEqual(self.recommend(1), [{'id': self.other.id, 'comment': 'Из снимка'}])
+        # В снимке меньше рекомендаций, чем просят: считаются заново
+        self.assertEqual([book['id'] for book in self.recommend(3)], [self.sequel.id, self.other.id])
+
+        invalidate_recommendations(self.user.id)
+        self.assertFalse(RecommendationSnapshot.objects.exists())
+        self.assertEqual([book['id'] for book in self.recommend(1)], [self.sequel.id])
+
+
+class UserProfileViewTests(AuthenticatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.profile = UserProfile.objects.create(user=self.user)
+
+    def add_history(self, start, count):
+        for number in range(start, start + count):
+            book = Book.objects.create(
+                isbn13=f'p{number}', isbn10=f'p{number}', title=f'Book {number}', authors=f'Author {number}'
+            )
+            UserFavoriteBook.objects.create(user=self.user, book=book)
+            discussion = Discussion.objects.create(book=book, title=f'About {number}', author=self.user)
+            Comment.objects.create(discussion=discussion, content=f'Comment {number}', author=self.user)
+            UserLikedCategories.objects.create(user=self.profile, category=f'Category {number}')
+            UserLikedAuthors.objects.create(user=self.profile, author=f'Author {number}')
+
+    def test_query_count_does_not_grow_with_history(self):
+        # профиль с пользователем, категории, авторы, страница избранного, страница комментариев
+        self.add_history(0, 3)
+        with self.assertNumQueries(5):
+            self.client.get('/api/user_profile/')
+
+        self.add_history(3, 30)
+        with self.assertNumQueries(5):
+            response = self.client.get('/api/user_profile/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['liked_authors']), 33)
+        self.assertIn('Author 0', response.data['liked_authors'])
+
+    def test_sub_collections_are_paginated(self):
+        self.add_history(0, 5)
+
+        response = self.client.get('/api/user_profile/', {'limit': 2})
+        favorites = response.data['favorite_books']
+        self.assertEqual([book['title'] for book in favorites['results']], ['Book 4', 'Book 3'])
+        self.assertIn('favorite_books_offset=2', favorites['next'])
+
+        response = self.client.get('/api/user_profile/', {'limit': 2, 'comments_offset': 4})
+        comments = response.data['comments']
+        self.assertEqual([comment['content'] for comment in comments['results']], ['Comment 0'])
+        self.assertIsNone(comments['next'])
+
+    def test_invalid_pagination_parameters(self):
+        response = self.client.get('/api/user_profile/', {'limit': 'many'})
+        self.assertEqual(response.status_code, 400)
+
+
+class FavoriteBookViewTests(AuthenticatedTestCase):
+    def setUp(self):
+        super().setUp()
+        for number in range(5):
+            book = Book.objects.create(isbn13=f'f{number}', isbn10=f'f{number}', title=f'Book {number}')
+            UserFavoriteBook.objects.create(user=self.user, book=book)
+
+    def test_cursor_pages_in_one_query(self):
+        titles = []
+        params = {'page_size': 2}
+        while True:
+            with self.assertNumQueries(1):
+                response = self.client.get('/api/favorites/', params)
+            titles += [book['title'] for book in response.data['favorites']]
+            if not response.data['next']:
+                break
+            params['cursor'] = parse_qs(urlparse(response.data['next']).query)['cursor'][0]
+
+        self.assertEqual(titles, [f'Book {number}' for number in reversed(range(5))])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/favorites/', {'cursor': 'broken'})
+        self.assertEqual(response.status_code, 400)
+
+
+class DiscussionListTests(AuthenticatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.book = Book.objects.create(isbn13='d1', isbn10='d1', title='Book')
+        self.discussion = Discussion.objects.create(book=self.book, title='Thread', author=self.user)
+
+    def test_comments_page_in_constant_queries(self):
+        for number in range(25):
+            Comment.objects.create(discussion=self.discussion, content=f'Comment {number}', author=self.user)
+
+        url = f'/api/discussions/{self.discussion.id}/comments/'
+        contents, params = [], {'page_size': 10}
+        while True:
+            # проверка обсуждения и страница комментариев вместе с авторами
+            with self.assertNumQueries(2):
+                response = self.client.get(url, params)
+            contents += [comment['content'] for comment in response.data['results']]
+            if not response.data['next']:
+                break
+            params['cursor'] = parse_qs(urlparse(response.data['next']).query)['cursor'][0]
+
+        self.assertEqual(contents, [f'Comment {number}' for number in range(25)])
+
+    def test_discussions_filtered_by_book(self):
+        other = Book.objects.create(isbn13='d2', isbn10='d2', title='Other')
+        Discussion.objects.create(book=other, title='Elsewhere', author=self.user)
+
+        response = self.client.get('/api/discussions/', {'book': self.book.id})
+        self.assertEqual([discussion['title'] for discussion in response.data['results']], ['Thread'])
+        self.assertIsNone(response.data['next'])
+
+        for book in ('x', '-1', '0', str(2 ** 63), '99999999999999999999'):
+            self.assertEqual(self.client.get('/api/discussions/', {'book': book}).status_code, 400)
+
+
+class CategorySyncTests(TestCase):
+    def setUp(self):
+        caches[CATALOG_CACHE].clear()
+        self.book = Book.objects.create(isbn13='s1', isbn10='s1', title='Synced', authors='Ann', categories='Fiction, Magic')
+
+    def names(self, related):
+        return sorted(related.values_list('name', flat=True))
+
+    def test_categories_follow_book_and_unused_are_removed(self):
+        self.assertEqual(self.names(self.book.normalized_categories), ['Fiction', 'Magic'])
+        self.book.categories = 'Poetry'
+        self.book.save()
+        self.assertEqual(self.names(self.book.normalized_categories), ['Poetry'])
+        self.assertEqual(self.names(Category.objects), ['Poetry'])
+
+        self.book.delete()
+        self.assertFalse(Category.objects.exists())
+
+    def test_liked_category_must_have_books(self):
+        user = CustomUser.objects.create_user('sync@example.com', '87770000012', 'Sync', password='x')
+        UserProfile.objects.create(user=user)
+        client = APIClient()
+        client.force_authenticate(user)
+        self.book.categories = 'Fiction'
+        self.book.save()
+        self.assertEqual(client.post('/api/liked_categories/', {"category": "Magic"}).status_code, 404)
+        self.assertEqual(client.get('/api/categories/').data['categories'], ['Fiction'])
+
+    def test_admin_edit_keeps_categories_in_sync(self):
+        admin = CustomUser.objects.create_superuser('admin@example.com', '87770000013', 'Admin', password='x')
+        self.client.force_login(admin)
+        data = {
+            'isbn13': 's1', 'isbn10': 's1', 'title': 'Synced', 'authors': 'Ann', 'categories': 'Poetry',
+            'favorites_count': 0, 'discussions_count': 0, 'comments_count': 0,
+        }
+        response = self.client.post(f'/admin/cores/book/{self.book.id}/change/', data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.names(self.book.normalized_categories), ['Poetry'])
+
+    def test_data_migration_links_existing_books(self):
+        Book.objects.bulk_create([Book(isbn13='s2', isbn10='s2', title='Raw', authors='Bob', categories='History, Art')])
+        migration = importlib.import_module('cores.migrations.0010_populate_categories')
+        migration.populate_categories(apps, SimpleNamespace(connection=connection))
+        self.assertEqual(self.names(Book.objects.get(isbn13='s2').normalized_categories), ['Art', 'History'])
+
+
+class AuthorSyncTests(AuthenticatedTestCase):
+    def setUp(self):
+        super().setUp()
+        caches[CATALOG_CACHE].clear()
+        self.book = Book.objects.create(isbn13='a1', isbn10='a1', title='Synced', authors='Ann; Bob')
+        UserProfile.objects.create(user=self.user)
+
+    def test_authors_follow_book_and_unused_are_removed(self):
+        self.book.authors = 'Ann'
+        self.book.save()
+        self.assertEqual(list(self.book.normalized_authors.values_list('name', flat=True)), ['Ann'])
+        self.assertEqual(self.client.post('/api/liked-authors/', {"author": "Bob"}).status_code, 404)
+        response = self.client.post('/api/liked-authors/batch/', {"authors": ['Ann', 'Bob']}, format='json')
+        self.assertEqual((response.data['added'], response.data['missing']), (['Ann'], ['Bob']))
+
+        self.book.delete()
+        self.assertFalse(Author.objects.exists())
+
+    def test_admin_edit_keeps_authors_in_sync(self):
+        admin = CustomUser.objects.create_superuser('admin@example.com', '87770000015', 'Admin', password='x')
+        self.client.force_login(admin)
+        data = {
+            'isbn13': 'a1', 'isbn10': 'a1', 'title': 'Synced', 'authors': 'Carol',
+            'favorites_count': 0, 'discussions_count': 0, 'comments_count': 0,
+        }
+        self.client.post(f'/admin/cores/book/{self.book.id}/change/', data)
+        self.assertEqual(list(self.book.normalized_authors.values_list('name', flat=True)), ['Carol'])
+
+    def test_data_migration_links_existing_books(self):
+        Book.objects.bulk_create([Book(isbn13='a2', isbn10='a2', title='Raw', authors='Dan; Eve')])
+        migration = importlib.import_module('cores.migrations.0012_populate_authors')
+        migration.populate_authors(apps, SimpleNamespace(connection=connection))
+        names = Book.objects.get(isbn13='a2').normalized_authors.values_list('name', flat=True)
+        self.assertEqual(sorted(names), ['Dan', 'Eve'])
+
+
+class AutoCompleteTests(TestCase):
+    def make_index(self, titles):
+        index = PrefixIndex()
+        index.load((number, [title], {"id": number}, rank) for number, (title, rank) in enumerate(titles))
+        return index
+
+    def ids(self, results):
+        return [result['id'] for result in results]
+
+    def test_ranking_order(self):
+        index = self.make_index([('Harry Potter', 5), ('Hamlet', 50), ('Hobbit', 50), ('The Hunger Games', 7)])
+        # Выше ранг, при равном ранге — по алфавиту; совпадения ищутся и с начала слова
+        self.assertEqual(self.ids(index.search('h')), [1, 2, 3, 0])
+        self.assertEqual(self.ids(index.search('ha')), [1, 0])
+        self.assertEqual(self.ids(index.search('hun')), [3])
+        self.assertEqual(self.ids(index.search('h', limit=2)), [1, 2])
+
+    def test_incremental_updates_keep_short_prefix_top(self):
+        index = self.make_index([(f'Book {number}', number) for number in range(TOP_SIZE * 2)])
+        best = list(range(TOP_SIZE * 2 - 1, TOP_SIZE * 2 - 11, -1))
+        self.assertEqual(self.ids(index.search('b')), best)
+        self.assertEqual(self.ids(index.search('book 1')), [199, 198, 197, 196, 195, 194, 193, 192, 191, 190])
+
+        index.add('new', ['Brand new'], {"id": 'new'}, 1000)
+        self.assertEqual(self.ids(index.search('b'))[:2], ['new', best[0]])
+        self.assertEqual(self.ids(index.search('br')), ['new'])
+
+        index.set_rank('new', -1)
+        self.assertEqual(self.ids(index.search('b')), best)
+
+        index.remove('new')
+        for number in range(TOP_SIZE * 2 - 1, 5, -1):
+            index.remove(number)
+        # Топ опустел после удалений и пересчитывается по оставшимся книгам
+        self.assertEqual(self.ids(index.search('b')), [5, 4, 3, 2, 1, 0])
+        self.assertEqual(index.search('br'), [])
+
+    def test_long_titles_use_capped_keys(self):
+        title = 'The Lord of the Rings: The Fellowship of the Ring, Being the First Part'
+        index = self.make_index([(title, 1), ('The Lord of the Rings: The Two Towers', 2)])
+        self.assertTrue(all(len(key) <= KEY_LENGTH for key, _ in index._keys))
+        # Запрос длиннее ключа сверяется с полным названием
+        self.assertEqual(self.ids(index.search('the lord of the rings: the fellowship')), [0])
+        self.assertEqual(self.ids(index.search('lord of the rings: the two')), [1])
+        # Хвосты берутся только с первых MAX_WORD_KEYS слов
+        self.assertEqual(self.ids(index.search('fellowship')), [0])
+        self.assertEqual(index.search('first part'), [])
+
+        self.assertEqual(self.ids(index.search('the lord of the rings: the fellowship', limit=5)), [0])
+        index.remove(0)
+        self.assertEqual(index.search('the lord of the rings: the fellowship', limit=5), [])
+
+    def test_book_changes_update_indexes(self):
+        index = AutoCompleteIndex()
+        book = Book.objects.create(isbn13='ac1', isbn10='ac1', title='Dune', authors='Frank Herbert',
+                                   categories='Fiction', ratings_count=10)
+        index.rebuild()
+        self.assertEqual(index.search_books('du'), [{"id": book.id, "title": 'Dune', "subtitle": None}])
+
+        book.title, book.authors, book.categories = 'Dune Messiah', 'Frank Herbert; Brian Herbert', 'Science'
+        index.update_book(book)
+        self.assertEqual(self.ids(index.search_books('mess')), [book.id])
+        self.assertEqual(index.search_authors('herb'), [{"name": 'Brian Herbert'}, {"name": 'Frank Herbert'}])
+        self.assertEqual(index.search_categories('fi'), [])
+        self.assertEqual(index.search_categories('sci'), [{"name": 'Science'}])
+
+        index.remove_book(book.id)
+        self.assertEqual(index.search_books('du'), [])
+        self.assertEqual(index.search_authors('fr'), [])
+
+    def test_stale_index_is_refreshed_in_background(self):
+        first = Book.objects.create(isbn13='ac2', isbn10='ac2', title='Emma', authors='Jane Austen')
+
+        class Index(AutoCompleteIndex):
+            refreshes = 0
+
+            def _start_refresh(self):
+                self.refreshes += 1
+
+        index = Index()
+        with override_settings(AUTOCOMPLETE_INDEX_TTL=0):
+            self.assertEqual(self.ids(index.search_books('em')), [first.id])
+            Book.objects.create(isbn13='ac3', isbn10='ac3', title='Emerald', authors='Ann')
+            # Устаревший индекс продолжает отвечать, перестройка запускается один раз
+            self.assertEqual(self.ids(index.search_books('em')), [first.id])
+            self.assertEqual(self.ids(index.search_books('em')), [first.id])
+        self.assertEqual(index.refreshes, 1)
+
+    def test_changes_during_rebuild_are_replayed(self):
+        book = Book.objects.create(isbn13='ac4', isbn10='ac4', title='Ulysses', authors='James Joyce')
+        index = AutoCompleteIndex()
+        index.rebuild()
+        load_rows = index._load_rows
+
+        def load_rows_during_save():
+            rows = load_rows()
+            # Книга изменилась после того, как перестройка прочитала каталог
+            book.title = 'Dubliners'
+            index.update_book(book)
+            return rows
+
+        index._load_rows = load_rows_during_save
+        index.rebuild()
+        self.assertEqual(self.ids(index.search_books('dub')), [book.id])
+        self.assertEqual(index.search_books('uly'), [])
+
+
+class CounterTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('counters@example.com', '87770000004', 'Counters', password='x')
+        self.book = Book.objects.create(isbn13='c1', isbn10='c1', title='Book')
+
+    def assertCounters(self, favorites, discussions, comments):
+        self.book.refresh_from_db()
+        self.assertEqual(
+            (self.book.favorites_count, self.book.discussions_count, self.book.comments_count),
+            (favorites, discussions, comments),
+        )
+
+    def test_counters_follow_creates_and_deletes(self):
+        favorite = UserFavoriteBook.objects.create(user=self.user, book=self.book)
+        discussion = Discussion.objects.create(book=self.book, title='Thread', author=self.user)
+        comments = [Comment.objects.create(discussion=discussion, content='...', author=self.user) for _ in range(3)]
+        self.assertCounters(1, 1, 3)
+        discussion.refresh_from_db()
+        self.assertEqual(discussion.comments_count, 3)
+        self.assertEqual(self.book.last_activity_at, comments[-1].created_at)
+
+        comments[0].delete()
+        self.assertCounters(1, 1, 2)
+        # Комментарии удаляются каскадом вместе с обсуждением
+        discussion.delete()
+        favorite.delete()
+        self.assertCounters(0, 0, 0)
+
+    def test_counters_follow_moves(self):
+        other = Book.objects.create(isbn13='c2', isbn10='c2', title='Other')
+        discussion = Discussion.objects.create(book=self.book, title='Thread', author=self.user)
+        target = Discussion.objects.create(book=other, title='Target', author=self.user)
+        comment = Comment.objects.create(discussion=discussion, content='...', author=self.user)
+        Comment.objects.create(discussion=discussion, content='...', author=self.user)
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        response = client.put(
+            f'/api/comments/{comment.id}/', {'discussion': target.id, 'content': 'moved'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertCounters(0, 1, 1)
+        target.refresh_from_db()
+        self.assertEqual(target.comments_count, 1)
+
+        response = client.put(f'/api/discussions/{discussion.id}/', {'book': other.id, 'title': 'Moved'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertCounters(0, 0, 0)
+        self.assertIsNone(self.book.last_activity_at)
+        other.refresh_from_db()
+        self.assertEqual((other.discussions_count, other.comments_count), (2, 2))
+
+        # Счетчики не уходят в минус, поэтому книгу можно удалить
+        self.book.delete()
+        other.delete()
+        self.assertFalse(Comment.objects.exists())
+
+    def test_repair_command_recomputes_counters(self):
+        discussion = Discussion.objects.create(book=self.book, title='Thread', author=self.user)
+        Comment.objects.create(discussion=discussion, content='...', author=self.user)
+        UserFavoriteBook.objects.create(user=self.user, book=self.book)
+        Book.objects.update(favorites_count=10, discussions_count=10, comments_count=10, last_activity_at=None)
+
+        call_command('repair_counters', stdout=io.StringIO())
+        self.assertCounters(1, 1, 1)
+        self.assertIsNotNone(self.book.last_activity_at)
+
+
+class BatchMutationTests(AuthenticatedTestCase):
+    def setUp(self):
+        super().setUp()
+        UserProfile.objects.create(user=self.user)
+        self.books = [
+            Book.objects.create(isbn13=f'b{number}', isbn10=f'b{number}', title=f'Book {number}') for number in range(5)
+        ]
+        Category.objects.bulk_create([Category(name='Fiction'), Category(name='History')])
+
+    def test_favorites_added_and_removed_in_constant_queries(self):
+        ids = [book.id for book in self.books]
+        absent = ids[-1] + 100
+        # BEGIN, проверка, вставка, пересчет счетчиков, отметка активности, сброс рекомендаций, COMMIT
+        with self.assertNumQueries(7):
+            response = self.client.post('/api/favorites/batch/', {"book_ids": ids + [absent]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['added'], response.data['missing']), (ids, [absent]))
+        self.assertEqual(set(Book.objects.values_list('favorites_count', flat=True)), {1})
+
+        response = self.client.post('/api/favorites/batch/', {"book_ids": ids[:2]}, format='json')
+        self.assertEqual((response.status_code, response.data['added']), (200, []))
+
+        response = self.client.delete('/api/favorites/batch/', {"book_ids": ids[:3]}, format='json')
+        self.assertEqual(response.data['removed'], ids[:3])
+        self.assertEqual(list(Book.objects.order_by('id').values_list('favorites_count', flat=True)), [0, 0, 0, 1, 1])
+
+    def test_removal_is_one_delete_without_signals(self):
+        ids = [book.id for book in self.books]
+        self.client.post('/api/favorites/batch/', {"book_ids": ids}, format='json')
+        self.client.post('/api/liked_categories/batch/', {"categories": ['Fiction', 'History']}, format='json')
+
+        for url, payload, table in (
+            ('/api/favorites/batch/', {"book_ids": ids[:3]}, UserFavoriteBook._meta.db_table),
+            ('/api/liked_categories/batch/', {"categories": ['Fiction', 'History']}, UserLikedCategories._meta.db_table),
+        ):
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as queries:
+                    self.assertEqual(self.client.delete(url, payload, format='json').status_code, 200)
+                deletes = [query['sql'] for query in queries if query['sql'].startswith(f'DELETE FROM "{table}"')]
+                # Один DELETE по id строк, без чтения объектов и сигналов по каждому
+                self.assertEqual(len(deletes), 1)
+                self.assertIn('"id" IN', deletes[0])
+        # Сигналы не срабатывали: счетчики пересчитаны один раз и не ушли в минус
+        self.assertEqual(list(Book.objects.order_by('id').values_list('favorites_count', flat=True)), [0, 0, 0, 1, 1])
+        with self.assertRaises(ValueError):
+            batch.delete_rows(Book, [self.books[0].id])
+
+    def test_liked_categories_batch(self):
+        response = self.client.post(
+            '/api/liked_categories/batch/', {"categories": ['History', 'Fiction', 'Nope']}, format='json'
+        )
+        self.assertEqual((response.data['added'], response.data['missing']), (['History', 'Fiction'], ['Nope']))
+        response = self.client.delete('/api/liked_categories/batch/', {"categories": ['Fiction']}, format='json')
+        self.assertEqual(response.data['removed'], ['Fiction'])
+        self.assertEqual(list(UserLikedCategories.objects.values_list('category', flat=True)), ['History'])
+
+    def test_invalid_payload(self):
+        for book_ids in (None, [], 1, ['x'], [True], [1.5], [0], [2 ** 63], [99999999999999999999], list(range(1, 102))):
+            payload = {} if book_ids is None else {"book_ids": book_ids}
+            with self.subTest(book_ids=book_ids):
+                self.assertEqual(self.client.post('/api/favorites/batch/', payload, format='json').status_code, 400)
+        response = self.client.post('/api/liked_categories/batch/', {"categories": ['x' * 256]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class CatalogCacheTests(AuthenticatedTestCase):
+    def setUp(self):
+        super().setUp()
+        caches[CATALOG_CACHE].clear()
+        self.book = Book.objects.create(isbn13='k1', isbn10='k1', title='Cached')
+
+    def test_detail_served_from_cache_until_book_changes(self):
+        url = f'/api/books/{self.book.id}/'
+        self.client.get(url)
+        # Из базы читаются только версия каталога и счетчики активности
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(url).data['title'], 'Cached')
+
+        self.book.title = 'Renamed'
+        self.book.save()
+        self.assertEqual(self.client.get(url).data['title'], 'Renamed')
+
+    def test_list_invalidated_by_import_in_other_process(self):
+        response = self.client.get('/api/books/')
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get('/api/books/').data['count'], 1)
+
+        # У другого процесса (import_books) свой кэш в памяти: этот кэш он не трогает
+        other_process = {**settings.CACHES, CATALOG_CACHE: {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'other-process',
+        }}
+        with override_settings(CACHES=other_process):
+            Book.objects.bulk_create([Book(isbn13='k2', isbn10='k2', title='Imported')])
+            bump_catalog_version()
+        self.assertEqual(self.client.get('/api/books/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+        self.assertEqual(self.client.get('/api/books/').data['count'], 2)
+
+    def test_cached_books_show_current_counters(self):
+        urls = ('/api/books/', f'/api/books/{self.book.id}/', f'/api/books/bulk/?ids={self.book.id}')
+        for url in urls:
+            self.client.get(url)
+
+        UserFavoriteBook.objects.create(user=self.user, book=self.book)
+        for url, books in zip(urls, ('results', None, 'results')):
+            data = self.client.get(url).data
+            book = data[books][0] if books else data
+            self.assertEqual(book['favorites_count'], 1)
+            self.assertIsNotNone(book['last_activity_at'])
+
+        # Без полей счетчиков в ответе лишний запрос не нужен, читается только версия каталога
+        self.client.get('/api/books/?fields=title')
+        with self.assertNumQueries(1):
+            self.assertNotIn('favorites_count', self.client.get('/api/books/?fields=title').data['results'][0])
+
+    def test_conditional_requests_read_only_catalog_state(self):
+        for url in ('/api/categories/', '/api/books/', f'/api/books/{self.book.id}/'):
+            response = self.client.get(url)
+            etag, last_modified = response['ETag'], response['Last-Modified']
+
+            # Пользователь уже аутентифицирован в тесте, поэтому для 304 нужна только версия каталога
+            with self.assertNumQueries(1):
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        self.book.save()
+        self.assertEqual(self.client.get('/api/categories/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_counter_changes_update_book_validators(self):
+        book_urls = ('/api/books/', f'/api/books/{self.book.id}/', f'/api/books/bulk/?ids={self.book.id}')
+        validators = {url: self.client.get(url)['ETag'] for url in book_urls + ('/api/categories/',)}
+
+        time.sleep(0.01)
+        UserFavoriteBook.objects.create(user=self.user, book=self.book)
+        for url in book_urls:
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=validators[url]).status_code, 200)
+        # Список категорий от счетчиков не зависит и по-прежнему не меняется
+        self.assertEqual(
+            self.client.get('/api/categories/', HTTP_IF_NONE_MATCH=validators['/api/categories/']).status_code, 304
+        )
+
+        etag = self.client.get(book_urls[1])['ETag']
+        time.sleep(0.01)
+        self.client.delete('/api/favorites/batch/', {'book_ids': [self.book.id]}, format='json')
+        response = self.client.get(book_urls[1], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.data['favorites_count']), (200, 0))
+
+
+class BookListQueryTests(AuthenticatedTestCase):
+    def setUp(self):
+        super().setUp()
+        caches[CATALOG_CACHE].clear()
+        Book.objects.create(isbn13='l1', isbn10='l1', title='beta', authors='Ann', categories='Fiction',
+                            published_year=1995, average_rating=4.5, ratings_count=10, description='long')
+        Book.objects.create(isbn13='l2', isbn10='l2', title='Alpha', authors='Bob', categories='Fiction',
+                            published_year=2005, average_rating=3.9, ratings_count=50)
+        Book.objects.create(isbn13='l3', isbn10='l3', title='gamma', authors='Ann', categories='History',
+                            published_year=1998, average_rating=4.1, ratings_count=5)
+
+    def titles(self, query):
+        response = self.client.get('/api/books/?' + query)
+        self.assertEqual(response.status_code, 200)
+        return [book['title'] for book in response.data['results']]
+
+    def test_filters_and_ordering(self):
+        self.assertEqual(self.titles('ordering=title'), ['Alpha', 'beta', 'gamma'])
+        self.assertEqual(self.titles('ordering=-ratings_count'), ['Alpha', 'beta', 'gamma'])
+        self.assertEqual(self.titles('year_min=1990&year_max=1999&ordering=-average_rating'), ['beta', 'gamma'])
+        self.assertEqual(self.titles('min_rating=4&author=Ann&ordering=title'), ['beta', 'gamma'])
+        self.assertEqual(self.titles('category=Fiction&ordering=-title'), ['beta', 'Alpha'])
+
+    def test_sparse_fields_limit_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/books/?fields=title&ordering=id')
+        self.assertEqual(response.data['results'][0], {'id': Book.objects.get(isbn13='l1').id, 'title': 'beta'})
+        self.assertNotIn('description', queries.captured_queries[-1]['sql'])
+
+    def test_invalid_parameters(self):
+        for query in ('ordering=isbn13', 'fields=password', 'year_min=x', 'min_rating=9'):
+            self.assertEqual(self.client.get('/api/books/?' + query).status_code, 400)
+
+    def test_keyset_pages_cover_nullable_orderings(self):
+        Book.objects.create(isbn13='l4', isbn10='l4', title='delta')
+        Book.objects.create(isbn13='l5', isbn10='l5', title='epsilon')
+        for ordering in ('-average_rating', 'average_rating', 'title', '-last_activity_at'):
+            url = f'/api/books/?pagination=keyset&page_size=2&count=false&ordering={ordering}'
+            titles = []
+            while url:
+                with self.assertNumQueries(2):
+                    response = self.client.get(url)
+                self.assertNotIn('count', response.data)
+                titles += [book['title'] for book in response.data['results']]
+                url = response.data['next']
+            self.assertEqual(sorted(titles), ['Alpha', 'beta', 'delta', 'epsilon', 'gamma'])
+
+        response = self.client.get('/api/books/?pagination=keyset&ordering=-ratings_count')
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual(self.client.get('/api/books/?pagination=keyset&cursor=broken').status_code, 400)
+
+
+class BookBulkViewTests(AuthenticatedTestCase):
+    def setUp(self):
+        super().setUp()
+        caches[CATALOG_CACHE].clear()
+        self.first = Book.objects.create(isbn13='9780000000001', isbn10='0000000001', title='First')
+        self.second = Book.objects.create(isbn13='9780000000002', isbn10='0000000002', title='Second')
+
+    def test_books_in_request_order_with_missing_keys(self):
+        absent = self.second.id + 100
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/books/bulk/?ids={self.second.id},{absent},{self.first.id}&fields=title')
+        self.assertEqual([book['title'] for book in response.data['results']], ['Second', 'First'])
+        self.assertEqual(response.data['missing'], [absent])
+
+        response = self.client.get('/api/books/bulk/?isbns=0000000001,978-0000000002,123')
+        self.assertEqual([book['title'] for book in response.data['results']], ['First', 'Second'])
+        self.assertEqual(response.data['missing'], ['123'])
+
+    def test_invalid_requests(self):
+        too_many = ','.join(str(number) for number in range(1, 102))
+        queries = ('', 'ids=1&isbns=1', 'ids=a', 'ids=0', f'ids={2 ** 63}', 'ids=99999999999999999999', f'ids={too_many}')
+        for query in queries:
+            self.assertEqual(self.client.get('/api/books/bulk/?' + query).status_code, 400)
+
+
+class FullTextSearchTests(AuthenticatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.in_description = Book.objects.create(isbn13='t1', isbn10='t1', title='Quiet Hills', authors='Ann',
+                                                  description='A story about a dragon')
+        self.in_title = Book.objects.create(isbn13='t2', isbn10='t2', title='Dragon Rider', authors='Bob')
+        Book.objects.create(isbn13='t3', isbn10='t3', title='Sea Tales', authors='Dragomir Petrov')
+
+    def search(self, query, **params):
+        return self.client.get('/api/books/search/', {'q': query, 'mode': 'fulltext', **params})
+
+    def ids(self, response):
+        return [book['id'] for book in response.data['results']]
+
+    def test_title_match_ranks_first(self):
+        self.assertEqual(self.ids(self.search('dragon')), [self.in_title.id, self.in_description.id])
+
+    def test_last_word_matches_as_prefix(self):
+        self.assertEqual(len(self.ids(self.search('drag'))), 3)
+        self.assertEqual(self.ids(self.search('dragon rid')), [self.in_title.id])
+        self.assertEqual(self.ids(self.search('rid dragon')), [])
+
+    def test_cursor_pages_without_duplicates(self):
+        expected = {self.in_title.id, self.in_description.id}
+        for number in range(7):
+            expected.add(Book.objects.create(isbn13=f't{number + 10}', isbn10=f't{number + 10}',
+                                             title=f'Dragon {number}', authors='Cy').id)
+        found = []
+        params = {'page_size': 2}
+        while True:
+            response = self.search('dragon', **params)
+            self.assertLessEqual(len(response.data['results']), 2)
+            found += self.ids(response)
+            if not response.data['next']:
+                break
+            params['cursor'] = parse_qs(urlparse(response.data['next']).query)['cursor'][0]
+        self.assertEqual(len(found), len(set(found)))
+        self.assertEqual(set(found), expected)
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.search('dragon', page_size='many').status_code, 400)
+        self.assertEqual(self.search('dragon', cursor='broken').status_code, 400)
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'Проверка SQLite без FTS5')
+    def test_unavailable_without_fts5(self):
+        available = search._sqlite_fts_available
+        search._sqlite_fts_available = False
+        try:
+            self.assertEqual(self.search('dragon').status_code, 501)
+        finally:
+            search._sqlite_fts_available = available
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'Триггеры FTS5 есть только в SQLite')
+    def test_counter_updates_skip_index(self):
+        def changes(update):
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT total_changes()')
+                before = cursor.fetchone()[0]
+                Book.objects.filter(pk=self.in_title.pk).update(**update)
+                cursor.execute('SELECT total_changes()')
+                return cursor.fetchone()[0] - before
+
+        # total_changes() учитывает и строки, измененные триггерами
+        self.assertEqual(changes({'favorites_count': 1}), 1)
+        self.assertGreater(changes({'title': 'Griffin Rider'}), 1)
+        self.assertEqual(self.ids(self.search('griffin')), [self.in_title.id])
+
+
+class FacetBrowseTests(AuthenticatedTestCase):
+    def setUp(self):
+        super().setUp()
+        caches[CATALOG_CACHE].clear()
+        self.books = [
+            Book.objects.create(
+                isbn13=f'b{number}', isbn10=f'b{number}', title=f'Book {number}', authors='Ann;Bob',
+                categories='Fiction, Drama' if number % 2 else 'Fiction', published_year=1990 + number,
+                average_rating=Decimal('4.5'),
+            )
+            for number in range(5)
+        ]
+
+    def test_facet_values_with_counts(self):
+        response = self.client.get('/api/books/browse/', {'facet': 'category'})
+        self.assertEqual(response.data['results'], [{'value': 'Fiction', 'count': 5}, {'value': 'Drama', 'count': 2}])
+
+    def test_facet_books_in_one_query(self):
+        # Версия каталога и страница книг
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/books/browse/', {'facet': 'year', 'value': '1990', 'page_size': 3})
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual(response.data['results'], [book.id for book in self.books[:3]])
+        self.assertIsNotNone(response.data['next'])
+
+    def test_facets_follow_book_changes(self):
+        book = self.books[0]
+        book.categories = 'Poetry'
+        book.save()
+        self.books[1].delete()
+
+        response = self.client.get('/api/books/browse/', {'facet': 'category'})
+        self.assertEqual(
+            response.data['results'],
+            [{'value': 'Fiction', 'count': 3}, {'value': 'Drama', 'count': 1}, {'value': 'Poetry', 'count': 1}],
+        )
+
+
+class ImportTests(TestCase):
+    def row(self, **values):
+        return {'isbn13': '9780000000001', 'isbn10': '0000000001', 'title': 'Imported', **values}
+
+    def test_clean_row_validation(self):
+        cleaned = clean_row(self.row(isbn10=123.0, authors=' ', published_year='1999.0', average_rating=4.256))
+        self.assertEqual(cleaned['isbn10'], '0000000123')
+        self.assertEqual(cleaned['authors'], DEFAULT_AUTHOR)
+        self.assertEqual(cleaned['published_year'], 1999)
+        self.assertEqual(cleaned['average_rating'], Decimal('4.26'))
+        cleaned = clean_row(self.row(isbn13='978-0-00-000000-1', isbn10='000000000x'))
+        self.assertEqual((cleaned['isbn13'], cleaned['isbn10']), ('9780000000001', '000000000X'))
+
+        # Свободный текст обрезается с записью в лог, слишком длинная ссылка отбрасывается
+        with self.assertLogs('cores.importing', 'WARNING') as logs:
+            cleaned = clean_row(self.row(title='x' * 300, thumbnail='http://example.com/' + 'x' * 200))
+        self.assertEqual((len(cleaned['title']), cleaned['thumbnail']), (255, None))
+        self.assertEqual(len(logs.records), 2)
+
+        for values, message in (
+            ({'title': ''}, 'title is required'),
+            ({'isbn13': None}, 'isbn13 is required'),
+            ({'isbn13': '97800000000012'}, 'isbn13 is malformed'),
+            ({'isbn13': '978000000000A'}, 'isbn13 is malformed'),
+            ({'isbn10': '00000000011'}, 'isbn10 is malformed'),
+            ({'isbn10': '0000X00001'}, 'isbn10 is malformed'),
+            ({'num_pages': 'many'}, 'num_pages must be a number'),
+            ({'average_rating': 'high'}, 'average_rating must be a number'),
+        ):
+            with self.assertRaisesMessage(RowError, message):
+                clean_row(self.row(**values))
+
+        count, cleaned, errors = clean_rows([self.row(), self.row(title='')], first_number=5)
+        self.assertEqual((count, len(cleaned)), (2, 1))
+        self.assertEqual(errors, [(6, 'title is required')])
+
+    def test_upsert_updates_changed_row(self):
+        self.assertEqual(upsert_books([clean_row(self.row(categories='Fiction'))]), (1, []))
+        saved, errors = upsert_books([clean_row(self.row(title='Renamed', categories='Poetry', ratings_count=3))])
+        self.assertEqual((saved, errors), (1, []))
+
+        book = Book.objects.get()
+        self.assertEqual((book.title, book.ratings_count), ('Renamed', 3))
+        self.assertEqual(list(book.normalized_categories.values_list('name', flat=True)), ['Poetry'])
+        self.assertEqual(list(Category.objects.values_list('name', flat=True)), ['Poetry'])
+
+    def test_isbn10_conflict_falls_back_to_row_by_row(self):
+        Book.objects.create(isbn13='9780000000009', isbn10='0000000002', title='Existing', authors='Ann')
+        rows = [
+            clean_row(self.row()),
+            clean_row(self.row(isbn13='9780000000002', isbn10='0000000002', title='Conflict')),
+        ]
+        saved, errors = upsert_books(rows)
+        self.assertEqual(saved, 1)
+        self.assertEqual([isbn13 for isbn13, _ in errors], ['9780000000002'])
+        self.assertEqual(sorted(Book.objects.values_list('title', flat=True)), ['Existing', 'Imported'])
+        self.assertEqual(Book.objects.get(title='Imported').normalized_authors.get().name, DEFAULT_AUTHOR)
+
+
+class ImportCommandTests(TransactionTestCase):
+    # TransactionTestCase: параллельный импорт закрывает соединения перед запуском пула процессов
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, lines):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write('\n'.join(lines) + '\n')
+        return path
+
+    def jsonl(self, titles):
+        return [
+            json.dumps({'isbn13': f'97800000000{number:02d}', 'isbn10': f'00000000{number:02d}', 'title': title})
+            for number, title in enumerate(titles)
+        ]
+
+    def run_import(self, path, **options):
+        stderr = io.StringIO()
+        call_command('import_books', path, stdout=io.StringIO(), stderr=stderr, **options)
+        return stderr.getvalue()
+
+    def test_parallel_import(self):
+        rows = [f'97800000000{number:02d},00000000{number:02d},Book {number}' for number in range(9)]
+        rows[4] = '9780000000004,0000000004,'
+        path = self.write('books.csv', ['isbn13,isbn10,title'] + rows)
+
+        stderr = self.run_import(path, workers=2, batch_size=2)
+        self.assertIn('Запись 5 пропущена: title is required', stderr)
+        self.assertEqual(
+            sorted(Book.objects.values_list('title', flat=True)),
+            [f'Book {number}' for number in range(9) if number != 4],
+        )
+
+    def test_batch_ranges_keep_records_whole(self):
+        path = self.write('books.csv', [
+            'isbn13,isbn10,title,description',
+            '9780000000001,0000000001,First,"Two',
+            'lines, ""quoted"""',
+            '',
+            '9780000000002,0000000002,Second,',
+            '9780000000003,0000000003,Third,"One ""more""',
+            '"',
+        ])
+        for start in (0, 1):
+            with self.subTest(start=start):
+                ranges = list(batch_ranges(path, 'csv', start, batch_size=1))
+                rows = [row for begin, end, _ in ranges for row in read_range(path, 'csv', begin, end)]
+                self.assertEqual(rows, list(read_rows(path, 'csv', start)))
+                self.assertEqual([count for *_, count in ranges], [1] * (3 - start))
+        self.assertEqual(rows[-1]['description'], 'One "more"\n')
+
+        path = self.write('books.jsonl', self.jsonl(['First', 'Second']) + ['', '{"title": "Third"}'])
+        ranges = list(batch_ranges(path, 'jsonl', batch_size=2))
+        self.assertEqual([count for *_, count in ranges], [2, 1])
+        rows = [row for begin, end, _ in ranges for row in read_range(path, 'jsonl', begin, end)]
+        self.assertEqual(rows, list(read_rows(path, 'jsonl')))
+
+    def test_resume_from_checkpoint(self):
+        path = self.write('books.jsonl', self.jsonl(['First', 'Second', 'Third', 'Fourth']))
+        state_path = os.path.join(self.directory.name, 'state.json')
+        Checkpoint(state_path, path).save(2)
+
+        self.run_import(path, checkpoint=state_path, batch_size=1)
+        self.assertEqual(sorted(Book.objects.values_list('title', flat=True)), ['Fourth', 'Third'])
+        self.assertFalse(os.path.exists(state_path))
+
+    def test_checkpoint_of_another_file(self):
+        other = self.write('other.jsonl', self.jsonl(['Other']))
+        path = self.write('books.jsonl', self.jsonl(['First']))
+        state_path = os.path.join(self.directory.name, 'state.json')
+        Checkpoint(state_path, other).save(1)
+
+        with self.assertRaisesMessage(CommandError, 'belongs to another file'):
+            self.run_import(path, checkpoint=state_path)
+        self.assertFalse(Book.objects.exists())
+
+    def test_checkpoint_kept_after_partial_failure(self):
+        lines = self.jsonl(['First', 'Second', 'Third'])
+        lines.insert(2, '{broken')
+        path = self.write('books.jsonl', lines)
+        state_path = os.path.join(self.directory.name, 'state.json')
+
+        # Параллельный импорт разбирает пачки заранее, но ошибка второй пачки
+        # всплывает только после записи первой
+        for workers in (1, 2):
+            Book.objects.all().delete()
+            Checkpoint(state_path, path).clear()
+            with self.subTest(workers=workers):
+                with self.assertRaises(CommandError):
+                    self.run_import(path, checkpoint=state_path, batch_size=2, workers=workers)
+                self.assertEqual(sorted(Book.objects.values_list('title', flat=True)), ['First', 'Second'])
+                self.assertEqual(Checkpoint(state_path, path).load(), 2)
+
+
+class ExportTests(AuthenticatedTestCase):
+    user_fields = {'is_staff': True}
+
+    def setUp(self):
+        super().setUp()
+        Book.objects.create(isbn13='e1', isbn10='e1', title='Exported', authors='Ann', categories='Fiction')
+
+    def test_streams_csv_for_staff_only(self):
+        response = self.client.get('/api/export/books/csv/')
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:4], ['id', 'isbn13', 'isbn10', 'title'])
+        self.assertIn('Exported', lines[1])
+
+        reader = CustomUser.objects.create_user('reader2@example.com', '87770000008', 'Reader', password='x')
+        self.client.force_authenticate(reader)
+        self.assertEqual(self.client.get('/api/export/books/csv/').status_code, 403)
+
+    def test_xlsx_requires_lxml(self):
+        lxml = openpyxl.LXML
+        try:
+            openpyxl.LXML = False
+            self.assertEqual(self.client.get('/api/export/books/xlsx/').status_code, 501)
+
+            openpyxl.LXML = True
+            response = self.client.get('/api/export/books/xlsx/')
+            workbook = openpyxl.load_workbook(io.BytesIO(b''.join(response.streaming_content)), read_only=True)
+            rows = list(workbook.active.iter_rows(values_only=True))
+            workbook.close()
+            self.assertEqual((rows[0][:4], rows[1][3]), (('id', 'isbn13', 'isbn10', 'title'), 'Exported'))
+        finally:
+            openpyxl.LXML = lxml
+
+    def test_command_writes_jsonl(self):
+        output = io.StringIO()
+        call_command('export_data', 'categories', '--format', 'jsonl', stdout=output)
+        self.assertEqual(json.loads(output.getvalue().splitlines()[0])['name'], 'Fiction')
+
+
+class HealthViewTests(TestCase):
+    def test_reports_database(self):
+        response = self.client.get('/api/health/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'ok')
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'PRAGMA есть только в SQLite')
+class SqliteTuningTests(TransactionTestCase):
+    # synchronous нельзя менять внутри транзакции, а TestCase оборачивает тест в нее
+    def test_pragmas_applied_when_enabled(self):
+        with override_settings(SQLITE_TUNING=True):
+            tune_sqlite_connection(sender=None, connection=connection)
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute('PRAGMA busy_timeout = 0')
+
+    def test_benchmark_counts_only_lock_errors(self):
+        self.assertTrue(is_lock_error(OperationalError('database is locked')))
+        self.assertTrue(is_lock_error(OperationalError('database table is locked')))
+        self.assertFalse(is_lock_error(OperationalError('no such table: cores_book')))
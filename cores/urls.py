@@ -5,26 +5,34 @@ from rest_framework_simplejwt.views import (
     TokenRefreshView,
 )
 from cores.views import (
+    HealthView,
     RegisterView,
     LoginView,
     CategoriesView,
     LikedCategoriesView,
+    LikedCategoriesBatchView,
     RecommendationView,
     FavoriteBookView,
+    FavoriteBookBatchView,
     DiscussionListCreateAPIView,
     DiscussionDetailAPIView,
     BookListCreateView,
     BookRetrieveUpdateDestroyView,
+    BookBulkView,
     CommentDetailAPIView,
     CommentListCreateAPIView,
     BookSearchView,
+    BrowseView,
+    ExportView,
     AutoComplete,
     LikedAuthorsView,
+    LikedAuthorsBatchView,
     UserProfileView
 )
 
 
 urlpatterns = [
+    path('api/health/', HealthView.as_view(), name='health'),
     path('api/register/', RegisterView.as_view(), name='register'),
     path('api/user_profile/', UserProfileView.as_view(), name='user_profile'),
 
@@ -34,10 +42,13 @@ urlpatterns = [
     
     path('api/categories/', CategoriesView.as_view(), name="categories"),
     path("api/liked_categories/", LikedCategoriesView.as_view(), name="liked_categories"),
+    path("api/liked_categories/batch/", LikedCategoriesBatchView.as_view(), name="liked_categories_batch"),
     path('api/liked-authors/', LikedAuthorsView.as_view(), name='liked_authors'),
+    path('api/liked-authors/batch/', LikedAuthorsBatchView.as_view(), name='liked_authors_batch'),
     path('api/recommendations/', RecommendationView.as_view(), name='recommendations'),
 
     path('api/favorites/', FavoriteBookView.as_view(), name='favorites'),
+    path('api/favorites/batch/', FavoriteBookBatchView.as_view(), name='favorites_batch'),
 
     path('api/discussions/', DiscussionListCreateAPIView.as_view(), name='discussion_list_create'),
     path('api/discussions/<int:pk>/', DiscussionDetailAPIView.as_view(), name='discussion_detail'),
@@ -48,6 +59,9 @@ urlpatterns = [
 
     path('api/books/', BookListCreateView.as_view(), name='book_list_create'),
     path('api/books/search/', BookSearchView.as_view(), name='book_search'),
+    path('api/books/browse/', BrowseView.as_view(), name='book_browse'),
+    path('api/books/bulk/', BookBulkView.as_view(), name='book_bulk'),
+    path('api/export/<str:dataset>/<str:file_format>/', ExportView.as_view(), name='export'),
     path('api/books/<int:pk>/', BookRetrieveUpdateDestroyView.as_view(), name='book_detail'),
 
     path('api/auto_complete/', AutoComplete.as_view(), name="auto_complete")
@@ -1,34 +1,87 @@
-from rest_framework import generics
+from rest_framework import generics, serializers
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from django.http import HttpResponse, HttpRequest
+from django.http import HttpResponse, HttpRequest, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+import openpyxl
 from rest_framework import status
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
+from rest_framework.settings import api_settings
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
+from django.db import DatabaseError, connection
+from django.db.models import F, Prefetch, Q, Subquery
 from django.shortcuts import get_object_or_404
-from django.db.models import Q
+from . import batch, search
+from .autocomplete import autocomplete_index
+from .book_filters import InvalidQuery, filter_books, order_books, sparse_fields
+from .catalog_cache import (
+    book_bulk_key,
+    book_condition,
+    book_detail_key,
+    book_list_key,
+    browse_key,
+    catalog_condition,
+    categories_key,
+    get_or_build,
+)
+from .exporting import CONTENT_TYPES, DATASETS, FORMATS as EXPORT_FORMATS, stream_export
+from .facets import FACETS
+from .pagination import InvalidCursor, KeysetPagination, keyset_page, next_page_url, page_size_param
+from .recommendations import (
+    apply_explanations,
+    cache_recommendations,
+    explain_with_llm,
+    explanation_context,
+    llm_enabled,
+    recommend_for_user,
+    snapshot_query,
+    snapshot_recommendations
+)
 from .serializers import (
     RegisterSerializer,
     DiscussionSerializer,
     BookSerializer,
     CommentSerializer,
     UserProfileSerializer,
-    UserLikedAuthorsSerializer
+    UserLikedAuthorsSerializer,
+    AuthorNamesSerializer,
+    BookIdsSerializer,
+    CategoryNamesSerializer,
+    id_field,
+    refresh_book_counters
 )
 from .models import (
+    Author,
     Book,
+    Category,
     UserLikedCategories,
     UserProfile,
     CustomUser,
     UserFavoriteBook,
     Discussion,
     Comment, 
-    UserLikedAuthors
+    UserLikedAuthors,
+    BookFacet,
+    FacetValue
 )
 
-import requests
-import json
+
+
+class HealthView(APIView):
+    """
+    Проверка для docker и балансировщика: процесс отвечает и база доступна
+    """
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    def get(self, request: HttpRequest) -> HttpResponse:
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except DatabaseError:
+            return Response({"status": "unavailable"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response({"status": "ok", "database": connection.vendor})
 
 
 class RegisterView(APIView):
@@ -76,61 +129,63 @@ class LoginView(APIView):
 class UserProfileView(APIView):
     permission_classes = [IsAuthenticated]
 
+    default_limit = 20
+    max_limit = 100
+
+    def _int_param(self, request, name, default):
+        value = int(request.query_params.get(name, default))
+        if value < 0:
+            raise ValueError(name)
+        return value
+
+    def get_queryset(self, limit, offsets):
+        # Все вложенные списки грузятся фиксированным числом запросов, независимо от истории пользователя
+        favorites = UserFavoriteBook.objects.select_related('book').order_by('-added_at', '-id')
+        comments = Comment.objects.select_related('discussion').order_by('-created_at', '-id')
+        favorites_offset, comments_offset = offsets['favorite_books_offset'], offsets['comments_offset']
+
+        return UserProfile.objects.select_related('user').prefetch_related(
+            'liked_categories',
+            'liked_authors',
+            Prefetch(
+                'user__favorite_books',
+                queryset=favorites[favorites_offset:favorites_offset + limit + 1],
+                to_attr='profile_favorite_books',
+            ),
+            Prefetch(
+                'user__comment_set',
+                queryset=comments[comments_offset:comments_offset + limit + 1],
+                to_attr='profile_comments',
+            ),
+        )
+
+    # ?limit=20&favorite_books_offset=0&comments_offset=0
     def get(self, request):
-        user_profile = UserProfile.objects.get(user=request.user)
-        serializer = UserProfileSerializer(user_profile)
+        try:
+            limit = min(self._int_param(request, 'limit', self.default_limit), self.max_limit) or self.default_limit
+            offsets = {
+                name: self._int_param(request, name, 0) for name in ('favorite_books_offset', 'comments_offset')
+            }
+        except ValueError:
+            return Response({"error": "Invalid pagination parameters"}, status=status.HTTP_400_BAD_REQUEST)
+
+        user_profile = get_object_or_404(self.get_queryset(limit, offsets), user=request.user)
+        serializer = UserProfileSerializer(
+            user_profile, context={'request': request, 'limit': limit, 'offsets': offsets}
+        )
         
         return Response(serializer.data, status=status.HTTP_200_OK)
     
 
-class LikedAuthorsView(APIView):
-    permission_classes = [IsAuthenticated]
-
-    def get(self, request: HttpRequest) -> HttpResponse:
-        user_profile = get_object_or_404(UserProfile, user=request.user)
-        liked_authors = UserLikedAuthors.objects.filter(user=user_profile)
-        serializer = UserLikedAuthorsSerializer(liked_authors, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
-
-    def post(self, request: HttpRequest) -> HttpResponse:
-        user_profile = get_object_or_404(UserProfile, user=request.user)
-        author = request.data.get("author")
-
-        if not author:
-            return Response({"error": "Author is required"}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Проверка на существование автора в базе книг
-        books = Book.objects.exclude(authors__isnull=True).exclude(authors__exact='')
-        unique_authors = {auth.strip() for book in books for auth in book.authors.split(',')}
-
-        if author not in unique_authors:
-            return Response({"error": "Author not found"}, status=status.HTTP_404_NOT_FOUND)
-
-        liked_author, created = UserLikedAuthors.objects.get_or_create(
-            user=user_profile,
-            author=author
-        )
-
-        if created:
-            return Response({"message": "Author liked successfully"}, status=status.HTTP_201_CREATED)
-        else:
-            return Response({"message": "Author already liked"}, status=status.HTTP_200_OK)
-        
 class CategoriesView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @method_decorator(catalog_condition)
     def get(self, request) -> HttpResponse:
-        books = Book.objects.exclude(
-            categories__isnull=True).exclude(categories__exact='')
-        unique_categories = set()
-
-        for book in books:
-            categories_list = book.categories.split(',')
-
-            for category in categories_list:
-                unique_categories.add(category.strip())
-
-        return Response({"categories": unique_categories})
+        categories = get_or_build(
+            categories_key(), lambda: list(Category.objects.values_list('name', flat=True)), request=request
+        )
+        return Response({"categories": categories})
 
 
 class LikedCategoriesView(APIView):
@@ -152,20 +207,10 @@ class LikedCategoriesView(APIView):
 
         category = request.data.get("category")
 
-        books = Book.objects.exclude(
-            categories__isnull=True).exclude(categories__exact='')
-        unique_categories = set()
-
-        for book in books:
-            categories_list = book.categories.split(',')
-
-            for category_iter in categories_list:
-                unique_categories.add(category_iter.strip())
-
         if not category:
             return Response({"error": "Category is required"}, status=status.HTTP_400_BAD_REQUEST)
         
-        elif not category in unique_categories:
+        elif not Category.objects.filter(name=category).exists():
             return Response({"error": "Category is not found"}, status=status.HTTP_404_NOT_FOUND)
         
         liked_category, created = UserLikedCategories.objects.get_or_create(
@@ -195,17 +240,8 @@ class LikedAuthorsView(APIView):
         if not author:
             return Response({"error": "Author is required"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Проверка на существование автора в базе книг
-        books = Book.objects.exclude(authors__isnull=True).exclude(authors__exact='')
-        unique_authors = set()
-        for book in books:
-            authors_list = book.authors.split(';')
-
-            for author_iter in authors_list:
-                unique_authors.add(author_iter.strip())
-
-        
-        if author not in unique_authors:
+        # Проверка на существование автора в справочнике авторов
+        if not Author.objects.filter(name=author).exists():
             return Response({"error": "Author not found"}, status=status.HTTP_404_NOT_FOUND)
 
         liked_author, created = UserLikedAuthors.objects.get_or_create(
@@ -218,89 +254,137 @@ class LikedAuthorsView(APIView):
         else:
             return Response({"message": "Author already liked"}, status=status.HTTP_200_OK)
 
+class BatchView(APIView):
+    """
+    Основа пакетных изменений: список ключей из тела запроса проверяет serializer_class.
+    Проверка по каталогу, вставка и удаление выполняются в cores/batch.py одним запросом каждое
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = None
+    # Имя списка в теле запроса
+    key = None
+
+    def keys(self, request):
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        # Повторы отбрасываются, порядок сохраняется
+        return list(dict.fromkeys(serializer.validated_data[self.key]))
+
+    def post(self, request: HttpRequest) -> HttpResponse:
+        added, missing = self.add(request, self.keys(request))
+        return Response(
+            {"added": added, "missing": missing},
+            status=status.HTTP_201_CREATED if added else status.HTTP_200_OK,
+        )
+
+    def delete(self, request: HttpRequest) -> HttpResponse:
+        return Response({"removed": self.remove(request, self.keys(request))}, status=status.HTTP_200_OK)
+
+
+# book_ids : [1, 2, 3]
+class FavoriteBookBatchView(BatchView):
+    serializer_class = BookIdsSerializer
+    key = 'book_ids'
+
+    def add(self, request, book_ids):
+        return batch.add_favorites(request.user, book_ids)
+
+    def remove(self, request, book_ids):
+        return batch.remove_favorites(request.user, book_ids)
+
+
+# categories : ["Fiction", "History"]
+class LikedCategoriesBatchView(BatchView):
+    serializer_class = CategoryNamesSerializer
+    key = 'categories'
+
+    def add(self, request, names):
+        return batch.add_likes(get_object_or_404(UserProfile, user=request.user), 'category', names)
+
+    def remove(self, request, names):
+        return batch.remove_likes(get_object_or_404(UserProfile, user=request.user), 'category', names)
+
+
+# authors : ["J. K. Rowling", "Terry Pratchett"]
+class LikedAuthorsBatchView(BatchView):
+    serializer_class = AuthorNamesSerializer
+    key = 'authors'
+
+    def add(self, request, names):
+        return batch.add_likes(get_object_or_404(UserProfile, user=request.user), 'author', names)
+
+    def remove(self, request, names):
+        return batch.remove_likes(get_object_or_404(UserProfile, user=request.user), 'author', names)
+
+
 class RecommendationView(APIView):
     permission_classes = [IsAuthenticated]
+    max_limit = 50
 
+    # limit : 10
     def post(self, request) -> HttpResponse:
-        user_profile = get_object_or_404(UserProfile, user=request.user)
         user = request.user
-        favorite_books = UserFavoriteBook.objects.filter(user=user).all()[:60]
-        favorite_books_ids = [favorite_book.book.id for favorite_book in favorite_books]
-        favorite_books_list = [
-            {"id": book.book.id,
-             "title": book.book.title,
-             "subtitle": book.book.subtitle,
-             "authors": book.book.authors,
-             "categories": book.book.categories,
-             "thumbnail": book.book.thumbnail,
-             "description": book.book.description,
-             "published_year": book.book.published_year,
-             "average_rating": book.book.average_rating
-             } for book in favorite_books]
-        liked_categories = UserLikedCategories.objects.filter(
-            user=user_profile)
-        categories_list = [cat.category for cat in liked_categories]
-        books = Book.objects.filter(categories__in=categories_list).exclude(id__in=favorite_books_ids).order_by('?')[:60]
-        books_list = [
-            {"id": book.id,
-             "title": book.title,
-             "subtitle": book.subtitle,
-             "authors": book.authors,
-             "categories": book.categories,
-             "thumbnail": book.thumbnail,
-             "description": book.description,
-             "published_year": book.published_year,
-             "average_rating": book.average_rating
-             } for book in books]
-
-        messages = [
-            {"role": "system", "content": "Вы полезный ассистент, который рекомендует книги на основе любимых книг пользователя и списка доступных книг."},
-            {"role": "user", "content": f"Вот список любимых книг пользователя: {favorite_books_list}. На основе этих книг порекомендуйте 10 книг из этого списка: {books_list}. Объясните, почему каждая книга была выбрана, и верните результат в формате JSON с идентификатором книги и причиной для рекомендации. Поля JSON должны быть  id, comment. Ты должен вернуть только JSON без лишнего, только JSON без форматирования. Комментарии должны быть только на русском"}
-        ]
 
+        try:
+            limit = max(1, min(int(request.data.get("limit", 10)), self.max_limit))
+        except (TypeError, ValueError):
+            return Response({"error": "Invalid limit"}, status=status.HTTP_400_BAD_REQUEST)
 
-        openai_url = "https://api.openai.com/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer",
-            "Content-Type": "application/json"
-        }
-        
-        data = {
-            "model": "gpt-4o",
-            "messages": messages,
-            "max_tokens": 2000,
-            "temperature": 0.7,
-            "n": 1,
-        }
+        # Предрасчитанный снимок (precompute_recommendations) — один запрос по индексу
+        snapshot = snapshot_recommendations(snapshot_query(user.id).first(), limit)
+        if snapshot is not None:
+            return Response({"recommended_books": snapshot}, status=status.HTTP_200_OK)
 
-        response = requests.post(openai_url, headers=headers, json=data)
-        print(response.text)
+        user_profile = get_object_or_404(UserProfile, user=user)
+        result = recommend_for_user(user, user_profile, limit)
+        recommended_books = result["recommended_books"]
+        if result["cached"]:
+            return Response({"recommended_books": recommended_books}, status=status.HTTP_200_OK)
 
-        if response.status_code == 200:
-            gpt_response = response.json()['choices'][0]['message']['content']
-            gpt_response_json = json.loads(gpt_response)
+        # Объяснения от LLM — необязательный слой поверх локального ранжирования
+        if llm_enabled():
+            favorite_books_list, books_list = explanation_context(result["favorite_book_ids"], recommended_books)
+            apply_explanations(recommended_books, explain_with_llm(favorite_books_list, books_list))
+
+        cache_recommendations(user.id, result["fingerprint"], recommended_books)
+        return Response({"recommended_books": recommended_books}, status=status.HTTP_200_OK)
 
-            return Response({"recommended_books": gpt_response_json}, status=status.HTTP_200_OK)
-        else:
-            print(response.text)
-            return Response({"error": "Failed to get recommendations from GPT"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-    
 
 class FavoriteBookView(APIView):
     permission_classes = [IsAuthenticated]
 
+    default_page_size = 100
+    max_page_size = 500
+    ordering = ('-added_at', '-id')
+
+    # ?page_size=100&cursor=...
     def get(self, request):
-        user = request.user
-        favorite_books = UserFavoriteBook.objects.filter(user=user)
+        try:
+            page_size = page_size_param(request, self.default_page_size, self.max_page_size)
+        except ValueError:
+            return Response({"error": "Invalid page_size"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Один запрос с JOIN на книгу, только нужные колонки
+        favorites = UserFavoriteBook.objects.filter(user=request.user).values(
+            'id', 'book_id', 'added_at',
+            title=F('book__title'), authors=F('book__authors'), isbn13=F('book__isbn13'),
+        )
+        try:
+            rows, next_cursor = keyset_page(favorites, self.ordering, page_size, request.query_params.get('cursor'))
+        except InvalidCursor:
+            return Response({"error": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+
         books_data = [
             {
-                "title": fav.book.title,
-                "authors": fav.book.authors,
-                "isbn13": fav.book.isbn13,
+                "book_id": row["book_id"],
+                "title": row["title"],
+                "authors": row["authors"],
+                "isbn13": row["isbn13"],
+                "added_at": row["added_at"],
             }
-            for fav in favorite_books
+            for row in rows
         ]
-        return Response({"favorites": books_data}, status=status.HTTP_200_OK)
+        return Response({"favorites": books_data, "next": next_page_url(request, next_cursor)}, status=status.HTTP_200_OK)
 
     # book_id : 1
     def post(self, request):
@@ -339,11 +423,29 @@ class DiscussionListCreateAPIView(APIView):
         получить список обсуждений или создать обсуждение
     """
     permission_classes = [IsAuthenticated]
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
 
+    # ?book=1&page_size=10&cursor=...
     def get(self, request):
         discussions = Discussion.objects.all()
+        book_id = request.query_params.get('book')
+        if book_id is not None:
+            try:
+                discussions = discussions.filter(book_id=id_field().run_validation(book_id))
+            except serializers.ValidationError:
+                return Response({"error": "Invalid book"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            page_size = page_size_param(request, api_settings.PAGE_SIZE, self.max_page_size)
+            discussions, next_cursor = keyset_page(discussions, self.ordering, page_size, request.query_params.get('cursor'))
+        except InvalidCursor:
+            return Response({"error": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError:
+            return Response({"error": "Invalid page_size"}, status=status.HTTP_400_BAD_REQUEST)
+
         serializer = DiscussionSerializer(discussions, many=True)
-        return Response(serializer.data)
+        return Response({"next": next_page_url(request, next_cursor), "results": serializer.data})
 
     def post(self, request):
         serializer = DiscussionSerializer(data=request.data)
@@ -391,16 +493,26 @@ class CommentListCreateAPIView(APIView):
     список комментариев к обсуждению или создать ыкомментарий
     """
     permission_classes = [IsAuthenticated]
+    max_page_size = 100
+    ordering = ('created_at', 'id')
 
+    # ?page_size=10&cursor=...
     def get(self, request, discussion_pk):
-        try:
-            discussion = Discussion.objects.get(pk=discussion_pk)
-        except Discussion.DoesNotExist:
+        if not Discussion.objects.filter(pk=discussion_pk).exists():
             return Response(status=status.HTTP_404_NOT_FOUND)
 
-        comments = discussion.comments.all()
+        # author нужен сериализатору (author.email), берем его тем же запросом
+        comments = Comment.objects.filter(discussion_id=discussion_pk).select_related('author')
+        try:
+            page_size = page_size_param(request, api_settings.PAGE_SIZE, self.max_page_size)
+            comments, next_cursor = keyset_page(comments, self.ordering, page_size, request.query_params.get('cursor'))
+        except InvalidCursor:
+            return Response({"error": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError:
+            return Response({"error": "Invalid page_size"}, status=status.HTTP_400_BAD_REQUEST)
+
         serializer = CommentSerializer(comments, many=True)
-        return Response(serializer.data)
+        return Response({"next": next_page_url(request, next_cursor), "results": serializer.data})
 
     def post(self, request, discussion_pk):
         try:
@@ -452,30 +564,252 @@ class CommentDetailAPIView(APIView):
     
 # ---------------------------------------------------------------
 # список книг и создание новых зкниг
+@method_decorator(book_condition, name='get')
 class BookListCreateView(generics.ListCreateAPIView):
+    """
+    Список книг с фильтрами (?year_min=&year_max=&min_rating=&category=&author=),
+    сортировкой (?ordering=, см. book_filters.ORDERINGS) и выбором полей (?fields=title,authors):
+    в SQL читаются только запрошенные колонки. ?pagination=keyset&count=false — страницы по курсору без COUNT(*)
+    """
     permission_classes = [IsAuthenticated]
     queryset = Book.objects.all()
     serializer_class = BookSerializer
 
+    @property
+    def paginator(self):
+        # ?pagination=keyset — курсор вместо номеров страниц (обход всего каталога, например индексатором)
+        if not hasattr(self, '_paginator') and self.request.query_params.get('pagination') == 'keyset':
+            self._paginator = KeysetPagination()
+        return super().paginator
+
+    def get_queryset(self):
+        params = self.request.query_params
+        queryset, ordering = order_books(filter_books(super().get_queryset(), params), params)
+        fields = self.requested_fields()
+        if fields is not None:
+            # Поля сортировки тоже читаются: из последней строки страницы строится курсор
+            sort_fields = [field.lstrip('-') for field in ordering if field.lstrip('-') != 'title_lower']
+            queryset = queryset.only(*fields, *sort_fields)
+        return queryset
+
+    def requested_fields(self):
+        if self.request.method != 'GET':
+            return None
+        return sparse_fields(self.request.query_params, BookSerializer.Meta.fields)
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.requested_fields())
+        return super().get_serializer(*args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        # Страница целиком (со ссылками next/previous) кэшируется по полному URL запроса
+        def build():
+            return super(BookListCreateView, self).list(request, *args, **kwargs).data
+
+        try:
+            data = get_or_build(
+                book_list_key(request.build_absolute_uri()), build, lambda data: refresh_book_counters(data['results']),
+                request=request,
+            )
+        except InvalidQuery as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(data)
+
 # ---------------------------------------------------------------
 # получение, обновление, удаление
+@method_decorator(book_condition, name='get')
 class BookRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [IsAuthenticated]
     queryset = Book.objects.all()
     serializer_class = BookSerializer
 
+    def retrieve(self, request, *args, **kwargs):
+        def build():
+            return super(BookRetrieveUpdateDestroyView, self).retrieve(request, *args, **kwargs).data
+
+        data = get_or_build(
+            book_detail_key(kwargs[self.lookup_field]), build, lambda data: refresh_book_counters([data]), request=request
+        )
+        return Response(data)
+
+
+@method_decorator(book_condition, name='get')
+class BookBulkView(APIView):
+    """
+    Несколько книг одним запросом: ?ids=12,5,40 или ?isbns=9780002005883,0002261987 (ISBN-13 или ISBN-10).
+    Книги возвращаются в порядке ключей запроса, ненайденные ключи — в missing.
+    Поддерживает ?fields= как список книг
+    """
+    permission_classes = [IsAuthenticated]
+    max_keys = 100
+
+    def get(self, request: HttpRequest) -> HttpResponse:
+        ids, isbns = request.query_params.get('ids'), request.query_params.get('isbns')
+        if bool(ids) == bool(isbns):
+            return Response({"error": "Pass either ids or isbns"}, status=status.HTTP_400_BAD_REQUEST)
+
+        keys = [key.strip() for key in (ids or isbns).split(',') if key.strip()]
+        if ids:
+            field = id_field()
+            try:
+                keys = [field.run_validation(key) for key in keys]
+            except serializers.ValidationError:
+                return Response({"error": "Invalid ids"}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            keys = [key.replace('-', '') for key in keys]
+        # Повторы ключей отбрасываются, порядок сохраняется
+        keys = list(dict.fromkeys(keys))
+        if not 1 <= len(keys) <= self.max_keys:
+            return Response({"error": f"Pass from 1 to {self.max_keys} keys"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            fields = sparse_fields(request.query_params, BookSerializer.Meta.fields)
+        except InvalidQuery as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+        data = get_or_build(
+            book_bulk_key(request.build_absolute_uri()),
+            lambda: self.lookup(keys, bool(ids), fields),
+            lambda data: refresh_book_counters(data['results']),
+            request=request,
+        )
+        return Response(data)
+
+    def lookup(self, keys, by_id, fields):
+        # Один запрос по уникальным индексам: id__in или isbn13__in OR isbn10__in
+        books = Book.objects.all()
+        if fields is not None:
+            books = books.only(*fields, 'isbn13', 'isbn10')
+        if by_id:
+            found = {book.id: book for book in books.filter(id__in=keys)}
+        else:
+            found = {}
+            for book in books.filter(Q(isbn13__in=keys) | Q(isbn10__in=keys)):
+                found[book.isbn13] = found[book.isbn10] = book
+
+        serializer = BookSerializer([found[key] for key in keys if key in found], many=True, fields=fields)
+        return {"results": serializer.data, "missing": [key for key in keys if key not in found]}
+
+
+@method_decorator(catalog_condition, name='get')
+class BrowseView(APIView):
+    """
+    Просмотр каталога по фасетам: категория, автор, десятилетие (year), рейтинг (rating).
+    Фасеты предрасчитаны (cores/facets.py), каждый ответ — один индексный запрос
+    """
+    permission_classes = [IsAuthenticated]
+    max_page_size = 100
+
+    # ?facet=category — значения фасета с числом книг, популярные сначала
+    # ?facet=category&value=Fiction&page_size=10&cursor=... — число книг и страница их id
+    def get(self, request: HttpRequest) -> HttpResponse:
+        facet = request.query_params.get('facet')
+        if facet not in FACETS:
+            return Response({"error": f"facet must be one of: {', '.join(FACETS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            page_size = page_size_param(request, api_settings.PAGE_SIZE, self.max_page_size)
+        except ValueError:
+            return Response({"error": "Invalid page_size"}, status=status.HTTP_400_BAD_REQUEST)
+
+        value = request.query_params.get('value')
+        cursor = request.query_params.get('cursor')
+        try:
+            if value is None:
+                data = get_or_build(
+                    browse_key(request.build_absolute_uri()), lambda: self.facet_values(request, facet, page_size, cursor),
+                    request=request,
+                )
+            else:
+                data = get_or_build(
+                    browse_key(request.build_absolute_uri()),
+                    lambda: self.facet_books(request, facet, value, page_size, cursor),
+                    request=request,
+                )
+        except InvalidCursor:
+            return Response({"error": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(data)
+
+    def facet_values(self, request, facet, page_size, cursor):
+        values = FacetValue.objects.filter(facet=facet).values('value', 'count')
+        rows, next_cursor = keyset_page(values, ('-count', 'value'), page_size, cursor)
+        return {"facet": facet, "next": next_page_url(request, next_cursor), "results": rows}
+
+    def facet_books(self, request, facet, value, page_size, cursor):
+        # Общее число книг приходит подзапросом к FacetValue вместе со страницей id
+        count = FacetValue.objects.filter(facet=facet, value=value).values('count')[:1]
+        books = BookFacet.objects.filter(facet=facet, value=value).values('book_id').annotate(total=Subquery(count))
+        rows, next_cursor = keyset_page(books, ('book_id',), page_size, cursor)
+
+        if rows:
+            total = rows[0]['total']
+        else:
+            total = FacetValue.objects.filter(facet=facet, value=value).values_list('count', flat=True).first() or 0
+        return {
+            "facet": facet,
+            "value": value,
+            "count": total,
+            "next": next_page_url(request, next_cursor),
+            "results": [row['book_id'] for row in rows],
+        }
+
 
 class BookSearchView(APIView):
     permission_classes = [IsAuthenticated]
 
+    max_page_size = 50
+
     def get(self, request: HttpRequest) -> HttpResponse:
         query = request.query_params.get('q', None)
         if query:
+            if request.query_params.get('mode') == 'fulltext':
+                return self.fulltext(request, query)
             books = Book.objects.filter(title__icontains=query)
             serializer = BookSerializer(books, many=True)
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response({"error": "Query parameter 'q' is required"}, status=status.HTTP_400_BAD_REQUEST)
 
+    # ?q=harry potter&mode=fulltext&page_size=20&cursor=...
+    def fulltext(self, request: HttpRequest, query: str) -> HttpResponse:
+        if not search.fulltext_available():
+            return Response({"error": "Full-text search is not available"}, status=status.HTTP_501_NOT_IMPLEMENTED)
+
+        try:
+            page_size = page_size_param(request, api_settings.PAGE_SIZE, self.max_page_size)
+        except ValueError:
+            return Response({"error": "Invalid page_size"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            rows, next_cursor = search.search_books(query, page_size, request.query_params.get('cursor'))
+        except InvalidCursor:
+            return Response({"error": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+
+        books = Book.objects.in_bulk([book_id for book_id, _ in rows])
+        serializer = BookSerializer([books[book_id] for book_id, _ in rows if book_id in books], many=True)
+        return Response(
+            {"next": next_page_url(request, next_cursor), "results": serializer.data}, status=status.HTTP_200_OK
+        )
+
+
+class ExportView(APIView):
+    """
+    Потоковая выгрузка для сотрудников: /api/export/books/csv/ (также categories, favorites,
+    discussions и форматы jsonl, xlsx). Строки читаются из базы пачками и сразу уходят клиенту
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request: HttpRequest, dataset: str, file_format: str) -> HttpResponse:
+        if dataset not in DATASETS or file_format not in EXPORT_FORMATS:
+            return Response({"error": "Unknown dataset or format"}, status=status.HTTP_404_NOT_FOUND)
+        if file_format == 'xlsx' and not openpyxl.LXML:
+            # Без lxml openpyxl собирает XML листа в памяти целиком, на большой выгрузке это весь набор данных
+            return Response(
+                {"error": "XLSX export requires lxml, use csv or jsonl"}, status=status.HTTP_501_NOT_IMPLEMENTED
+            )
+
+        response = StreamingHttpResponse(stream_export(dataset, file_format), content_type=CONTENT_TYPES[file_format])
+        response['Content-Disposition'] = f'attachment; filename="{dataset}.{file_format}"'
+        return response
+
 
 class AutoComplete(APIView):
 
@@ -503,36 +837,13 @@ class AutoComplete(APIView):
         return Response(results, status=status.HTTP_200_OK)
 
     def search_author(self, query):
-        # Извлекаем всех авторов и разбиваем их по разделителю ';', затем фильтруем
-        all_authors = Book.objects.values_list('authors', flat=True)
-        unique_authors = set()
-
-        for authors in all_authors:
-            # Разделяем строку на отдельных авторов (предполагаем, что они разделены точкой с запятой)
-            author_list = authors.split(';')
-            for author in author_list:
-                if query.lower() in author.strip().lower():  # Фильтруем по введенному запросу
-                    unique_authors.add(author.strip())  # Добавляем уникальные имена авторов
-
-        # Возвращаем не более 10 уникальных авторов
-        return [{"name": author} for author in list(unique_authors)[:10]]
+        # Префиксный поиск по словам в имени автора, по убыванию популярности
+        return autocomplete_index.search_authors(query)
 
     def search_book(self, query):
-        # Ищем книги по названию или подзаголовку, возвращаем не более 10 результатов
-        books = Book.objects.filter(Q(title__icontains=query) | Q(subtitle__icontains=query)).values("id", "title", "subtitle")[:10]
-        return list(books)
+        # Префиксный поиск по словам в названии и подзаголовке, по убыванию ratings_count
+        return autocomplete_index.search_books(query)
 
     def search_category(self, query):
-        # Извлекаем уникальные категории, разделяя строки в поле categories
-        all_categories = Book.objects.values_list('categories', flat=True)
-        unique_categories = set()
-
-        for categories in all_categories:
-            # Разделяем строку на отдельные категории (предполагаем, что они разделены запятой)
-            category_list = categories.split(',')
-            for category in category_list:
-                if query.lower() in category.strip().lower():  # Фильтруем по введенному запросу
-                    unique_categories.add(category.strip())  # Добавляем категорию в сет (чтобы избежать дубликатов)
-
-        # Возвращаем не более 10 уникальных категорий
-        return [{"name": category} for category in list(unique_categories)[:10]]
+        # Префиксный поиск по словам в названии категории, по убыванию популярности
+        return autocomplete_index.search_categories(query)
@@ -72,12 +72,61 @@ WSGI_APPLICATION = 'library_hack.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# По умолчанию SQLite. DB_ENGINE=postgresql включает PostgreSQL (параметры — из POSTGRES_*):
+# SQLite блокирует файл на время записи, и записи из нескольких воркеров gunicorn идут по очереди
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgresql':
+    # DB_POOL=1 — пул соединений psycopg (нужен psycopg[pool]), иначе постоянные соединения
+    # на DB_CONN_MAX_AGE секунд. Django не разрешает сочетать пул с CONN_MAX_AGE > 0
+    DB_POOL = os.environ.get('DB_POOL', '0') == '1'
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'library'),
+            'USER': os.environ.get('POSTGRES_USER', 'library'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': 0 if DB_POOL else int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+            # Перед повторным использованием соединение проверяется, разорванное открывается заново
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': 5,
+            },
+        }
+    }
+    if DB_POOL:
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '10')),
+            'timeout': 10,
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
     }
+
+# SQLITE_TUNING=1 — настройки для установки на одном сервере: WAL (читатели не ждут писателя),
+# synchronous=NORMAL (в режиме WAL не теряет целостность при сбое процесса), mmap и кэш страниц,
+# ожидание блокировки вместо немедленной ошибки. Применяются к каждому новому соединению
+# (cores/signals.py), сравнение режимов — команда benchmark_sqlite
+SQLITE_TUNING = os.environ.get('SQLITE_TUNING', '0') == '1'
+SQLITE_TUNING_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    # Отрицательное значение — в килобайтах
+    'cache_size': -64 * 1024,
+    'busy_timeout': 5000,
 }
+if SQLITE_TUNING and DB_ENGINE != 'postgresql':
+    # Транзакция сразу берет блокировку записи: иначе в WAL две транзакции, начавшие с чтения,
+    # получают "database is locked" при попытке записи, не дожидаясь busy_timeout
+    DATABASES['default']['OPTIONS'] = {'transaction_mode': 'IMMEDIATE'}
 
 
 # Password validation
@@ -99,6 +148,15 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Пагинация списков DRF по умолчанию: page — номера страниц (COUNT(*) и OFFSET),
+# keyset — курсор по индексу (cores.pagination.KeysetPagination), стоимость страницы не зависит от глубины.
+# Отдельные представления могут выбрать класс сами (pagination_class)
+API_PAGINATION_CLASSES = {
+    'page': 'rest_framework.pagination.PageNumberPagination',
+    'keyset': 'cores.pagination.KeysetPagination',
+}
+API_PAGINATION = os.environ.get('API_PAGINATION', 'page')
+
 # Django REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -111,11 +169,75 @@ REST_FRAMEWORK = {
     ],
 
 
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': API_PAGINATION_CLASSES[API_PAGINATION],
     'PAGE_SIZE': 10,
 }
 
 
+# Индекс автодополнения хранится в памяти процесса и полностью
+# перестраивается не реже, чем раз в указанное число секунд (None — никогда)
+AUTOCOMPLETE_INDEX_TTL = 300
+
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Готовые рекомендации по пользователям: хранятся до TIMEOUT секунд,
+    # при переполнении вытесняются давно не использованные записи
+    'recommendations': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'recommendations',
+        'TIMEOUT': 900,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+
+# Кэш каталога (сериализованные книги и страницы списка). По умолчанию в памяти процесса;
+# версия каталога хранится в базе (CatalogState), поэтому изменения из других процессов
+# (gunicorn, import_books) видны сразу. Общий кэш (file или redis) лишь экономит память и сборку данных
+CATALOG_CACHE_BACKEND = os.environ.get('CATALOG_CACHE_BACKEND', 'locmem')
+CATALOG_CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+CATALOG_CACHE_LOCATIONS = {
+    'locmem': 'catalog',
+    'file': str(BASE_DIR / 'cache' / 'catalog'),
+    'redis': 'redis://127.0.0.1:6379/1',
+}
+CACHES['catalog'] = {
+    'BACKEND': CATALOG_CACHE_BACKENDS[CATALOG_CACHE_BACKEND],
+    'LOCATION': os.environ.get('CATALOG_CACHE_LOCATION', CATALOG_CACHE_LOCATIONS[CATALOG_CACHE_BACKEND]),
+    'TIMEOUT': 300,
+    'OPTIONS': {
+        'MAX_ENTRIES': 20000,
+    },
+}
+if CATALOG_CACHE_BACKEND == 'redis':
+    # У RedisCache нет MAX_ENTRIES, вытеснением управляет сам сервер
+    CACHES['catalog']['OPTIONS'] = {}
+
+
+# Рекомендации ранжируются локально; модель перестраивается не реже, чем раз в указанное число секунд
+RECOMMENDATION_MODEL_TTL = 600
+
+# Необязательные объяснения рекомендаций через LLM (включаются, если задан ключ)
+OPENAI_URL = 'https://api.openai.com/v1/chat/completions'
+OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY', '')
+OPENAI_MODEL = os.environ.get('OPENAI_MODEL', 'gpt-4o')
+# Таймаут одной попытки и общее время запроса со всеми повторами, в секундах
+OPENAI_TIMEOUT = 20
+OPENAI_DEADLINE = 30
+OPENAI_MAX_RETRIES = 2
+# Сколько запросов к LLM процесс выполняет одновременно, остальные ждут свободного слота
+OPENAI_MAX_CONCURRENCY = 8
+
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=240),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),